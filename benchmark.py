@@ -0,0 +1,230 @@
+"""
+Offline benchmark of the generation pipeline.
+
+Runs the plan/write workflow, which every provider goes through, against the
+deterministic fake backend in fake_llm.py. Nothing goes over the network, so the
+numbers measure this project's own overhead (graph, scheduler, checkpointing,
+streaming) at a chosen provider speed:
+
+    python benchmark.py --steps 5 20 50 200 --concurrency 1 4 8
+    python benchmark.py --latency 0.2 --tokens-per-second 50 --output baseline.json
+    python benchmark.py --compare baseline.json
+
+With --compare the run exits with status 1 when a scenario's p95 latency or
+throughput is worse than the baseline by more than --tolerance.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "fake-model"
+INSTRUCTION = "Write a detailed report on the performance of long-form document generation."
+
+# The benchmark measures our overhead, so the scheduler must not throttle the fake backend
+UNLIMITED = {"rate": 1e6, "burst": 1e6, "concurrency": 1024}
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def build_app(args, steps, checkpoint_dir):
+    """Compile the real workflow around a fake chat model that plans `steps` sections."""
+    from fake_llm import FakeChatModel
+    from graph import create_workflow
+
+    llm = FakeChatModel(model_name=MODEL_NAME, latency=args.latency, tokens_per_second=args.tokens_per_second,
+                        output_tokens=args.output_tokens, plan_steps=steps)
+    if args.checkpointer == "memory":
+        from langgraph.checkpoint.memory import MemorySaver
+        checkpointer = MemorySaver()
+    elif args.checkpointer == "sqlite":
+        from graph import get_checkpointer
+        checkpointer = get_checkpointer(os.path.join(checkpoint_dir, f"checkpoints-{steps}.sqlite"))
+    else:
+        checkpointer = None
+    return create_workflow(llm, checkpointer=checkpointer)
+
+
+def workflow_run(app, args, steps):
+    """One generation through the workflow; returns (sections, streamed tokens)."""
+    from fake_llm import PROVIDER
+    from generation import stream_workflow
+
+    inputs = {
+        "initial_prompt": INSTRUCTION,
+        "num_steps": 0,
+        "llm_name": PROVIDER,
+        "model_name": MODEL_NAME,
+        "context_policy": args.policy,
+        "max_workers": args.workers,
+        "max_plan_steps": steps,
+        "planning_mode": args.planning_mode,
+    }
+    config = {"configurable": {"thread_id": uuid.uuid4().hex}, "recursion_limit": steps * (steps + 2) + 10}
+    tokens = []
+
+    def on_token(node, step, token):
+        if node == "writing_node":
+            tokens.append(len(token))
+
+    output = stream_workflow(app, inputs, on_token, config)
+    if not output.get("final_doc"):
+        raise RuntimeError(f"Workflow stopped without a document after {len(tokens)} tokens")
+    # A hierarchical run plans `steps` chapters of `steps` sections each
+    return steps * steps if args.planning_mode == "hierarchical" else steps, len(tokens)
+
+
+def measure(run, runs, concurrency, track_memory):
+    """Run `run` `runs` times on `concurrency` threads and summarise the timings."""
+    latencies = []
+    sections = tokens = 0
+
+    def timed():
+        start = time.perf_counter()
+        result = run()
+        latencies.append(time.perf_counter() - start)
+        return result
+
+    if track_memory:
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for done_sections, done_tokens in pool.map(lambda _: timed(), range(runs)):
+            sections += done_sections
+            tokens += done_tokens
+    wall = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if track_memory else None
+
+    return {
+        "runs": runs,
+        "wall_seconds": round(wall, 4),
+        "runs_per_second": round(runs / wall, 3),
+        "sections_per_second": round(sections / wall, 3),
+        "tokens_per_second": round(tokens / wall, 1),
+        "p50_seconds": round(percentile(latencies, 50), 4),
+        "p95_seconds": round(percentile(latencies, 95), 4),
+        "peak_memory_mb": round(peak / 2 ** 20, 2) if peak is not None else None,
+    }
+
+
+def run_benchmarks(args):
+    from fake_llm import PROVIDER
+    from metrics import metrics
+    from scheduler import scheduler
+
+    scheduler.limits[PROVIDER] = UNLIMITED
+    if not args.trace:
+        metrics.trace_path = None
+    if args.memory:
+        tracemalloc.start()
+
+    results = []
+    # Node banners are part of the measured work, but not of the report
+    sink = sys.stdout if args.verbose else open(os.devnull, "w")
+    with tempfile.TemporaryDirectory() as checkpoint_dir, contextlib.redirect_stdout(sink):
+        for steps in args.steps:
+            app = build_app(args, steps, checkpoint_dir)
+            for concurrency in args.concurrency:
+                stats = measure(lambda: workflow_run(app, args, steps), concurrency * args.repeat, concurrency,
+                                args.memory)
+                results.append({"scenario": f"workflow/{args.planning_mode}/{args.policy}", "steps": steps,
+                                "concurrency": concurrency, **stats})
+    if sink is not sys.stdout:
+        sink.close()
+    if args.memory:
+        tracemalloc.stop()
+    return results
+
+
+def print_table(results):
+    columns = ["scenario", "steps", "concurrency", "runs", "runs_per_second", "sections_per_second",
+               "tokens_per_second", "p50_seconds", "p95_seconds", "peak_memory_mb"]
+    rows = [[str(result[column]) for column in columns] for result in results]
+    widths = [max(len(column), *(len(row[i]) for row in rows)) for i, column in enumerate(columns)]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+def compare(results, baseline, tolerance):
+    """Return a description of every scenario that regressed against the baseline."""
+    previous = {(entry["scenario"], entry["steps"], entry["concurrency"]): entry for entry in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = previous.get((result["scenario"], result["steps"], result["concurrency"]))
+        if before is None:
+            continue
+        name = f"{result['scenario']} steps={result['steps']} concurrency={result['concurrency']}"
+        if result["p95_seconds"] > before["p95_seconds"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_seconds']}s -> {result['p95_seconds']}s")
+        if result["sections_per_second"] < before["sections_per_second"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {before['sections_per_second']} -> "
+                               f"{result['sections_per_second']} sections/s")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark AgentWrite offline against a fake LLM backend.")
+    parser.add_argument("--steps", type=int, nargs="+", default=[5, 20, 50, 200], help="plan lengths to run")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8],
+                        help="numbers of generations run at the same time")
+    parser.add_argument("--repeat", type=int, default=2, help="generations per concurrent slot")
+    parser.add_argument("--policy", default="full", help="context policy for the workflow runs")
+    parser.add_argument("--planning-mode", default="flat",
+                        help="'hierarchical' runs `steps` chapters of `steps` sections each; "
+                             "'pipelined' drafts while the plan streams")
+    parser.add_argument("--workers", type=int, default=1, help="max_workers for the 'neighbours' policy")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake time to first token, in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="fake streaming speed (0 = instant)")
+    parser.add_argument("--output-tokens", type=int, default=200, help="fake tokens per section")
+    parser.add_argument("--checkpointer", choices=["memory", "sqlite", "none"], default="sqlite",
+                        help="checkpointer used by the workflow (the app uses sqlite)")
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="skip tracemalloc peak memory (it slows the runs down)")
+    parser.add_argument("--trace", action="store_true", help="also write spans to the metrics trace file")
+    parser.add_argument("--output", "-o", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file from an earlier --output")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression against the baseline")
+    parser.add_argument("--verbose", action="store_true", help="show the node output of every run")
+    args = parser.parse_args(argv)
+
+    from logging_setup import setup_logging
+    setup_logging(logging.WARNING, path=None)
+
+    results = run_benchmarks(args)
+    print_table(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({"settings": {key: value for key, value in vars(args).items()
+                                    if key not in ("output", "compare")},
+                       "results": results}, file, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            logger.error(f"Regression: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
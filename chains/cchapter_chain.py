@@ -0,0 +1,16 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.output_parsers import StrOutputParser
+from chains.prompt_registry import prompt_registry
+
+
+def build_chapter_chain(llm):
+    """Create the chain that splits a book-length instruction into chapters."""
+    return prompt_registry.runnable("chapters") | llm | StrOutputParser()
+
+
+def build_section_chain(llm):
+    """Create the chain that expands one chapter into its paragraph plan."""
+    return prompt_registry.runnable("sections") | llm | StrOutputParser()
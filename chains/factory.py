@@ -0,0 +1,179 @@
+# chains/factory.py
+import logging
+import os
+import sys
+from functools import lru_cache
+from typing import Any, Iterator, List, Optional
+
+# Ensure the path is correct
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.caches import BaseCache
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessage, AIMessageChunk, message_chunk_to_message
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from llm_cache import get_langchain_cache
+from clients import OLLAMA_CLIENT_KWARGS, OLLAMA_HOST, get_groq_http_client, get_openai_http_client
+from router import ROUTER_ENABLED, get_router
+from scheduler import scheduler
+from chains.pplan_chain import build_plan_chain
+from chains.wwrite_chain import build_write_chain
+from chains.ssummary_chain import build_summary_chain
+from chains.cchapter_chain import build_chapter_chain, build_section_chain
+
+logger = logging.getLogger(__name__)
+
+PROVIDERS = ["GROQ", "OpenAI", "Ollama"]
+
+
+@lru_cache(maxsize=None)
+def get_llm(provider, model_name):
+    """
+    Build the chat model for a (provider, model) pair on first use.
+
+    Provider SDKs are imported here rather than at module import, so choosing a
+    provider never costs the startup time of the others. SDK retries are off
+    because every call already goes through the scheduler's retry policy.
+    """
+    if not model_name or not provider:
+        raise RuntimeError("Model or provider not selected or empty")
+
+    if provider == "GROQ":
+        from langchain_groq import ChatGroq
+        return ChatGroq(model=model_name, temperature=0, max_retries=0, cache=get_langchain_cache(),
+                        http_client=get_groq_http_client())
+    elif provider == "OpenAI":
+        from langchain_openai import ChatOpenAI
+        openai_api_key = os.getenv("OPENAI_API_KEY")
+        if not openai_api_key:
+            logger.error("OPENAI_API_KEY environment variable not set")
+            raise RuntimeError("OPENAI_API_KEY environment variable not set")
+        logger.info(f"Using OpenAI model {model_name}")
+        return ChatOpenAI(model=model_name, temperature=0, api_key=openai_api_key, max_retries=0, stream_usage=True,
+                          cache=get_langchain_cache(), http_client=get_openai_http_client())
+    elif provider == "Ollama":
+        from langchain_ollama import ChatOllama
+        return ChatOllama(model=model_name, temperature=0, base_url=OLLAMA_HOST, cache=get_langchain_cache(),
+                          client_kwargs=OLLAMA_CLIENT_KWARGS)
+    else:
+        raise RuntimeError(f"Unsupported provider: {provider}")
+
+
+class RoutedChatModel(BaseChatModel):
+    """
+    Chat model that streams through the router instead of one fixed provider.
+
+    The requested (provider, model) is tried first; a late first token sends a
+    hedged duplicate to a fallback model and an error fails over to one (see
+    router.ModelRouter). The winner's tokens are re-emitted as this model's own,
+    so graph streaming and metrics see a single call.
+
+    The routed models stream, which skips LangChain's cache, so this model looks
+    up the requested model's entries in `answer_cache` itself. A finished answer
+    is stored under the key of the model that gave it, which after a hedge or a
+    failover is not the requested one.
+    """
+
+    provider: str
+    model_name: str
+    # Used instead of LangChain's `cache`, which would store every answer under the requested model
+    answer_cache: Optional[BaseCache] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed-chat"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"provider": self.provider, "model_name": self.model_name}
+
+    def _get_ls_params(self, stop: Optional[List[str]] = None, **kwargs: Any) -> dict:
+        params = super()._get_ls_params(stop=stop, **kwargs)
+        params.update(ls_provider=self.provider, ls_model_name=self.model_name)
+        return params
+
+    def _get_llm_string(self, stop: Optional[List[str]] = None, **kwargs: Any) -> str:
+        # Look up the requested model's entries, so routed and direct calls share them
+        return get_llm(self.provider, self.model_name)._get_llm_string(stop=stop, **kwargs)
+
+    def _open_stream(self, messages, stop):
+        def open_stream(provider, model_name):
+            # Callbacks are cleared so only the winner's tokens reach the caller, through this model
+            llm = get_llm(provider, model_name)
+            config = {"callbacks": []}
+            if (provider, model_name) == (self.provider, self.model_name):
+                # The caller already holds this model's scheduler slot
+                return llm.stream(messages, config=config, stop=stop)
+            return scheduler.stream(provider, model_name, llm.stream, messages, config=config, stop=stop)
+        return open_stream
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        cache = self.answer_cache
+        prompt = dumps(messages)
+        cached = cache.lookup(prompt, self._get_llm_string(stop=stop, **kwargs)) if cache is not None else None
+        if cached:
+            chunks = [AIMessageChunk(content=cached[0].message.content)]
+        else:
+            answered_by = []
+            chunks = get_router().stream(self.provider, self.model_name, self._open_stream(messages, stop),
+                                         on_winner=lambda *lane: answered_by.extend(lane))
+
+        generation = None
+        for message in chunks:
+            chunk = ChatGenerationChunk(message=message)
+            if run_manager:
+                run_manager.on_llm_new_token(message.content, chunk=chunk)
+            generation = chunk if generation is None else generation + chunk
+            yield chunk
+
+        if cache is not None and not cached and generation is not None:
+            llm_string = get_llm(*answered_by)._get_llm_string(stop=stop, **kwargs)
+            cache.update(prompt, llm_string, [ChatGeneration(message=message_chunk_to_message(generation.message))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        # Adding the chunks up keeps the winner's token usage, which providers send with the last chunk
+        generation = None
+        for chunk in self._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            generation = chunk if generation is None else generation + chunk
+        message = message_chunk_to_message(generation.message) if generation else AIMessage(content="")
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+@lru_cache(maxsize=None)
+def get_routed_llm(provider, model_name):
+    """Chat model for (provider, model) with hedging and failover to other models."""
+    if not model_name or not provider:
+        raise RuntimeError("Model or provider not selected or empty")
+    return RoutedChatModel(provider=provider, model_name=model_name, cache=False, answer_cache=get_langchain_cache())
+
+
+def get_chat_model(provider, model_name):
+    """The chat model the workflow uses: routed (hedging and failover) unless AGENTWRITE_ROUTER=0."""
+    return get_routed_llm(provider, model_name) if ROUTER_ENABLED else get_llm(provider, model_name)
+
+
+@lru_cache(maxsize=None)
+def get_plan_chain(provider, model_name):
+    return build_plan_chain(get_llm(provider, model_name))
+
+
+@lru_cache(maxsize=None)
+def get_write_chain(provider, model_name):
+    return build_write_chain(get_llm(provider, model_name))
+
+
+@lru_cache(maxsize=None)
+def get_summary_chain(provider, model_name):
+    return build_summary_chain(get_llm(provider, model_name))
+
+
+@lru_cache(maxsize=None)
+def get_chapter_chain(provider, model_name):
+    return build_chapter_chain(get_llm(provider, model_name))
+
+
+@lru_cache(maxsize=None)
+def get_section_chain(provider, model_name):
+    return build_section_chain(get_llm(provider, model_name))
@@ -0,0 +1,123 @@
+# chains/prompt_registry.py
+import hashlib
+import logging
+import os
+import string
+import threading
+import time
+
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+
+logger = logging.getLogger(__name__)
+
+PROMPT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prompts')
+
+# The variables every prompt file must use, exactly
+PROMPT_VARIABLES = {
+    "plan": {"instructions"},
+    "write": {"instructions", "plan", "text", "STEP"},
+    "summary": {"summary", "paragraph", "max_words"},
+    "chapters": {"instructions"},
+    "sections": {"instructions", "chapters", "summary", "chapter"},
+    "image_story": {"num_words"},
+}
+
+# Prompt files are checked for changes at most this often (seconds)
+CHECK_INTERVAL = float(os.getenv("AGENTWRITE_PROMPT_CHECK_INTERVAL", 2.0))
+
+
+class PromptValidationError(ValueError):
+    """Raised when a prompt file does not use exactly the variables its callers pass."""
+
+
+def template_variables(text):
+    """The {variables} of an f-string style template; {{escaped}} braces are not variables."""
+    return {field.split('.')[0].split('[')[0] for _, field, _, _ in string.Formatter().parse(text) if field}
+
+
+class Prompt:
+    """One loaded, validated and compiled prompt file."""
+
+    def __init__(self, name, path, text, mtime):
+        self.name = name
+        self.path = path
+        self.text = text
+        self.mtime = mtime
+        self.version = hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]
+        self.variables = template_variables(text)
+        self.chat_template = ChatPromptTemplate([('user', text)])
+
+    def format(self, **values):
+        return self.text.format(**values)
+
+
+class PromptRegistry:
+    """
+    Process-wide registry of the prompt templates in chains/prompts.
+
+    Every template is read, validated against PROMPT_VARIABLES and compiled once.
+    A template is only reloaded when its file's mtime changes (checked at most
+    every `check_interval` seconds); a reload that fails validation is logged and
+    the previous version stays in use. Each version is identified by a short hash
+    of its text, for cache keys and traces.
+    """
+
+    def __init__(self, prompt_dir=PROMPT_DIR, variables=PROMPT_VARIABLES, check_interval=CHECK_INTERVAL):
+        self.prompt_dir = prompt_dir
+        self.variables = variables
+        self.check_interval = check_interval
+        self._prompts = {}
+        self._checked = {}
+        self._lock = threading.Lock()
+        for name in variables:
+            self._prompts[name] = self._load(name)
+            self._checked[name] = time.monotonic()
+
+    def _load(self, name):
+        path = os.path.join(self.prompt_dir, f"{name}.txt")
+        mtime = os.stat(path).st_mtime_ns
+        with open(path, 'r', encoding='utf-8') as file:
+            text = file.read()
+        prompt = Prompt(name, path, text, mtime)
+        expected = self.variables[name]
+        if prompt.variables != expected:
+            missing = ', '.join(sorted(expected - prompt.variables)) or 'none'
+            unknown = ', '.join(sorted(prompt.variables - expected)) or 'none'
+            raise PromptValidationError(f"{path}: missing variables: {missing}; unknown variables: {unknown}")
+        logger.info(f"Loaded prompt {name} version {prompt.version}")
+        return prompt
+
+    def get(self, name):
+        """Return the current Prompt, reloading it first if its file changed."""
+        prompt = self._prompts[name]
+        now = time.monotonic()
+        if now - self._checked[name] < self.check_interval:
+            return prompt
+        with self._lock:
+            self._checked[name] = now
+            try:
+                if os.stat(prompt.path).st_mtime_ns != prompt.mtime:
+                    self._prompts[name] = self._load(name)
+            except (OSError, PromptValidationError) as e:
+                logger.error(f"Keeping prompt {name} version {prompt.version}: {e}")
+            return self._prompts[name]
+
+    def text(self, name):
+        return self.get(name).text
+
+    def format(self, name, **values):
+        return self.get(name).format(**values)
+
+    def version(self, name):
+        return self.get(name).version
+
+    def versions(self):
+        return {name: self.get(name).version for name in self._prompts}
+
+    def runnable(self, name):
+        """A prompt step for chains that always formats with the current version of `name`."""
+        return RunnableLambda(lambda values: self.get(name).chat_template.invoke(values), name=f"{name}_prompt")
+
+
+prompt_registry = PromptRegistry()
@@ -0,0 +1,11 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.output_parsers import StrOutputParser
+from chains.prompt_registry import prompt_registry
+
+
+def build_summary_chain(llm):
+    """Create the summary chain, used to fold older paragraphs into a running summary."""
+    return prompt_registry.runnable("summary") | llm | StrOutputParser()
@@ -2,43 +2,34 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from shared import get_selected_model_name  # Import from shared
-from langchain_groq import ChatGroq
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate
+from chains.prompt_registry import prompt_registry
 
-# Get the selected model name
-model_name = get_selected_model_name()
 
-# Dynamically create an instance of the selected LLM
-LLM = ChatGroq(model=model_name, temperature=0)
+def build_write_chain(llm):
+    """Create the write chain around the given chat model."""
+    return prompt_registry.runnable("write") | llm | StrOutputParser()
 
-# Load the write prompt template
-with open(os.path.join(os.path.dirname(__file__), 'prompts', 'write.txt'), 'r') as file:
-    write_template = file.read()
 
-# Create a ChatPromptTemplate
-write_prompt = ChatPromptTemplate([
-    ('user', write_template)
-])
+if __name__ == "__main__":
+    from chains.factory import get_write_chain
 
-# Create the write chain
-write_chain = write_prompt | LLM | StrOutputParser()
+    # Test the write chain
+    test_instruction = "Write a 1500-word essay about the impact of artificial intelligence on modern society, covering its benefits, potential risks, and ethical considerations."
+    test_plan = "Paragraph 1 - Main Point: Introduction to AI and its growing influence - Word Count: 200 words"
+    test_text = "Artificial Intelligence (AI) has become an integral part of our modern society, revolutionizing various aspects of our daily lives and industries."
 
-# Test the write chain
-test_instruction = "Write a 1500-word essay about the impact of artificial intelligence on modern society, covering its benefits, potential risks, and ethical considerations."
-test_plan = "Paragraph 1 - Main Point: Introduction to AI and its growing influence - Word Count: 200 words"
-test_text = "Artificial Intelligence (AI) has become an integral part of our modern society, revolutionizing various aspects of our daily lives and industries."
+    provider = sys.argv[1] if len(sys.argv) > 1 else "GROQ"
+    model_name = sys.argv[2] if len(sys.argv) > 2 else "llama-3.1-70b-versatile"
 
-# Invoke the write_chain
-result = write_chain.invoke({
-    "instructions": test_instruction,
-    "plan": test_plan,
-    "text": test_text,
-    "STEP": "Paragraph 1"
-})
-
-# Print the result
-print("Generated Paragraph:")
-print(result)
+    # Invoke the write_chain
+    result = get_write_chain(provider, model_name).invoke({
+        "instructions": test_instruction,
+        "plan": test_plan,
+        "text": test_text,
+        "STEP": "Paragraph 1"
+    })
 
+    # Print the result
+    print("Generated Paragraph:")
+    print(result)
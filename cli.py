@@ -0,0 +1,213 @@
+"""
+Headless batch generation.
+
+Reads a JSONL file of jobs and runs them concurrently, without Streamlit:
+
+    python cli.py jobs.jsonl --workers 4 --output results.jsonl
+    python cli.py jobs.jsonl --workers 4 --out-dir outputs/
+
+Each job line is a JSON object with "instruction", "title", "provider", "model"
+and optionally "num_steps", "context_policy", "max_workers", "planning_mode" and "id".
+
+The images subcommand writes one story per image in a folder with an Ollama
+vision model:
+
+    python cli.py images photos/ --model llava --out-dir stories/ --in-flight 2
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+def read_jobs(path):
+    """Read jobs from a JSONL file, skipping blank lines."""
+    jobs = []
+    with open(path, 'r', encoding='utf-8') as file:
+        for line_no, line in enumerate(file, 1):
+            line = line.strip()
+            if not line:
+                continue
+            job = json.loads(line)
+            missing = [key for key in ("instruction", "provider", "model") if not job.get(key)]
+            if missing:
+                raise ValueError(f"{path}:{line_no}: job is missing {', '.join(missing)}")
+            job.setdefault("id", str(line_no))
+            job.setdefault("title", f"job-{job['id']}")
+            jobs.append(job)
+    return jobs
+
+
+def slugify(text):
+    return re.sub(r"[^A-Za-z0-9._-]+", "-", text).strip("-") or "untitled"
+
+
+def run_job(job, out_dir=None):
+    """
+    Run one job and return its result record; failures are recorded, not raised.
+
+    A hierarchical job's book is written to a markdown file (in out_dir, if given)
+    chapter by chapter, and the record only carries its path and opening.
+    """
+    from generation import generate_document
+
+    start = time.time()
+    record = {"id": job["id"], "title": job["title"], "provider": job["provider"], "model": job["model"]}
+    try:
+        result = generate_document(
+            job["instruction"],
+            job.get("num_steps", 0),
+            job["provider"],
+            job["model"],
+            job["title"],
+            context_policy=job.get("context_policy", "full"),
+            max_workers=job.get("max_workers", 1),
+            planning_mode=job.get("planning_mode", "flat"),
+            save_markdown=job.get("planning_mode") == "hierarchical",
+            out_dir=out_dir,
+        )
+        record.update(status="ok", word_count=result["word_count"], final_doc=result["final_doc"])
+        if result["path"]:
+            record["path"] = result["path"]
+    except Exception as e:
+        logger.error(f"Job {job['id']} failed: {e}")
+        record.update(status="error", error=str(e), word_count=0)
+    record["seconds"] = round(time.time() - start, 3)
+    return record
+
+
+class ResultWriter:
+    """Write results as they complete, to a JSONL file or one markdown file per job."""
+
+    def __init__(self, output=None, out_dir=None):
+        self.lock = threading.Lock()
+        self.out_dir = out_dir
+        self.file = None
+        self.owns_file = True
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+            # Per-job metadata still goes to a JSONL index next to the documents
+            self.file = open(os.path.join(out_dir, "results.jsonl"), "a", encoding="utf-8")
+        elif output and output != "-":
+            self.file = open(output, "a", encoding="utf-8")
+        else:
+            # The real stdout: the runs themselves are redirected to stderr (see main)
+            self.file = sys.stdout
+            self.owns_file = False
+
+    def write(self, record):
+        with self.lock:
+            if self.out_dir and record["status"] == "ok":
+                final_doc = record.pop("final_doc")
+                if "path" not in record:
+                    path = os.path.join(self.out_dir, f"{slugify(record['id'])}-{slugify(record['title'])}.md")
+                    with open(path, "w", encoding="utf-8") as doc:
+                        doc.write(final_doc)
+                    record["path"] = path
+            self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.file.flush()
+
+    def close(self):
+        if self.owns_file:
+            self.file.close()
+
+
+def images_main(argv):
+    """Batch image-to-story over a folder of images."""
+    parser = argparse.ArgumentParser(prog="cli.py images", description="Write one story per image in a folder.")
+    parser.add_argument("folder", help="folder of .jpg / .jpeg / .png images")
+    parser.add_argument("--model", required=True, help="Ollama vision model, e.g. llava")
+    parser.add_argument("--out-dir", default="generated_image_stories", help="where the markdown stories go")
+    parser.add_argument("--num-words", type=int, default=200, help="maximum number of words per story")
+    parser.add_argument("--in-flight", type=int, help="Ollama requests in flight at once")
+    parser.add_argument("--prep-workers", type=int, help="threads decoding and resizing images meanwhile")
+    parser.add_argument("--no-cache", action="store_true", help="do not read or write the response cache")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    load_dotenv()
+
+    from image_batch import MAX_IN_FLIGHT, PREP_WORKERS, batch_stories, folder_images, images_per_minute
+
+    if args.no_cache:
+        from llm_cache import response_cache
+        response_cache.enabled = False
+
+    images = folder_images(args.folder)
+    start = time.time()
+    done = failures = 0
+    results = sys.stdout
+    # Anything else printed while the stories are written goes to stderr, away from the records
+    with contextlib.redirect_stdout(sys.stderr):
+        for record in batch_stories(images, "Ollama", args.model, args.num_words, args.out_dir,
+                                    max_in_flight=args.in_flight or MAX_IN_FLIGHT,
+                                    prep_workers=args.prep_workers or PREP_WORKERS):
+            done += record["status"] == "ok"
+            failures += record["status"] != "ok"
+            logger.info(f"{record['image']} {record['status']} in {record['seconds']}s, "
+                        f"{record['word_count']} words "
+                        f"({images_per_minute(done, time.time() - start):.1f} images per minute)")
+            print(json.dumps(record, ensure_ascii=False), file=results, flush=True)
+
+    duration = time.time() - start
+    logger.info(f"Finished {len(images)} images in {duration:.2f}s, {failures} failed, "
+                f"{images_per_minute(done, duration):.1f} images per minute")
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "images":
+        return images_main(argv[1:])
+
+    parser = argparse.ArgumentParser(description="Run AgentWrite generation jobs from a JSONL file.")
+    parser.add_argument("jobs", help="JSONL file with one job per line")
+    parser.add_argument("--workers", type=int, default=4, help="number of jobs to run concurrently")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--output", "-o", default="-", help="results JSONL file (default: stdout)")
+    target.add_argument("--out-dir", help="write one markdown file per job into this directory")
+    parser.add_argument("--no-cache", action="store_true", help="do not read or write the response cache")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    load_dotenv()
+
+    if args.no_cache:
+        from llm_cache import response_cache
+        response_cache.enabled = False
+
+    jobs = read_jobs(args.jobs)
+    writer = ResultWriter(output=args.output, out_dir=args.out_dir)
+    start = time.time()
+    failures = 0
+    try:
+        # Node banners go to stderr, so they never end up in the results on stdout
+        with contextlib.redirect_stdout(sys.stderr), ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            futures = [pool.submit(run_job, job, args.out_dir) for job in jobs]
+            for future in as_completed(futures):
+                record = future.result()
+                failures += record["status"] != "ok"
+                logger.info(f"Job {record['id']} {record['status']} in {record['seconds']}s, "
+                            f"{record['word_count']} words")
+                writer.write(record)
+    finally:
+        writer.close()
+
+    logger.info(f"Finished {len(jobs)} jobs in {time.time() - start:.2f}s, {failures} failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+import logging
+import os
+from functools import lru_cache
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+
+# Connections are kept alive and shared by every session, page and graph node in
+# the process, so repeat calls skip the TCP and TLS handshakes
+POOL_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60.0)
+TIMEOUT = httpx.Timeout(600.0, connect=5.0)
+# langchain_ollama passes these on to the httpx client inside its ollama.Client
+OLLAMA_CLIENT_KWARGS = {"limits": POOL_LIMITS, "timeout": TIMEOUT}
+
+
+def normalize_host(host):
+    return (host or OLLAMA_HOST).rstrip('/')
+
+
+@lru_cache(maxsize=None)
+def get_http_client():
+    """Process-wide pooled HTTP client for plain requests (e.g. image downloads)."""
+    return httpx.Client(limits=POOL_LIMITS, timeout=TIMEOUT, follow_redirects=True)
+
+
+def new_async_http_client():
+    """Pooled async HTTP client; not shared, since it is bound to the event loop it runs on."""
+    return httpx.AsyncClient(limits=POOL_LIMITS, timeout=TIMEOUT, follow_redirects=True)
+
+
+@lru_cache(maxsize=None)
+def get_openai_client():
+    """Process-wide OpenAI client with a keep-alive connection pool."""
+    from openai import OpenAI
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"),
+                  http_client=httpx.Client(limits=POOL_LIMITS, timeout=TIMEOUT))
+
+
+@lru_cache(maxsize=None)
+def get_groq_http_client():
+    """Pooled HTTP client shared by every ChatGroq instance."""
+    return httpx.Client(limits=POOL_LIMITS, timeout=TIMEOUT)
+
+
+@lru_cache(maxsize=None)
+def get_openai_http_client():
+    """Pooled HTTP client shared by every ChatOpenAI instance."""
+    return httpx.Client(limits=POOL_LIMITS, timeout=TIMEOUT)
+
+
+@lru_cache(maxsize=None)
+def get_ollama_llm(model_name):
+    """Process-wide LangChain Ollama LLM with a keep-alive connection pool, used for image-to-story."""
+    from langchain_ollama import OllamaLLM
+    return OllamaLLM(model=model_name, base_url=normalize_host(OLLAMA_HOST), client_kwargs=OLLAMA_CLIENT_KWARGS)
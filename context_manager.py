@@ -0,0 +1,131 @@
+import logging
+import re
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional, fall back to a rough estimate
+    tiktoken = None
+
+
+class TokenCounter:
+    """Count tokens with tiktoken, or estimate them when tiktoken is not installed."""
+
+    def __init__(self, encoding_name="cl100k_base"):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.get_encoding(encoding_name)
+            except Exception as e:
+                logger.warning(f"Could not load tokenizer {encoding_name}: {e}")
+        if self.encoding is None:
+            logger.warning("tiktoken not available, token counts are estimated")
+
+    def count(self, text):
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        # Roughly one token per word piece or punctuation mark
+        return len(re.findall(r"\w+|[^\w\s]", text))
+
+
+@lru_cache(maxsize=None)
+def default_counter():
+    """Shared token counter, so the tokenizer is only loaded once per process."""
+    return TokenCounter()
+
+
+class RollingContext:
+    """
+    Bounded context window for drafting a long document paragraph by paragraph.
+
+    The last `keep_last` paragraphs are kept verbatim. Older paragraphs are folded
+    one at a time into a running summary, so the context sent with each step stays
+    within `token_budget` instead of growing with the whole document.
+
+    Args:
+        summarize (callable): summarize(summary, paragraph, max_words) -> new summary.
+        keep_last (int): Number of most recent paragraphs kept verbatim.
+        token_budget (int): Maximum tokens for the rendered context.
+        counter (TokenCounter): Tokenizer used to measure the budget.
+    """
+
+    def __init__(self, summarize, keep_last=2, token_budget=2000, counter=None):
+        self.summarize = summarize
+        self.keep_last = max(0, int(keep_last))
+        self.token_budget = max(1, int(token_budget))
+        self.counter = counter or default_counter()
+        self.summary = ""
+        self.recent = []
+        self.full_text_tokens = 0
+        self.stats = {
+            "full_text_tokens": 0,
+            "context_tokens": 0,
+            "summary_tokens": 0,
+            "tokens_saved": 0,
+        }
+
+    def _fold_oldest(self):
+        paragraph, tokens = self.recent.pop(0)
+        # Leave the summary about a third of the budget, in words
+        max_words = max(50, self.token_budget // 4)
+        prompt_tokens = self.counter.count(self.summary) + tokens
+        self.summary = self.summarize(self.summary, paragraph, max_words).strip()
+        # Summarisation is not free, so charge it against the savings
+        self.stats["summary_tokens"] += prompt_tokens + self.counter.count(self.summary)
+
+    def _recent_tokens(self):
+        return sum(tokens for _, tokens in self.recent)
+
+    def add(self, paragraph):
+        """Add a newly written paragraph and keep the window within its limits."""
+        tokens = self.counter.count(paragraph)
+        self.full_text_tokens += tokens
+        self.recent.append((paragraph, tokens))
+        while len(self.recent) > self.keep_last:
+            self._fold_oldest()
+        # Keep at least the newest paragraph, even if it alone exceeds the budget
+        while len(self.recent) > 1 and self.counter.count(self.summary) + self._recent_tokens() > self.token_budget:
+            self._fold_oldest()
+
+    def render(self):
+        """Return the context to send with the next step, and record its cost."""
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of the earlier text:\n\n{self.summary}")
+        if self.recent:
+            recent = '\n\n'.join(paragraph for paragraph, _ in self.recent)
+            parts.append(f"Most recent paragraphs:\n\n{recent}" if self.summary else recent)
+        context = '\n\n'.join(parts)
+        self.stats["full_text_tokens"] += self.full_text_tokens
+        self.stats["context_tokens"] += self.counter.count(context)
+        self.stats["tokens_saved"] = (self.stats["full_text_tokens"]
+                                      - self.stats["context_tokens"]
+                                      - self.stats["summary_tokens"])
+        return context
+
+    def to_dict(self):
+        """Serialisable snapshot of the window, so drafting can resume after a restart."""
+        return {
+            "summary": self.summary,
+            "recent": [list(item) for item in self.recent],
+            "full_text_tokens": self.full_text_tokens,
+            "stats": dict(self.stats),
+        }
+
+    @classmethod
+    def from_dict(cls, summarize, data, **kwargs):
+        """Rebuild a window from `to_dict` output (an empty dict starts a new one)."""
+        context = cls(summarize, **kwargs)
+        context.summary = data.get("summary", "")
+        context.recent = [tuple(item) for item in data.get("recent", [])]
+        context.full_text_tokens = data.get("full_text_tokens", 0)
+        context.stats.update(data.get("stats", {}))
+        return context
+
+    def report(self):
+        """Per-document prompt token usage compared with sending the full text."""
+        return dict(self.stats)
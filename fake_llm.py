@@ -0,0 +1,129 @@
+"""
+Deterministic, offline stand-in for the LLM backends, used by benchmark.py.
+
+FakeChatModel is a LangChain chat model that can be passed to
+graph.create_workflow, the path every provider takes. It never touches the
+network: every response is derived from a hash of the prompt, and its timing
+follows the configured latency and tokens per second.
+"""
+import hashlib
+import time
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+PROVIDER = "Fake"
+
+# The planning prompts spell out the expected line format with [placeholders]; the
+# write prompt only carries filled-in plan lines
+PLAN_MARKER = "Main Point: ["
+CHAPTER_MARKER = "Title: ["
+
+WORDS = (
+    "the report covers a long document with several sections that describe each step of the plan in detail "
+    "while the reader follows an argument built from evidence examples and a careful summary of results"
+).split()
+
+
+def fake_plan(steps, words_per_step=12):
+    """A plan in the format the planning prompt asks for."""
+    return "\n".join(
+        f"Paragraph {i} - Main Point: {' '.join(WORDS[(i + j) % len(WORDS)] for j in range(words_per_step))}"
+        f" - Word Count: 300 words"
+        for i in range(1, steps + 1)
+    )
+
+
+def fake_chapters(chapters, sections):
+    """A chapter outline in the format the chapter prompt asks for."""
+    return "\n".join(
+        f"Chapter {i} - Title: {WORDS[i % len(WORDS)].capitalize()} {WORDS[(i + 7) % len(WORDS)]}"
+        f" - Summary: {' '.join(WORDS[(i + j) % len(WORDS)] for j in range(20))} - Sections: {sections}"
+        for i in range(1, chapters + 1)
+    )
+
+
+def fake_tokens(prompt, output_tokens, plan_steps):
+    """
+    The token pieces of the deterministic answer to `prompt`.
+
+    Chapter outlines and section plans both have `plan_steps` lines, so a
+    hierarchical run drafts plan_steps * plan_steps sections.
+    """
+    if CHAPTER_MARKER in prompt:
+        return [line + "\n" for line in fake_chapters(plan_steps, plan_steps).split("\n")]
+    if PLAN_MARKER in prompt:
+        return [line + "\n" for line in fake_plan(plan_steps).split("\n")]
+    seed = int.from_bytes(hashlib.sha256(prompt.encode("utf-8")).digest()[:4], "big")
+    return [WORDS[(seed + i) % len(WORDS)] + " " for i in range(output_tokens)]
+
+
+def paced(tokens, latency=0.0, tokens_per_second=0.0):
+    """Yield tokens after `latency` seconds, then at `tokens_per_second` (0 = no delay)."""
+    if latency:
+        time.sleep(latency)
+    interval = 1.0 / tokens_per_second if tokens_per_second else 0.0
+    for token in tokens:
+        if interval:
+            time.sleep(interval)
+        yield token
+
+
+def _prompt_text(messages):
+    return "\n".join(str(message["content"] if isinstance(message, dict) else message.content) for message in messages)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    LangChain chat model with configurable latency, throughput and output length.
+
+    Planning prompts are answered with `plan_steps` plan lines (or chapters);
+    every other prompt gets `output_tokens` words.
+    """
+
+    model_name: str = "fake-model"
+    latency: float = 0.0
+    tokens_per_second: float = 0.0
+    output_tokens: int = 200
+    plan_steps: int = 5
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model_name": self.model_name, "output_tokens": self.output_tokens, "plan_steps": self.plan_steps}
+
+    def _get_ls_params(self, stop: Optional[List[str]] = None, **kwargs: Any) -> dict:
+        params = super()._get_ls_params(stop=stop, **kwargs)
+        params.update(ls_provider=PROVIDER, ls_model_name=self.model_name)
+        return params
+
+    def _tokens(self, messages):
+        return paced(fake_tokens(_prompt_text(messages), self.output_tokens, self.plan_steps),
+                     self.latency, self.tokens_per_second)
+
+    def _usage(self, messages, output_tokens):
+        """Token usage as providers report it, counting each word of the prompt as a token."""
+        input_tokens = len(_prompt_text(messages).split())
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        tokens = list(self._tokens(messages))
+        message = AIMessage(content="".join(tokens), usage_metadata=self._usage(messages, len(tokens)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        count = 0
+        for token in self._tokens(messages):
+            count += 1
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        # Like the OpenAI API, usage comes in a final chunk without content
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, count)))
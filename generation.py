@@ -0,0 +1,292 @@
+import logging
+import os
+import time
+import uuid
+
+from output_writer import DocumentWriter
+from graph import get_checkpointer, get_workflow
+from nodes.chapter_node import chapter_title
+from stream_accumulator import StreamAccumulator
+from metrics import metrics, run_context, get_callback_handler
+from chains.factory import PROVIDERS
+from chains.prompt_registry import prompt_registry
+
+logger = logging.getLogger(__name__)
+
+# Hierarchical runs take a superstep per section plus two per chapter
+RECURSION_LIMIT = 2000
+
+
+class UnknownProviderError(ValueError):
+    """Raised when a job names an LLM provider we have no code path for."""
+
+
+def stream_workflow(app, inputs, on_token=None, config=None, on_chapter=None, on_section=None):
+    """
+    Run the plan/write workflow and forward every LLM token as it is produced.
+
+    Args:
+        app: The compiled workflow from create_workflow.
+        inputs (dict): The initial graph state, or None to resume the checkpointed
+            run identified by config.
+        on_token (callable): Called as on_token(node, step, token) for each token.
+            step is the section being drafted, or None while planning. Tokens of
+            the summaries used as context are not forwarded.
+        config (dict): The run config, with the thread_id under "configurable".
+        on_chapter (callable): Called as on_chapter(index, total, chapter) when a
+            hierarchical run starts drafting a chapter.
+        on_section (callable): Called as on_section(index, text, heading) once per
+            finished section, in document order. heading is the chapter title for
+            the first section of a chapter, otherwise None.
+
+    Returns:
+        dict: The final graph state.
+    """
+    output = {}
+    if inputs is None and on_token:
+        # Replay what the interrupted run had already produced
+        saved = app.get_state(config).values
+        if saved.get('plan'):
+            on_token("planning_node", None, saved['plan'])
+        offset = saved.get('section_offset') or 0
+        for idx, section in enumerate(saved.get('write_steps') or []):
+            on_token("writing_node", offset + idx, section)
+    chapter_idx = None
+    sections_done = 0
+    for mode, payload in app.stream(inputs, config, stream_mode=["messages", "values"]):
+        if mode == "values":
+            output = payload
+            chapters = payload.get('chapters') or []
+            idx = payload.get('chapter_idx')
+            if on_section:
+                offset = payload.get('section_offset') or 0
+                for step, section in enumerate(payload.get('write_steps') or []):
+                    if offset + step >= sections_done:
+                        # The first section of each chapter goes to disk under the chapter's title
+                        opens_chapter = chapters and step == 0 and idx < len(chapters)
+                        heading = chapter_title(chapters[idx]) if opens_chapter else None
+                        on_section(offset + step, section, heading)
+                        sections_done = offset + step + 1
+            if on_chapter and idx is not None and idx != chapter_idx and idx < len(chapters):
+                chapter_idx = idx
+                on_chapter(idx, len(chapters), chapters[idx])
+            continue
+        message, metadata = payload
+        token = message.content
+        node = metadata.get("langgraph_node")
+        step = metadata.get("write_step")
+        if metadata.get("context_summary") or (node == "writing_node" and step is None):
+            continue
+        if step is not None:
+            # Sections drafted while the plan is still streaming belong to the document, not the plan
+            node = "writing_node"
+        if on_token and isinstance(token, str) and token:
+            on_token(node, step, token)
+    return output
+
+
+def generate_document(instruction, num_steps, llm_name, model_name, storytitle, context_policy="full",
+                      max_workers=1, on_token=None, context_keep_last=2, context_token_budget=2000,
+                      thread_id=None, save_markdown=True, planning_mode="flat", on_chapter=None, out_dir=None):
+    """
+    Generate a document for one writing instruction.
+
+    This is the UI-independent core behind the Streamlit app and the batch CLI.
+    Errors are raised to the caller. Every node run and LLM call is recorded by the
+    metrics layer under the run's thread_id. With save_markdown, sections are
+    written to a per-run markdown file in out_dir (default AGENTWRITE_OUTPUT_DIR)
+    as they are produced (see output_writer).
+
+    In the 'hierarchical' planning_mode the document is planned as chapters and
+    on_chapter(index, total, chapter) reports progress per chapter. The book is
+    only ever whole in the markdown file; final_doc is a preview of its opening.
+
+    Returns:
+        dict: final_doc, word_count, duration (seconds), context_stats, thread_id,
+        chapters, stream_stats (live throughput of the streamed text) and path
+        (the markdown file, or None).
+    """
+    thread_id = thread_id or uuid.uuid4().hex
+    start = time.monotonic()
+    status = "ok"
+    writer = DocumentWriter(f"{model_name}-{storytitle}", thread_id, out_dir=out_dir,
+                            metadata={"title": storytitle, "provider": llm_name, "model": model_name,
+                                      "instruction": instruction}) if save_markdown else None
+    with run_context(thread_id):
+        try:
+            return _generate_document(instruction, num_steps, llm_name, model_name, storytitle, context_policy,
+                                      max_workers, on_token, context_keep_last, context_token_budget,
+                                      thread_id, writer, planning_mode, on_chapter)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            # An unfinished document stays on disk as .part, for a resume to continue
+            if writer is not None:
+                writer.close()
+            metrics.span("generation", "generate_document", latency=time.monotonic() - start, status=status,
+                         provider=llm_name, model=model_name, prompt_versions=prompt_registry.versions())
+
+
+def _generate_document(instruction, num_steps, llm_name, model_name, storytitle, context_policy,
+                       max_workers, on_token, context_keep_last, context_token_budget, thread_id, writer,
+                       planning_mode, on_chapter):
+    start_time = time.time()  # Start timing here
+    logger.info(f"Starting writing generation with LLM: {llm_name}, Model: {model_name}")
+    accumulator = StreamAccumulator()
+
+    if llm_name not in PROVIDERS:
+        logger.error(f"Unknown LLM selected: {llm_name}")
+        raise UnknownProviderError(f"Unknown LLM selected: {llm_name}")
+    if llm_name == "OpenAI" and not os.getenv("OPENAI_API_KEY"):
+        logger.error("OPENAI_API_KEY environment variable not set")
+        raise RuntimeError("OPENAI_API_KEY environment variable not set")
+    logger.info(f"Using {llm_name} model {model_name}")
+
+    # Every provider runs the same plan/write workflow through its LangChain chat model;
+    # chains and the compiled workflow are built once per (provider, model)
+    app = get_workflow(llm_name, model_name)
+
+    inputs = {
+        "initial_prompt": instruction,
+        "num_steps": num_steps,
+        "llm_name": llm_name,
+        "model_name": model_name,
+        "storytitle": storytitle,
+        "context_policy": context_policy,
+        "max_workers": max_workers,
+        "context_keep_last": context_keep_last,
+        "context_token_budget": context_token_budget,
+        "planning_mode": planning_mode
+    }
+
+    # Every run is checkpointed under its thread_id; if that run stopped part way,
+    # continue from its last completed section instead of starting over
+    config = {"configurable": {"thread_id": thread_id}, "recursion_limit": RECURSION_LIMIT,
+              "callbacks": [get_callback_handler()]}
+    snapshot = app.get_state(config)
+    if snapshot.next:
+        logger.info(f"Resuming run {thread_id} at {snapshot.next}")
+        inputs = None
+    elif snapshot.values.get('final_doc') is not None:
+        logger.info(f"Run {thread_id} already finished")
+        inputs = None
+
+    def track_token(node, step, token):
+        # Live throughput stats cover the drafted sections, not the plan
+        if node == "writing_node":
+            accumulator.add(token)
+        if on_token:
+            on_token(node, step, token)
+
+    # Run the workflow, streaming plan and section tokens as they arrive
+    output = stream_workflow(app, inputs, track_token, config, on_chapter,
+                             writer.write_section if writer is not None else None)
+    if not output:
+        output = app.get_state(config).values
+
+    final_doc = output.get('final_doc') or ""
+    word_count = output.get('word_count', 0)
+    context_stats = output.get('context_stats') or {}
+    chapters = len(output.get('chapters') or [])
+    plan = '\n'.join(output['chapters']) if chapters else output.get('plan')
+    # Sections of flat documents stay addressable for regenerate_sections
+    sections = 0 if chapters else len(output.get('write_steps') or [])
+    if context_stats:
+        logger.info(f"Context stats: {context_stats}")
+
+    duration = time.time() - start_time
+    logger.info("Workflow created successfully")
+    logger.debug(f"llm_name: {llm_name}, model_name: {model_name}")
+
+    path = None
+    if writer is not None:
+        path = writer.commit(footer=f"Total word count: {word_count}", plan=plan, chapters=chapters,
+                             context_stats=context_stats)
+
+    return {
+        "final_doc": final_doc,
+        "word_count": word_count,
+        "duration": duration,
+        "context_stats": context_stats,
+        "thread_id": thread_id,
+        "chapters": chapters,
+        "sections": sections,
+        "stream_stats": accumulator.stats(),
+        "path": path,
+    }
+
+
+def regenerate_sections(thread_id, sections, storytitle, cascade=True, feedback=None, on_token=None,
+                        save_markdown=True):
+    """
+    Redraft some sections of a finished run and reuse the rest of its document.
+
+    The run's plan, sections and their dependencies are read from its checkpoint.
+    Only `sections` (0-based) and, with cascade, the sections drafted with their
+    text are sent to the model again; see nodes.writing_node.redraft_sections.
+    The checkpoint and the run's markdown file are updated in place.
+
+    Returns:
+        dict: Like generate_document, plus regenerated (the redrafted sections).
+    """
+    from chains.factory import get_chat_model
+    from chains.wwrite_chain import build_write_chain
+    from nodes.writing_node import redraft_sections
+
+    start = time.monotonic()
+    status = "ok"
+    config = {"configurable": {"thread_id": thread_id}}
+    with run_context(thread_id):
+        try:
+            checkpoint = get_checkpointer().get(config)
+            if checkpoint is None:
+                raise ValueError(f"No saved run {thread_id}")
+            state = checkpoint["channel_values"]
+            llm_name, model_name = state['llm_name'], state['model_name']
+            app = get_workflow(llm_name, model_name)
+            accumulator = StreamAccumulator()
+
+            def track_token(node, step, token):
+                accumulator.add(token)
+                if on_token:
+                    on_token(node, step, token)
+
+            update = redraft_sections(state, build_write_chain(get_chat_model(llm_name, model_name)), sections,
+                                      cascade=cascade, feedback=feedback, on_token=track_token)
+            regenerated = update.pop("regenerated")
+            logger.info(f"Regenerated sections {[idx + 1 for idx in regenerated]} of run {thread_id}")
+            # Recorded as the saving step, so the run stays finished and is not resumed
+            app.update_state(config, update, as_node="saving_node")
+
+            path = None
+            if save_markdown:
+                writer = DocumentWriter(f"{model_name}-{storytitle}", thread_id,
+                                        metadata={"title": storytitle, "provider": llm_name, "model": model_name,
+                                                  "instruction": state['initial_prompt']})
+                try:
+                    for idx, section in enumerate(update['write_steps']):
+                        writer.write_section(idx, section)
+                    path = writer.commit(footer=f"Total word count: {update['word_count']}", plan=state['plan'],
+                                         regenerated=regenerated)
+                finally:
+                    writer.close()
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            metrics.span("generation", "regenerate_sections", latency=time.monotonic() - start, status=status,
+                         sections=len(sections))
+
+    return {
+        "final_doc": update['final_doc'],
+        "word_count": update['word_count'],
+        "duration": time.monotonic() - start,
+        "context_stats": {},
+        "thread_id": thread_id,
+        "chapters": 0,
+        "sections": len(update['write_steps']),
+        "stream_stats": accumulator.stats(),
+        "path": path,
+        "regenerated": regenerated,
+    }
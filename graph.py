@@ -2,11 +2,38 @@ from langchain.schema import Document
 from langgraph.graph import StateGraph, END
 from typing_extensions import TypedDict
 from typing import List
+from functools import lru_cache, partial
+import os
+import sqlite3
 
 #from nodes.planning_node import planning_node (DON'T UNCOMMENT)
 #from nodes.writing_node import writing_node (DON'T UNCOMMENT)
 #from nodes.saving_node import saving_node (DON'T UNCOMMENT)
 
+# Context policies for drafting each plan step:
+#   full       - every step sees all previously written text (strictly sequential)
+#   neighbours - every step sees the plan plus its neighbouring plan steps only,
+#                so steps are independent and can be drafted concurrently
+#   rolling    - every step sees the last few paragraphs verbatim plus a running
+#                summary of the earlier ones, within a fixed token budget
+CONTEXT_POLICIES = ["full", "neighbours", "rolling"]
+
+# Planning modes:
+#   flat         - one plan of paragraph steps for the whole document
+#   hierarchical - the plan is a list of chapters; each chapter is expanded into
+#                  its own paragraph plan only when drafting reaches it, and
+#                  finished chapters are moved out of the state onto disk, so
+#                  memory and prompt size are bounded per chapter
+#   pipelined    - like flat, but the plan is streamed and each step is drafted
+#                  as soon as its line is complete, against the plan so far,
+#                  so planning and writing overlap
+PLANNING_MODES = ["flat", "hierarchical", "pipelined"]
+
+# Plans longer than this are rejected unless the run raises max_plan_steps
+MAX_PLAN_STEPS = 50
+
+DEFAULT_CHECKPOINT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "checkpoints.sqlite")
+
 
 class GraphState(TypedDict):
     """
@@ -16,31 +43,113 @@ class GraphState(TypedDict):
         initial_prompt: initial prompt
         plan: plan
         num_steps: number of steps
-        llm_name: name of the LLM
+        llm_name: name of the LLM provider
+        model_name: name of the model
+        final_doc: the finished document, set once every step is written (a preview of a hierarchical one)
+        write_steps: the sections written so far, one per plan step
+        section_deps: for each section, the earlier sections whose text it was drafted with
         word_count: word count of the final document
+        context_policy: how much context each plan step is drafted with
+        max_workers: how many plan steps may be drafted concurrently
+        context_keep_last: paragraphs kept verbatim by the rolling context
+        context_token_budget: token budget of the rolling context
+        context_stats: prompt tokens used and saved by the rolling context
+        context_state: the rolling context window, saved between steps
+        max_plan_steps: longest plan that will be drafted (default MAX_PLAN_STEPS)
+        planning_mode: 'flat', 'hierarchical' or 'pipelined'
+        chapters: the chapter outlines, in hierarchical mode
+        chapter_idx: index of the chapter being drafted
+        section_offset: number of sections in the chapters before this one
+        book_summary: running summary of the finished chapters
+        book_preview: the opening of the finished chapters, kept as final_doc's preview
+        book_word_count: word count of the finished chapters
     """
     initial_prompt : str
     plan : str
     num_steps : int
     final_doc : str
     write_steps : List[str]
+    section_deps : List[List[int]]
     word_count : int
     llm_name : str
+    model_name : str
+    context_policy : str
+    max_workers : int
+    context_keep_last : int
+    context_token_budget : int
+    context_stats : dict
+    context_state : dict
+    max_plan_steps : int
+    planning_mode : str
+    chapters : List[str]
+    chapter_idx : int
+    section_offset : int
+    book_summary : str
+    book_preview : str
+    book_word_count : int
 
 
 
-def create_workflow(llm):
-    from nodes.planning_node import planning_node
-    from nodes.writing_node import writing_node
+@lru_cache(maxsize=None)
+def get_checkpointer(path=None):
+    """
+    Return the process-wide SQLite checkpointer.
+
+    The workflow state is saved after every node, so a run that fails part way
+    through can be resumed from its last completed section with the same thread_id.
+    """
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    path = path or os.getenv("AGENTWRITE_CHECKPOINT_PATH", DEFAULT_CHECKPOINT_PATH)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    return SqliteSaver(sqlite3.connect(path, check_same_thread=False))
+
+
+def create_workflow(llm, checkpointer=None):
+    """Build the plan/write/save workflow with every chain bound to the given chat model."""
+    from nodes.planning_node import planning_node, route_plan
+    from nodes.writing_node import writing_node, should_continue
+    from nodes.chapter_node import expand_chapter_node, finish_chapter_node, next_chapter
     from nodes.saving_node import saving_node
+    from metrics import timed_node
+    from chains.pplan_chain import build_plan_chain
+    from chains.wwrite_chain import build_write_chain
+    from chains.ssummary_chain import build_summary_chain
+    from chains.cchapter_chain import build_chapter_chain, build_section_chain
+
+    plan_chain = build_plan_chain(llm)
+    write_chain = build_write_chain(llm)
+    summary_chain = build_summary_chain(llm)
+    chapter_chain = build_chapter_chain(llm)
+    section_chain = build_section_chain(llm)
 
     workflow = StateGraph(GraphState)
-    workflow.add_node("planning_node", planning_node)
-    workflow.add_node("writing_node", writing_node)
-    workflow.add_node("saving_node", saving_node)
+    # Every node run is timed and recorded by the metrics layer
+    workflow.add_node("planning_node", timed_node("planning_node", partial(planning_node, plan_chain=plan_chain,
+                                                                           chapter_chain=chapter_chain,
+                                                                           write_chain=write_chain,
+                                                                           summary_chain=summary_chain)))
+    workflow.add_node("expand_chapter_node", timed_node("expand_chapter_node",
+                                                        partial(expand_chapter_node, section_chain=section_chain)))
+    workflow.add_node("writing_node", timed_node("writing_node", partial(writing_node, write_chain=write_chain,
+                                                                         summary_chain=summary_chain)))
+    workflow.add_node("finish_chapter_node", timed_node("finish_chapter_node",
+                                                        partial(finish_chapter_node, summary_chain=summary_chain)))
+    workflow.add_node("saving_node", timed_node("saving_node", saving_node))
     workflow.set_entry_point("planning_node")
-    workflow.add_edge("planning_node", "writing_node")
-    workflow.add_edge("writing_node", "saving_node")
+    workflow.add_conditional_edges("planning_node", route_plan,
+                                   ["writing_node", "expand_chapter_node", "saving_node"])
+    workflow.add_edge("expand_chapter_node", "writing_node")
+    workflow.add_conditional_edges("writing_node", should_continue,
+                                   ["writing_node", "finish_chapter_node", "saving_node"])
+    workflow.add_conditional_edges("finish_chapter_node", next_chapter, ["expand_chapter_node", "saving_node"])
     workflow.add_edge("saving_node", END)
 
-    return workflow.compile()
+    return workflow.compile(checkpointer=checkpointer)
+
+
+@lru_cache(maxsize=None)
+def get_workflow(provider, model_name):
+    """Return the compiled workflow for a (provider, model) pair, building it on first use."""
+    from chains.factory import get_chat_model
+    return create_workflow(get_chat_model(provider, model_name), checkpointer=get_checkpointer())
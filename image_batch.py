@@ -0,0 +1,111 @@
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+
+from chains.prompt_registry import prompt_registry
+from clients import get_ollama_llm
+from image_preprocessing import image_cache, native_max_side
+from llm_cache import response_cache, make_key
+from model_catalog import get_catalog
+from scheduler import scheduler
+from stream_accumulator import count_words
+from tools import write_markdown_file
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+# Ollama requests in flight at once, and threads decoding / resizing the next images meanwhile
+MAX_IN_FLIGHT = int(os.getenv("AGENTWRITE_IMAGE_BATCH_IN_FLIGHT", 2))
+PREP_WORKERS = int(os.getenv("AGENTWRITE_IMAGE_BATCH_PREP_WORKERS", 4))
+
+
+def read_bytes(path):
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+def folder_images(folder):
+    """(name, load) pairs for the image files directly inside `folder`, sorted by name."""
+    paths = sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(os.path.join(folder, name))
+    )
+    return [(path, partial(read_bytes, path)) for path in paths]
+
+
+def story_name(name):
+    """Markdown file stem for the story of image `name`."""
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return re.sub(r"[^A-Za-z0-9._-]+", "-", stem).strip("-.") or "image"
+
+
+def story_for_image(provider, model, image, prompt_text):
+    """Write a story for a prepared image, reusing cached stories."""
+    cache_key = make_key(provider, model, prompt_text, image_hash=image.hash,
+                         params={"prompt_version": prompt_registry.version("image_story")})
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    bound = get_ollama_llm(model).bind(images=[image.base64])
+    result = scheduler.call(provider, model, bound.invoke, prompt_text)
+    response_cache.put(cache_key, result)
+    return result
+
+
+def batch_stories(images, provider, model, num_words, out_dir, max_in_flight=MAX_IN_FLIGHT,
+                  prep_workers=PREP_WORKERS):
+    """
+    Write one story per image and yield a result record as each one finishes.
+
+    `images` is a list of (name, load) pairs, where load() returns the raw image
+    bytes. Images are read, decoded and downscaled on a thread pool while at most
+    `max_in_flight` Ollama requests run; the pool is only `prep_workers` threads
+    larger than that, so at most that many prepared images wait for a request slot.
+    Each story is written to `out_dir` with `write_markdown_file`. Failures are
+    recorded, not raised. Records are yielded on the calling thread, so callers
+    can update a UI from them.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    prompt_text = prompt_registry.format("image_story", num_words=num_words)
+    max_side = native_max_side(get_catalog().get(model) or model)
+    in_flight = threading.Semaphore(max(1, max_in_flight))
+    # Names are fixed up front, so duplicates are numbered in input order
+    paths, used = [], set()
+    for name, _ in images:
+        stem = candidate = story_name(name)
+        n = 1
+        while candidate in used:
+            n += 1
+            candidate = f"{stem}-{n}"
+        used.add(candidate)
+        paths.append(os.path.join(out_dir, candidate))
+
+    def run_one(name, load, path):
+        start = time.time()
+        record = {"image": name, "provider": provider, "model": model}
+        try:
+            image = image_cache.prepare(load(), max_side)
+            with in_flight:
+                story = story_for_image(provider, model, image, prompt_text)
+            write_markdown_file(story, path)
+            record.update(status="ok", path=f"{path}.md", word_count=count_words(story),
+                          image_bytes=image.bytes, original_bytes=image.original_bytes)
+        except Exception as e:
+            logger.error(f"Story for {name} failed: {e}")
+            record.update(status="error", error=str(e), word_count=0)
+        record["seconds"] = round(time.time() - start, 3)
+        return record
+
+    with ThreadPoolExecutor(max_workers=max(1, max_in_flight) + max(1, prep_workers)) as pool:
+        futures = [pool.submit(run_one, name, load, path) for (name, load), path in zip(images, paths)]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def images_per_minute(done, seconds):
+    return done * 60 / seconds if seconds > 0 else 0.0
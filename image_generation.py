@@ -0,0 +1,110 @@
+import asyncio
+import base64
+import io
+import logging
+import os
+import re
+import time
+
+from PIL import Image
+
+from clients import get_openai_client, new_async_http_client
+from scheduler import scheduler
+
+logger = logging.getLogger(__name__)
+
+IMAGE_DIR = os.getenv("AGENTWRITE_IMAGE_DIR", "./generatedimages/")
+CHUNK_SIZE = 64 * 1024
+THUMBNAIL_SIZE = 256
+
+# Models that only return one image per request; n>1 becomes n concurrent requests
+SINGLE_IMAGE_MODELS = ("dall-e-3",)
+
+
+class GeneratedImage:
+    """One generated image on disk, with a small PNG thumbnail for the UI."""
+
+    def __init__(self, prompt, path, thumbnail, revised_prompt=None, seconds=0.0):
+        self.prompt = prompt
+        self.path = path
+        self.thumbnail = thumbnail
+        self.revised_prompt = revised_prompt
+        self.seconds = seconds
+
+
+def make_thumbnail(path, size=THUMBNAIL_SIZE):
+    with Image.open(path) as image:
+        image.thumbnail((size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def image_paths(name, count, image_dir=IMAGE_DIR):
+    """`count` distinct .png paths for `name`: name.png for one image, name-1.png ... otherwise."""
+    stem = re.sub(r"[^A-Za-z0-9._-]+", "-", name).strip("-.") or "image"
+    if count == 1:
+        return [os.path.join(image_dir, f"{stem}.png")]
+    return [os.path.join(image_dir, f"{stem}-{i}.png") for i in range(1, count + 1)]
+
+
+async def download(http, url, path):
+    """Stream `url` to `path` in chunks, through a .part file so a failed download leaves nothing behind."""
+    tmp_path = f"{path}.part"
+    try:
+        async with http.stream("GET", url) as response:
+            response.raise_for_status()
+            with open(tmp_path, "wb") as file:
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    file.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_b64(data, path):
+    tmp_path = f"{path}.part"
+    with open(tmp_path, "wb") as file:
+        file.write(base64.b64decode(data))
+    os.replace(tmp_path, path)
+
+
+async def generate_images(prompts, llm_name, model_name, name, n=1, size="1024x1024", response_format="b64_json",
+                          image_dir=IMAGE_DIR):
+    """
+    Generate `n` images for each prompt concurrently and save them to `image_dir`.
+
+    All requests go out at once, rate limited and retried by the scheduler, so a
+    batch takes about as long as its slowest image. With response_format="url"
+    each image is streamed to disk as soon as its request returns; "b64_json"
+    skips that second round trip. Returns the GeneratedImage list in prompt order.
+    """
+    os.makedirs(image_dir, exist_ok=True)
+    client = get_openai_client()
+    per_request = 1 if model_name in SINGLE_IMAGE_MODELS else n
+    calls = [(prompt, per_request) for prompt in prompts for _ in range(n // per_request)]
+    paths = iter(image_paths(name, len(prompts) * n, image_dir))
+    request_paths = [[next(paths) for _ in range(count)] for _, count in calls]
+    start = time.time()
+
+    async with new_async_http_client() as http:
+        async def run_one(prompt, count, paths):
+            response = await scheduler.acall(llm_name, model_name, client.images.generate, model=model_name,
+                                             prompt=prompt, size=size, n=count, response_format=response_format)
+            images = []
+            for data, path in zip(response.data, paths):
+                if response_format == "b64_json":
+                    await asyncio.to_thread(write_b64, data.b64_json, path)
+                else:
+                    await download(http, data.url, path)
+                thumbnail = await asyncio.to_thread(make_thumbnail, path)
+                images.append(GeneratedImage(prompt, path, thumbnail, getattr(data, "revised_prompt", None),
+                                             round(time.time() - start, 3)))
+                logger.info(f"Saved {path} after {time.time() - start:.2f}s")
+            return images
+
+        results = await asyncio.gather(*(run_one(prompt, count, paths)
+                                         for (prompt, count), paths in zip(calls, request_paths)))
+    return [image for images in results for image in images]
@@ -0,0 +1,119 @@
+import base64
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageOps
+
+from llm_cache import hash_bytes
+
+logger = logging.getLogger(__name__)
+
+# Longest side the vision encoder of each model family works at; larger images are
+# downscaled by the model anyway, so sending more pixels only costs upload and encode time
+NATIVE_SIZES = {
+    "llava": 672,
+    "clip": 672,
+    "bakllava": 672,
+    "moondream": 378,
+    "mllama": 1120,
+    "minicpm": 1344,
+}
+DEFAULT_MAX_SIDE = int(os.getenv("AGENTWRITE_IMAGE_MAX_SIDE", 1024))
+JPEG_QUALITY = int(os.getenv("AGENTWRITE_IMAGE_QUALITY", 85))
+
+
+def native_max_side(model):
+    """Longest image side for a model, from its name or catalog metadata."""
+    if isinstance(model, dict):
+        names = [model.get("family") or "", model.get("name") or ""]
+    else:
+        names = [model or ""]
+    for name in names:
+        for family, side in NATIVE_SIZES.items():
+            if family in name.lower():
+                return side
+    return DEFAULT_MAX_SIDE
+
+
+class PreparedImage:
+    """An image ready to send to a vision model, plus what preprocessing saved."""
+
+    def __init__(self, data, width, height, original_bytes):
+        self.data = data
+        self.base64 = base64.b64encode(data).decode()
+        self.hash = hash_bytes(data)
+        self.width = width
+        self.height = height
+        self.original_bytes = original_bytes
+
+    @property
+    def bytes(self):
+        return len(self.data)
+
+
+def preprocess_image(raw, max_side=DEFAULT_MAX_SIDE, quality=JPEG_QUALITY):
+    """
+    Downscale an image to `max_side`, drop its EXIF and other metadata and
+    recompress it as JPEG.
+
+    The EXIF orientation is applied to the pixels first, so the image the model sees
+    is upright. If the original is already small enough, carries no metadata and
+    is smaller than the recompressed version, it is sent unchanged.
+    """
+    with Image.open(io.BytesIO(raw)) as image:
+        image_format = image.format
+        has_metadata = bool(image.info.get("exif") or image.getexif())
+        image = ImageOps.exif_transpose(image)
+        resized = max(image.size) > max_side
+        if resized:
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+        if image.mode in ("RGBA", "LA", "P"):
+            # JPEG has no alpha channel, so flatten transparent images onto white
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1])
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+        data = buffer.getvalue()
+        width, height = image.size
+
+    if not resized and not has_metadata and image_format in ("JPEG", "PNG") and len(raw) <= len(data):
+        data = raw
+    return PreparedImage(data, width, height, len(raw))
+
+
+class ImageCache:
+    """
+    Small in-process LRU of prepared images, keyed by the hash of the uploaded bytes
+    and the target size, so a rerun or a second Generate never decodes, resizes or
+    base64-encodes the same upload again.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def prepare(self, raw, max_side=DEFAULT_MAX_SIDE, quality=JPEG_QUALITY):
+        key = (hash_bytes(raw), max_side, quality)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        prepared = preprocess_image(raw, max_side, quality)
+        logger.info(f"Prepared image {prepared.width}x{prepared.height}: "
+                    f"{prepared.original_bytes} -> {prepared.bytes} bytes")
+        with self._lock:
+            self._entries[key] = prepared
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return prepared
+
+
+image_cache = ImageCache()
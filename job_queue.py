@@ -0,0 +1,258 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict
+from functools import lru_cache
+
+from stream_accumulator import StreamAccumulator
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOBS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "jobs.sqlite")
+
+FINISHED = ("done", "error", "cancelled")
+
+
+class QueueFullError(RuntimeError):
+    """Raised when a user already has as many jobs waiting as they are allowed."""
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once it has been cancelled."""
+
+
+class JobProgress:
+    """
+    Live output of a running job: the plan, the sections drafted so far and the
+    current chapter, fed by the generation's on_token / on_chapter callbacks.
+    Checking the cancel flag on every token is what stops a running job.
+    """
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self.plan = []
+        self.sections = {}
+        self.chapter = None
+        self.updated = time.monotonic()
+
+    def on_token(self, node, step, token):
+        if self.cancelled.is_set():
+            raise JobCancelled()
+        if node in ("planning_node", "expand_chapter_node"):
+            self.plan.append(token)
+        elif node == "writing_node":
+            self.sections.setdefault(step or 0, StreamAccumulator()).add(token)
+        self.updated = time.monotonic()
+
+    def on_chapter(self, index, total, chapter):
+        self.plan.append(f"\n\n**{chapter}**\n\n")
+        self.chapter = (index, total, chapter)
+
+    def plan_text(self):
+        return ''.join(self.plan)
+
+    def text(self):
+        return '\n\n'.join(self.sections[step].text for step in sorted(self.sections))
+
+
+class JobQueue:
+    """
+    SQLite-backed job queue served by an in-process pool of worker threads.
+
+    Jobs are picked by priority (highest first), then age, skipping users who
+    already have `per_user_limit` jobs running. A user may have at most
+    `max_queued_per_user` jobs waiting. Finished jobs and their results are kept
+    for `retention` seconds. Jobs that were running when the process stopped are
+    queued again on start-up; since they keep their thread_id, they resume from
+    their last checkpoint.
+
+    Args:
+        runner (callable): runner(params, progress) -> JSON-serialisable result.
+        path (str): SQLite file holding the jobs.
+        workers (int): Number of jobs run at the same time.
+    """
+
+    def __init__(self, runner, path=DEFAULT_JOBS_PATH, workers=2, per_user_limit=1, max_queued_per_user=5,
+                 retention=24 * 3600):
+        self.runner = runner
+        self.per_user_limit = max(1, per_user_limit)
+        self.max_queued_per_user = max(1, max_queued_per_user)
+        self.retention = retention
+        self._cond = threading.Condition()
+        self._running = defaultdict(int)
+        self._progress = {}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, user TEXT, priority INTEGER, status TEXT, "
+            "params TEXT, result TEXT, error TEXT, created REAL, started REAL, finished REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, priority, created)")
+        self._conn.execute("UPDATE jobs SET status = 'queued', started = NULL WHERE status = 'running'")
+        self.purge()
+        for i in range(max(1, workers)):
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True).start()
+
+    def submit(self, user, params, priority=0):
+        """Queue a job and return its id."""
+        self.purge()
+        with self._cond:
+            waiting = self._conn.execute("SELECT COUNT(*) FROM jobs WHERE user = ? AND status = 'queued'",
+                                         (user,)).fetchone()[0]
+            if waiting >= self.max_queued_per_user:
+                raise QueueFullError(f"{waiting} jobs already waiting")
+            job_id = uuid.uuid4().hex
+            self._conn.execute(
+                "INSERT INTO jobs (id, user, priority, status, params, created) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, user, priority, json.dumps(params), time.time())
+            )
+            self._cond.notify_all()
+        logger.info(f"Queued job {job_id} for {user} with priority {priority}")
+        return job_id
+
+    def get(self, job_id):
+        """Return the job as a dict (with its queue position while waiting), or None."""
+        with self._cond:
+            row = self._conn.execute(
+                "SELECT id, user, priority, status, params, result, error, created, started, finished "
+                "FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            job = dict(zip(("id", "user", "priority", "status", "params", "result", "error", "created",
+                            "started", "finished"), row))
+            job["params"] = json.loads(job["params"])
+            job["result"] = json.loads(job["result"]) if job["result"] else None
+            if job["status"] == "queued":
+                job["position"] = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND "
+                    "(priority > ? OR (priority = ? AND created < ?))",
+                    (job["priority"], job["priority"], job["created"])
+                ).fetchone()[0] + 1
+            return job
+
+    def progress(self, job_id):
+        """Live output of a running job, or None once it has finished."""
+        return self._progress.get(job_id)
+
+    def cancel(self, job_id):
+        """Cancel a waiting or running job; returns False if it already finished."""
+        with self._cond:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            )
+            if cursor.rowcount:
+                return True
+            progress = self._progress.get(job_id)
+            if progress is None:
+                return False
+            progress.cancelled.set()
+            return True
+
+    def purge(self):
+        """Drop finished jobs older than the retention period."""
+        with self._cond:
+            self._conn.execute(
+                f"DELETE FROM jobs WHERE status IN ({','.join('?' * len(FINISHED))}) AND finished < ?",
+                (*FINISHED, time.time() - self.retention)
+            )
+
+    def stats(self):
+        """Number of jobs per status, and running jobs per user."""
+        with self._cond:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            return {"jobs": counts, "running_per_user": {user: n for user, n in self._running.items() if n}}
+
+    def _next_job(self):
+        for job_id, user, params in self._conn.execute(
+            "SELECT id, user, params FROM jobs WHERE status = 'queued' ORDER BY priority DESC, created ASC"
+        ):
+            if self._running[user] < self.per_user_limit:
+                return job_id, user, json.loads(params)
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    self._cond.wait(timeout=5.0)
+                    job = self._next_job()
+                job_id, user, params = job
+                self._conn.execute("UPDATE jobs SET status = 'running', started = ? WHERE id = ?",
+                                   (time.time(), job_id))
+                self._running[user] += 1
+                progress = self._progress[job_id] = JobProgress()
+
+            status, result, error = "done", None, None
+            started = time.time()
+            try:
+                result = self.runner(params, progress)
+            except JobCancelled:
+                status = "cancelled"
+            except Exception as e:
+                logger.error(f"Job {job_id} failed: {e}")
+                status, error = "error", str(e)
+
+            with self._cond:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, result = ?, error = ?, finished = ? WHERE id = ?",
+                    (status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+                )
+                self._running[user] -= 1
+                self._progress.pop(job_id, None)
+                self._cond.notify_all()
+            logger.info(f"Job {job_id} {status}", extra={"job_id": job_id, "status": status,
+                                                          "latency": round(time.time() - started, 3)})
+
+
+def generation_job(params, progress):
+    """Job runner: generate one document, or regenerate sections of one, streaming its progress."""
+    from generation import generate_document, regenerate_sections
+    from llm_cache import bypass
+
+    with bypass(not params.get("use_cache", True)):
+        if params.get('regenerate'):
+            # Only the chosen sections (and those drafted from them) of the finished run are redrafted
+            return regenerate_sections(
+                params['thread_id'],
+                params['regenerate'],
+                params['storytitle'],
+                cascade=params.get('cascade', True),
+                feedback=params.get('feedback'),
+                on_token=progress.on_token,
+            )
+        return generate_document(
+            params['instruction'],
+            params['num_steps'],
+            params['llm_provider'],
+            params['llm_model'],
+            params['storytitle'],
+            context_policy=params.get('context_policy', "full"),
+            max_workers=params.get('max_workers', 1),
+            on_token=progress.on_token,
+            context_keep_last=params.get('context_keep_last', 2),
+            context_token_budget=params.get('context_token_budget', 2000),
+            thread_id=params.get('thread_id'),
+            planning_mode=params.get('planning_mode', "flat"),
+            on_chapter=progress.on_chapter,
+        )
+
+
+@lru_cache(maxsize=None)
+def get_job_queue():
+    """Process-wide generation queue, shared by every Streamlit session."""
+    return JobQueue(
+        generation_job,
+        path=os.getenv("AGENTWRITE_JOBS_PATH", DEFAULT_JOBS_PATH),
+        workers=int(os.getenv("AGENTWRITE_JOB_WORKERS", 2)),
+        per_user_limit=int(os.getenv("AGENTWRITE_JOBS_PER_USER", 1)),
+        max_queued_per_user=int(os.getenv("AGENTWRITE_MAX_QUEUED_PER_USER", 5)),
+        retention=float(os.getenv("AGENTWRITE_JOB_RETENTION", 24 * 3600)),
+    )
@@ -0,0 +1,196 @@
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "llm_cache.sqlite")
+
+# Set to True in a session (and the threads it spawns) to skip the cache for its calls
+_bypass = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+
+def hash_bytes(data):
+    """Return the sha256 hex digest of raw bytes, e.g. an uploaded image."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_key(provider, model, prompt, image_hash=None, params=None):
+    """
+    Build a content-addressed cache key for one LLM call.
+
+    Args:
+        provider (str): The LLM provider, e.g. "OpenAI".
+        model (str): The model name.
+        prompt: The fully rendered prompt (a string or a list of messages).
+        image_hash (str): Hash of an attached image, if any.
+        params (dict): Sampling parameters that influence the output.
+
+    Returns:
+        str: A sha256 hex digest.
+    """
+    payload = json.dumps({
+        "provider": provider,
+        "model": model,
+        "prompt": prompt,
+        "image": image_hash,
+        "params": params or {},
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    On-disk LLM response cache backed by SQLite.
+
+    Entries older than `max_age` seconds are dropped, and the least recently used
+    entries are evicted once the cache grows beyond `max_bytes`.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=256 * 1024 * 1024, max_age=7 * 24 * 3600, enabled=True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @property
+    def active(self):
+        return self.enabled and not _bypass.get()
+
+    def get(self, key):
+        """Return the cached value for `key`, or None on a miss or when bypassed."""
+        if not self.active:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.max_age:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, value):
+        """Store `value` under `key` and evict entries beyond the age and size limits."""
+        if not self.active:
+            return
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._size += size - (old[0] if old else 0)
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        expired = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM responses WHERE created < ?", (now - self.max_age,)
+        ).fetchone()
+        if expired[1]:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.max_age,))
+            self._size -= expired[0]
+        while self._size > self.max_bytes:
+            rows = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed LIMIT 32").fetchall()
+            if not rows:
+                self._size = 0
+                break
+            for key, size in rows:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._size -= size
+                if self._size <= self.max_bytes:
+                    break
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": self._size}
+
+    def cached_stream(self, key, stream_fn):
+        """
+        Yield text pieces from the cache, or from `stream_fn()` while recording them.
+
+        A cache hit yields the whole response as a single piece. A stream that fails
+        part way is not cached.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            yield cached
+            return
+        parts = []
+        for piece in stream_fn():
+            parts.append(piece)
+            yield piece
+        self.put(key, ''.join(parts))
+
+
+@contextmanager
+def bypass(active=True):
+    """Skip the cache for calls made inside this block (including threads it starts)."""
+    token = _bypass.set(active)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+response_cache = ResponseCache(
+    path=os.getenv("AGENTWRITE_CACHE_PATH", DEFAULT_CACHE_PATH),
+    max_bytes=int(os.getenv("AGENTWRITE_CACHE_MAX_BYTES", 256 * 1024 * 1024)),
+    max_age=float(os.getenv("AGENTWRITE_CACHE_MAX_AGE", 7 * 24 * 3600)),
+    enabled=os.getenv("AGENTWRITE_CACHE", "1") != "0",
+)
+
+
+@lru_cache(maxsize=None)
+def get_langchain_cache():
+    """Return a LangChain cache that stores chain completions in `response_cache`."""
+    from langchain_core.caches import BaseCache
+    from langchain_core.load import dumps, loads
+
+    class LangChainResponseCache(BaseCache):
+        def lookup(self, prompt, llm_string):
+            cached = response_cache.get(make_key("langchain", llm_string, prompt))
+            if cached is None:
+                return None
+            return [loads(generation) for generation in json.loads(cached)]
+
+        def update(self, prompt, llm_string, return_val):
+            value = json.dumps([dumps(generation) for generation in return_val])
+            response_cache.put(make_key("langchain", llm_string, prompt), value)
+
+        def clear(self, **kwargs):
+            response_cache.clear()
+
+    return LangChainResponseCache()
@@ -0,0 +1,103 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+from functools import lru_cache
+
+from metrics import log_context
+
+LOG_PATH = os.getenv("AGENTWRITE_LOG_PATH", "app.log")
+LOG_LEVEL = os.getenv("AGENTWRITE_LOG_LEVEL", "INFO")
+LOG_MAX_BYTES = int(os.getenv("AGENTWRITE_LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_BACKUPS = int(os.getenv("AGENTWRITE_LOG_BACKUPS", 5))
+
+CONSOLE_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Structured fields copied into each JSON record when present, from `extra=` or the current run/node
+FIELDS = ("run_id", "node", "provider", "model", "latency", "job_id", "status")
+
+
+class ContextFilter(logging.Filter):
+    """Stamp records with the run and node they were logged in, on the logging thread itself."""
+
+    def filter(self, record):
+        for key, value in log_context().items():
+            if getattr(record, key, None) is None:
+                setattr(record, key, value)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the structured FIELDS next to the message."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        for key in FIELDS:
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Keep exc_info and the structured fields for the JSON formatter, but render
+        # the message here, since its arguments may change after the call returns
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+@lru_cache(maxsize=None)
+def setup_logging(level=LOG_LEVEL, path=LOG_PATH, console=True):
+    """
+    Configure logging once per process for the app, its pages and the CLIs.
+
+    Loggers only put records on an in-memory queue; a background QueueListener
+    writes them to a size-rotated JSON-lines file (and the console), so request
+    threads and streaming loops never wait on log I/O. Safe to call on every
+    Streamlit rerun.
+    """
+    handlers = []
+    if path:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS,
+                                                            encoding="utf-8")
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+    if console:
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+        handlers.append(stream_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    return listener
@@ -3,10 +3,15 @@ import time
 import httpx
 from LLMs.llm import get_models
 from dotenv import load_dotenv
-from tools import write_markdown_file
-from ollama import Client
-from graph import create_workflow
+from model_catalog import get_catalog
+from graph import CONTEXT_POLICIES, PLANNING_MODES
+from job_queue import get_job_queue, QueueFullError, FINISHED as FINISHED_JOBS
+from llm_cache import response_cache
+from scheduler import scheduler
+from router import get_router
+from metrics import metrics, start_metrics_server
 import logging
+from logging_setup import setup_logging
 import os
 import sys
 from PIL import Image
@@ -14,16 +19,10 @@ import numpy as np
 import base64
 from io import BytesIO
 import json
+import uuid
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log'),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging: JSON lines to the rotating app.log, written on a background thread
+setup_logging()
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +32,9 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # Load environment variables
 load_dotenv()
 
+# Prometheus metrics on a local port, started once per process
+start_metrics_server()
+
 # Function to load translations
 def load_translations():
     with open("translation/lang.json", "r", encoding="utf-8") as file:
@@ -73,137 +75,180 @@ def _(key):
 
 
 def get_available_models():
-    """Fetch and return a list of available models from Ollama."""
-    try:
-        host_url = "http://localhost:11434/"
-        client = Client(host=host_url)
-        models = client.list()
-        return [model['name'] for model in models['models']]
-    except httpx.ConnectTimeout:
+    """Return the available Ollama models from the TTL-cached model catalog."""
+    catalog = get_catalog()
+    models = catalog.names()
+    if models:
+        return models
+    if isinstance(catalog.error, (httpx.ConnectError, httpx.ConnectTimeout)):
         st.warning(_("Unable to connect to Ollama server. Please ensure it's running."))
         return [_("Ollama server not available")]
-    except Exception as e:
-        st.error(f"{_('An error occurred while fetching models')}: {str(e)}")
+    if catalog.error is not None:
+        st.error(f"{_('An error occurred while fetching models')}: {str(catalog.error)}")
         return [_("Error fetching models")]
-
-available_models = get_available_models()
+    return [_("Ollama server not available")]
 
 # Define available LLM options
 llm_options = ["GROQ", "OpenAI", "Ollama"]
 
-from langchain_groq import ChatGroq
-from ollama import Client
-from openai import OpenAI
+# Job parameters of a section regeneration, on top of the original run's
+REGENERATE_PARAMS = ("regenerate", "cascade", "feedback")
 
-olclient = Client(host='http://localhost:11434')
-klient = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-def generate_writing(instruction, num_steps, llm_name, model_name, storytitle):
-    start_time = time.time()  # Start timing here
+def user_id():
+    """Identify this browser across reruns and refreshes, for the per-user job limits."""
+    if 'user' not in st.query_params:
+        st.query_params['user'] = uuid.uuid4().hex
+    return st.query_params['user']
 
+def submit_generation(last_inputs, use_cache):
+    """Queue a generation for the saved inputs; returns the job id, or None if the queue refused it."""
     try:
-        logger.info(f"Starting writing generation with LLM: {llm_name}, Model: {model_name}")
-
-        if llm_name == "OpenAI":
-            api_key = os.getenv("OPENAI_API_KEY")
-            if not api_key:
-                logger.error(_("OPENAI_API_KEY environment variable not set"))
-                raise RuntimeError(_("OPENAI_API_KEY environment variable not set"))
-            logger.info(f"Using OpenAI model {model_name}")
-            write_path = os.path.join(os.path.dirname(__file__), 'chains/prompts', 'write.txt')
-            with open(write_path, 'r') as file:
-                write_path = file.read()
-
-            # OpenAI API call
-            response = klient.chat.completions.create(
-                model=model_name,
-                messages=[
-                    {"role": "system", "content": write_path},
-                    {"role": "user", "content": instruction},
-                ],
-                stream=True
-            )
-
-            final_doc = ""
-            word_count = 0
-            for chunk in response:
-                if hasattr(chunk, 'choices') and chunk.choices:
-                    choice = chunk.choices[0]
-                    delta = choice.delta
-                    if delta and delta.content:
-                        content = delta.content
-                        final_doc += content
-                        word_count += len(content.split())
-                else:
-                    logger.warning(f"Unexpected chunk format: {chunk}")
-
-        elif llm_name == "GROQ":
-            logger.info(f"Using GROQ model {model_name}")
-
-            # Ensure you use the GROQ-specific API or client
-            LLM = ChatGroq(model=model_name, temperature=0)
-            app = create_workflow(LLM)
-    
-            # Inputs for the GROQ model workflow
-            inputs = {
-                "initial_prompt": instruction,
-                "num_steps": num_steps,
-                "llm_name": llm_name,
-                "model_name": model_name,
-                "storytitle": storytitle
-            }
-    
-            # Invoke the workflow and get the result
-            output = app.invoke(inputs)
-
-            # Handle the output from the GROQ model
-            final_doc = output.get('final_doc', _('No output generated.'))
-            word_count = output.get('word_count', 0)
-            
-        elif llm_name == "Ollama":
-            logger.info(f"Using Ollama model {model_name}")
-            write_path = os.path.join(os.path.dirname(__file__), 'chains/prompts', 'write.txt')
-            with open(write_path, 'r') as file:
-                write_content = file.read()
-
-            # Ollama API call
-            response = olclient.chat(
-                model=model_name, 
-                messages=[
-                    {"role": "system", "content": write_content},
-                    {"role": "user", "content": instruction},
-                ],
-                stream=True
-            )
-            final_doc = ""
-            word_count = 0
-
-            for chunk in response:
-                if 'message' in chunk and 'content' in chunk['message']:
-                    content = chunk['message']['content']
-                    final_doc += content
-                    word_count += len(content.split())
-                else:
-                    logger.warning(f"Unexpected chunk format: {chunk}")
-
-        else:
-            logger.error(f"{_('Unknown LLM selected')}: {llm_name}")
-            return _("Unknown LLM selected"), "", 0
-
-        duration = time.time() - start_time
-        logger.info(_("Workflow created successfully"))
-        logger.debug(f"llm_name: {llm_name}, model_name: {model_name}")
-
-        write_markdown_file(final_doc, f"{model_name}-{storytitle}")
-        logger.info(_("Output written to markdown file"))
-
-        return final_doc, f"{_('Time taken')}: {duration:.2f} {_('seconds')}", word_count
-
-    except Exception as e:
-        duration = time.time() - start_time
-        logger.error(f"{_('Error during workflow execution')}: {e}")
-        st.error(f"{_('Error during workflow execution')}: {e}")
-        return _("An error occurred while generating the writing."), "", 0
+        job_id = get_job_queue().submit(user_id(), dict(last_inputs, use_cache=use_cache))
+    except QueueFullError:
+        st.warning(_("You already have too many generations waiting. Please wait for one to finish."))
+        return None
+    # Kept in the URL, so a refreshed page picks the job up again
+    st.query_params['job'] = job_id
+    return job_id
+
+def show_result(job):
+    """Show the document and stats of a finished generation job."""
+    if job['status'] == "cancelled":
+        st.warning(_("Generation cancelled."))
+        return
+
+    if job['status'] == "error":
+        logger.error(f"{_('Error during workflow execution')}: {job['error']}")
+        st.error(f"{_('Error during workflow execution')}: {job['error']}")
+        output, duration, word_count = _("An error occurred while generating the writing."), "", 0
+    else:
+        result = job['result']
+        context_stats = result['context_stats']
+        if context_stats:
+            st.caption(f"{_('Prompt tokens saved by rolling context')}: {context_stats['tokens_saved']} "
+                       f"({context_stats['context_tokens']} {_('sent')}, "
+                       f"{context_stats['full_text_tokens']} {_('in full-text mode')}, "
+                       f"{context_stats['summary_tokens']} {_('spent on summaries')})")
+
+        stream_stats = result['stream_stats']
+        if stream_stats['chunks']:
+            st.caption(f"{_('Streamed')} {stream_stats['words']} {_('words')} / {stream_stats['bytes']} {_('bytes')} "
+                       f"{_('at')} {stream_stats['tokens_per_second']:.1f} {_('tokens/s')}")
+
+        if result['path']:
+            st.caption(f"{_('Saved to')} {result['path']}")
+
+        output = result['final_doc'] or _('No output generated.')
+        duration = f"{_('Time taken')}: {result['duration']:.2f} {_('seconds')}"
+        word_count = result['word_count']
+
+    st.subheader(_("Generated Output"))
+    st.text_area(_("Output"), output, height=300)  # Pass height directly, no translation needed
+    st.write(_(duration))
+    st.write(_(f"Word Count: {word_count}"))
+
+    if job['status'] == "done" and job['result'].get('sections'):
+        regenerate_sections_form(job)
+
+def regenerate_sections_form(job):
+    """Redraft chosen sections of a finished document, reusing the others."""
+    result = job['result']
+    with st.expander(_("Regenerate Sections")):
+        if result.get('regenerated'):
+            st.caption(f"{_('Regenerated sections')}: {', '.join(str(idx + 1) for idx in result['regenerated'])}")
+        chosen = st.multiselect(_("Sections"), list(range(1, result['sections'] + 1)), key=f"sections-{job['id']}")
+        cascade = st.checkbox(_("Also regenerate the sections written from their text"), value=True,
+                              key=f"cascade-{job['id']}",
+                              help=_("With the 'full' context policy every later section was written from the earlier ones; with 'neighbours' none were."))
+        feedback = st.text_input(_("What should change?"), key=f"feedback-{job['id']}")
+        if st.button(_("Regenerate Selected Sections"), disabled=not chosen, key=f"regenerate-{job['id']}"):
+            params = {key: value for key, value in job['params'].items() if key not in REGENERATE_PARAMS}
+            params.update(regenerate=[number - 1 for number in chosen], cascade=cascade, feedback=feedback or None)
+            if submit_generation(params, job['params'].get('use_cache', True)):
+                st.rerun()
+
+class LiveOutput:
+    """Render a generation job's queue position, plan and sections into Streamlit placeholders."""
+
+    def __init__(self):
+        self.status_area = st.empty()
+        self.plan_area = st.expander(_("Plan"), expanded=False).empty()
+        self.progress_area = st.empty()
+        self.output_area = st.empty()
+
+    def render(self, job, progress):
+        if job['status'] == "queued":
+            self.status_area.info(f"{_('Waiting in queue, position')} {job['position']}")
+            return
+        self.status_area.info(_("Generating..."))
+        if progress is None:
+            return
+        if progress.plan:
+            self.plan_area.markdown(progress.plan_text())
+        if progress.chapter:
+            index, total, _chapter = progress.chapter
+            self.progress_area.progress(index / total, text=f"{_('Chapter')} {index + 1} / {total}")
+        if progress.sections:
+            self.output_area.markdown(progress.text())
+
+    def clear(self):
+        self.status_area.empty()
+        self.progress_area.empty()
+        self.output_area.empty()
+
+def follow_job(job_id, refresh_interval=0.5):
+    """Stream a job's progress until it finishes, then show its result.
+
+    The job runs on the shared worker pool, so leaving or refreshing the page
+    does not stop it; the page only polls it. Re-rendering at a fixed interval
+    rather than per token keeps long documents cheap to display.
+    """
+    job_queue = get_job_queue()
+    job = job_queue.get(job_id)
+    if job is None:
+        st.warning(_("This generation is no longer available."))
+        return
+    # After a refresh the inputs come back from the job, so Regenerate and Resume keep working
+    if 'last_inputs' not in st.session_state:
+        st.session_state.last_inputs = {key: value for key, value in job['params'].items()
+                                        if key != 'use_cache' and key not in REGENERATE_PARAMS}
+
+    if job['status'] not in FINISHED_JOBS:
+        if st.button(_("Cancel"), key=f"cancel-{job_id}"):
+            job_queue.cancel(job_id)
+        live_output = LiveOutput()
+        while job['status'] not in FINISHED_JOBS:
+            live_output.render(job, job_queue.progress(job_id))
+            time.sleep(refresh_interval)
+            job = job_queue.get(job_id)
+        live_output.clear()
+
+    show_result(job)
+    show_performance(job['params'].get('thread_id'))
+
+def show_performance(run_id):
+    """Break down where a generation spent its time, from the metrics recorded for its run."""
+    spans = metrics.run_spans(run_id)
+    if not spans:
+        return
+    groups = {}
+    for span in spans:
+        groups.setdefault((span['kind'], span['name']), []).append(span)
+    rows = []
+    for (kind, name), group in groups.items():
+        ttfts = [span['ttft'] for span in group if span.get('ttft') is not None]
+        rows.append({
+            _("Kind"): kind,
+            _("Name"): name,
+            _("Calls"): len(group),
+            _("Total seconds"): round(sum(span.get('latency') or 0.0 for span in group), 3),
+            _("Avg time to first token"): round(sum(ttfts) / len(ttfts), 3) if ttfts else None,
+            _("Prompt tokens"): sum(span.get('prompt_tokens') or 0 for span in group),
+            _("Completion tokens"): sum(span.get('completion_tokens') or 0 for span in group),
+            _("Cost (USD)"): round(sum(span.get('cost') or 0.0 for span in group), 4),
+        })
+    with st.expander(_("Performance")):
+        st.dataframe(rows)
 
 # Language selection dropdown
 def update_language(selected_language_key):
@@ -233,6 +278,49 @@ def main():
 
     with st.sidebar.expander(_("Advanced Options")):
         num_steps = st.slider(_("Number of Steps"), min_value=0, max_value=4, value=0, step=1)
+        planning_mode = st.selectbox(_("Planning Mode"), PLANNING_MODES, index=0,
+                                     help=_("'hierarchical' plans chapters first and each chapter's sections when it is reached, for book-length documents."))
+        context_policy = st.selectbox(_("Context Policy"), CONTEXT_POLICIES, index=0,
+                                      help=_("'neighbours' drafts each step from the plan and its neighbouring steps, so steps can run in parallel."))
+        max_workers = st.slider(_("Parallel Workers"), min_value=1, max_value=16, value=4, step=1,
+                                disabled=context_policy != "neighbours")
+        context_keep_last = st.number_input(_("Verbatim Paragraphs"), min_value=0, max_value=10, value=2,
+                                            disabled=context_policy != "rolling")
+        context_token_budget = st.number_input(_("Context Token Budget"), min_value=256, max_value=32000, value=2000,
+                                               step=256, disabled=context_policy != "rolling")
+
+    with st.sidebar.expander(_("Response Cache")):
+        use_cache = st.checkbox(_("Use cached responses"), value=True,
+                                help=_("Identical requests are answered from the on-disk cache."))
+        cache_stats = response_cache.stats()
+        st.caption(f"{_('Hits')}: {cache_stats['hits']} · {_('Misses')}: {cache_stats['misses']} · "
+                   f"{_('Entries')}: {cache_stats['entries']} · {cache_stats['bytes'] / 1e6:.1f} MB")
+        if st.button(_("Clear cache")):
+            response_cache.clear()
+
+    with st.sidebar.expander(_("Job Queue")):
+        queue_stats = get_job_queue().stats()
+        st.caption(" · ".join(f"{_(status)}: {count}" for status, count in queue_stats['jobs'].items())
+                   or _("No jobs yet."))
+
+    with st.sidebar.expander(_("Request Scheduler")):
+        scheduler_metrics = scheduler.metrics()
+        if scheduler_metrics:
+            # limiter_wait is time spent on our own limits, backoff_wait on provider push-back
+            st.dataframe({
+                lane: {key: round(value, 3) if isinstance(value, float) else value for key, value in stats.items()}
+                for lane, stats in scheduler_metrics.items()
+            })
+        else:
+            st.caption(_("No requests yet."))
+
+    with st.sidebar.expander(_("Model Router")):
+        router_stats = get_router().stats()
+        if router_stats:
+            # Slow first tokens are hedged on another model after the p95; errors fail over
+            st.dataframe(router_stats)
+        else:
+            st.caption(_("No requests yet."))
 
     llm_provider = st.sidebar.selectbox(_("Select LLM Provider"), llm_options, index=0)
     
@@ -241,41 +329,47 @@ def main():
     else:
         llm_model = st.sidebar.selectbox(_("Select LLM Model"), options=get_models(llm_provider), index=0)
 
+    job_id = None
+
     # Generate button
     if st.button(_("Generate")):
         logger.info(f"Generate button pressed with provider: {llm_provider} and model: {llm_model}")
-        output, duration, word_count = generate_writing(instruction, num_steps, llm_provider, llm_model, storytitle)
-        st.subheader(_("Generated Output"))
-        st.text_area(_("Output"), output, height=300)  # Pass height directly, no translation needed
-        st.write(_(duration))
-        st.write(_(f"Word Count: {word_count}"))
-
+        # Saved before running, so an interrupted run can still be resumed
         st.session_state.last_inputs = {
             'instruction': instruction,
             'num_steps': num_steps,
             'llm_provider': llm_provider,
             'llm_model': llm_model,
-            'storytitle': storytitle
+            'storytitle': storytitle,
+            'context_policy': context_policy,
+            'max_workers': max_workers,
+            'context_keep_last': context_keep_last,
+            'context_token_budget': context_token_budget,
+            'planning_mode': planning_mode,
+            'thread_id': uuid.uuid4().hex
         }
+        job_id = submit_generation(st.session_state.last_inputs, use_cache)
 
     # Regenerate button
     if st.button(_("Regenerate")):
         if 'last_inputs' in st.session_state:
-            last_inputs = st.session_state.last_inputs
-            output, duration, word_count = generate_writing(
-                last_inputs['instruction'],
-                last_inputs['num_steps'],
-                last_inputs['llm_provider'],
-                last_inputs['llm_model'],
-                last_inputs['storytitle']
-            )
-            st.subheader(_("Generated Output"))
-            st.text_area(_("Output"), output, height=300)  # Pass height directly, no translation needed
-            st.write(_(f"Time taken: {duration}"))
-            st.write(_(f"Word Count: {word_count}"))
+            st.session_state.last_inputs['thread_id'] = uuid.uuid4().hex
+            job_id = submit_generation(st.session_state.last_inputs, use_cache)
         else:
             st.warning(_("No previous input available for regeneration."))
 
+    # Resume button, continues the last run from its last completed section
+    if st.button(_("Resume")):
+        if 'last_inputs' in st.session_state and st.session_state.last_inputs.get('thread_id'):
+            job_id = submit_generation(st.session_state.last_inputs, use_cache)
+        else:
+            st.warning(_("No previous run available to resume."))
+
+    # Show the job just submitted, or the one this page was following before a rerun or refresh
+    job_id = job_id or st.query_params.get('job')
+    if job_id:
+        follow_job(job_id)
+
     def update_selection():
         if 'last_inputs' in st.session_state:
             # Lambda functions to get selected values
@@ -0,0 +1,327 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRACE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "traces.jsonl")
+
+# USD per million (prompt, completion) tokens; models not listed are costed at zero
+PRICES = {
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "gpt-4": (30.00, 60.00),
+    "llama-3.1-70b-versatile": (0.59, 0.79),
+    "gemma-7b-it": (0.07, 0.07),
+}
+
+_run_id = contextvars.ContextVar("metrics_run_id", default=None)
+# The graph node being run, with its provider and model, for log records
+_node = contextvars.ContextVar("metrics_node", default=None)
+# Seconds the current scheduler call waited for its lane, for the LLM calls it makes
+_queue_wait = contextvars.ContextVar("metrics_queue_wait", default=None)
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    prompt_price, completion_price = PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+
+
+def _label_text(labels):
+    escaped = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for key, value in sorted(labels.items()))
+    return "{" + ",".join(escaped) + "}" if labels else ""
+
+
+class TraceWriter:
+    """
+    Appends trace records to JSONL files from a background thread.
+
+    Spans are recorded on request threads and on the scheduler's event loop, so
+    they only enqueue the record; the writer thread batches whatever is waiting
+    into one append per file.
+    """
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def put(self, path, record):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush, timeout=5.0)
+        self._queue.put((path, record))
+
+    def flush(self, timeout=None):
+        """Wait until every record enqueued so far is on disk."""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put((None, done))
+        done.wait(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = defaultdict(list)
+            flushed = []
+            for path, record in batch:
+                if path is None:
+                    flushed.append(record)
+                else:
+                    lines[path].append(json.dumps(record, default=str) + "\n")
+            for path, entries in lines.items():
+                try:
+                    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                    with open(path, "a", encoding="utf-8") as file:
+                        file.writelines(entries)
+                except OSError as e:
+                    logger.warning(f"Could not write trace: {e}")
+            for done in flushed:
+                done.set()
+
+
+class Metrics:
+    """
+    In-process metrics for graph nodes and LLM calls.
+
+    Every span (one node run or one LLM call) is aggregated into Prometheus
+    counters, appended to a JSONL trace file by a background writer and kept per
+    run, so the UI can show where a single generation spent its time.
+    """
+
+    def __init__(self, trace_path=DEFAULT_TRACE_PATH, keep_runs=50):
+        self.trace_path = trace_path
+        self.keep_runs = keep_runs
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._help = {}
+        self._runs = OrderedDict()
+        self._trace_writer = TraceWriter()
+
+    def inc(self, metric, value=1.0, help_text="", **labels):
+        with self._lock:
+            self._counters[(metric, tuple(sorted(labels.items())))] += value
+            if help_text:
+                self._help[metric] = help_text
+
+    def observe(self, metric, seconds, help_text="", **labels):
+        """Record one observation of a duration, exported as a Prometheus summary."""
+        with self._lock:
+            key = tuple(sorted(labels.items()))
+            self._counters[(f"{metric}_count", key)] += 1
+            self._counters[(f"{metric}_sum", key)] += seconds
+            if help_text:
+                self._help[metric] = help_text
+
+    def span(self, kind, name, **fields):
+        """Record a finished node run or LLM call."""
+        record = {"ts": time.time(), "run_id": _run_id.get(), "kind": kind, "name": name, **fields}
+        labels = {"name": name}
+        if kind == "llm":
+            labels.update(provider=fields.get("provider") or "", model=fields.get("model") or "")
+            self.inc("agentwrite_llm_prompt_tokens_total", fields.get("prompt_tokens") or 0,
+                     "Prompt tokens sent", **labels)
+            self.inc("agentwrite_llm_completion_tokens_total", fields.get("completion_tokens") or 0,
+                     "Completion tokens received", **labels)
+            self.inc("agentwrite_llm_cost_usd_total", fields.get("cost") or 0.0,
+                     "Estimated LLM cost in USD", **labels)
+            if fields.get("ttft") is not None:
+                self.observe("agentwrite_llm_ttft_seconds", fields["ttft"], "Time to first token", **labels)
+        if fields.get("latency") is not None:
+            self.observe(f"agentwrite_{kind}_latency_seconds", fields["latency"], f"{kind} latency", **labels)
+        with self._lock:
+            if record["run_id"]:
+                self._runs.setdefault(record["run_id"], []).append(record)
+                self._runs.move_to_end(record["run_id"])
+                while len(self._runs) > self.keep_runs:
+                    self._runs.popitem(last=False)
+        self._write_trace(record)
+
+    def _write_trace(self, record):
+        # Never write inline: spans are also recorded on the scheduler's event loop thread
+        if self.trace_path:
+            self._trace_writer.put(self.trace_path, record)
+
+    def flush_trace(self, timeout=None):
+        """Wait until every span recorded so far is in the trace file."""
+        self._trace_writer.flush(timeout)
+
+    def run_spans(self, run_id):
+        with self._lock:
+            return list(self._runs.get(run_id, []))
+
+    def prometheus(self):
+        """Render all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            items = sorted(self._counters.items())
+            help_texts = dict(self._help)
+        lines = []
+        declared = set()
+        for (name, labels), value in items:
+            family = name[:-6] if name.endswith("_count") else name[:-4] if name.endswith("_sum") else name
+            if family not in declared:
+                declared.add(family)
+                kind = "summary" if family != name else "counter"
+                if family in help_texts:
+                    lines.append(f"# HELP {family} {help_texts[family]}")
+                lines.append(f"# TYPE {family} {kind}")
+            lines.append(f"{name}{_label_text(dict(labels))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics(trace_path=os.getenv("AGENTWRITE_TRACE_PATH", DEFAULT_TRACE_PATH))
+
+
+@contextmanager
+def run_context(run_id):
+    """Attribute every span recorded inside this block (and threads it starts) to run_id."""
+    token = _run_id.set(run_id)
+    try:
+        yield
+    finally:
+        _run_id.reset(token)
+
+
+def timed_node(name, node):
+    """Wrap a graph node so each run of it is recorded as a span."""
+    @wraps(node)
+    def wrapper(state, *args, **kwargs):
+        start = time.monotonic()
+        status = "ok"
+        token = _node.set({"node": name, "provider": state.get("llm_name"), "model": state.get("model_name")})
+        try:
+            return node(state, *args, **kwargs)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            latency = time.monotonic() - start
+            metrics.span("node", name, latency=latency, status=status,
+                         provider=state.get("llm_name"), model=state.get("model_name"))
+            logger.info(f"Node {name} finished in {latency:.2f}s",
+                        extra={"latency": round(latency, 3), "status": status})
+            _node.reset(token)
+    return wrapper
+
+
+def log_context():
+    """The current run id and graph node (with its provider and model), for structured logs."""
+    return {"run_id": _run_id.get(), **(_node.get() or {})}
+
+
+def queued_call(queue_wait, fn, *args, **kwargs):
+    """Call fn, attributing queue_wait seconds spent in the scheduler to the LLM calls it makes."""
+    _queue_wait.set(queue_wait)
+    return fn(*args, **kwargs)
+
+
+def record_llm_call(provider, model, name, latency, ttft=None, prompt_tokens=0, completion_tokens=0,
+                    queue_wait=None, status="ok"):
+    metrics.span("llm", name, provider=provider, model=model, latency=latency, ttft=ttft,
+                 prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, queue_wait=queue_wait,
+                 cost=estimate_cost(model, prompt_tokens, completion_tokens), status=status)
+
+
+def get_callback_handler():
+    """LangChain callback handler that records every chat model call as a span."""
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class MetricsCallbackHandler(BaseCallbackHandler):
+        def __init__(self):
+            self.calls = {}
+
+        def _start(self, run_id, metadata):
+            self.calls[run_id] = {"start": time.monotonic(), "ttft": None, "metadata": metadata or {},
+                                  "queue_wait": _queue_wait.get()}
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+            self._start(run_id, metadata)
+
+        def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+            self._start(run_id, metadata)
+
+        def on_llm_new_token(self, token, *, run_id, **kwargs):
+            call = self.calls.get(run_id)
+            if call and call["ttft"] is None:
+                call["ttft"] = time.monotonic() - call["start"]
+
+        def _finish(self, run_id, response=None, status="ok"):
+            call = self.calls.pop(run_id, None)
+            if call is None:
+                return
+            prompt_tokens, completion_tokens = _usage(response)
+            metadata = call["metadata"]
+            record_llm_call(metadata.get("ls_provider"), metadata.get("ls_model_name"),
+                            metadata.get("langgraph_node") or "llm", time.monotonic() - call["start"],
+                            ttft=call["ttft"], prompt_tokens=prompt_tokens,
+                            completion_tokens=completion_tokens, queue_wait=call["queue_wait"], status=status)
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            self._finish(run_id, response)
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            self._finish(run_id, status="error")
+
+    return MetricsCallbackHandler()
+
+
+def _usage(response):
+    """Pull (prompt, completion) token counts out of an LLMResult."""
+    if response is None:
+        return 0, 0
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    return 0, 0
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@lru_cache(maxsize=None)
+def start_metrics_server(port=None, host="127.0.0.1"):
+    """Serve /metrics on a local port from a daemon thread (once per process)."""
+    port = int(port or os.getenv("AGENTWRITE_METRICS_PORT", 9464))
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logger.warning(f"Metrics endpoint not started on {host}:{port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Serving Prometheus metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,150 @@
+import logging
+import os
+import threading
+import time
+
+import httpx
+
+from clients import OLLAMA_HOST, get_http_client, normalize_host
+
+logger = logging.getLogger(__name__)
+
+CATALOG_TTL = float(os.getenv("OLLAMA_CATALOG_TTL", 60))
+# Discovery must never hold up a page render for long
+CATALOG_TIMEOUT = httpx.Timeout(5.0, connect=1.0)
+
+# Model families that carry a vision encoder, for Ollama versions without "capabilities"
+VISION_FAMILIES = {"clip", "mllama"}
+# Model families that only compute embeddings, for the same versions
+EMBEDDING_FAMILIES = {"bert", "nomic-bert"}
+
+
+def is_vision_model(show):
+    """Decide from an /api/show response whether the model accepts images."""
+    if "vision" in (show.get("capabilities") or []):
+        return True
+    families = set((show.get("details") or {}).get("families") or [])
+    if families & VISION_FAMILIES:
+        return True
+    return any(".vision." in key for key in (show.get("model_info") or {}))
+
+
+def is_chat_model(name, show):
+    """Decide from an /api/show response (or just the tags entry) whether the model can answer prompts."""
+    capabilities = show.get("capabilities")
+    if capabilities is not None:
+        return "completion" in capabilities
+    details = show.get("details") or {}
+    families = set(details.get("families") or []) | {details.get("family")}
+    return not (families & EMBEDDING_FAMILIES or "embed" in name)
+
+
+class ModelCatalog:
+    """
+    TTL-cached catalog of the models installed on an Ollama server.
+
+    The first lookup fetches synchronously with short timeouts. After that, lookups
+    always answer from the cache, and a stale cache is refreshed on a background
+    thread. Per-model metadata from /api/show is only fetched for models whose
+    digest has not been seen before.
+    """
+
+    def __init__(self, host=OLLAMA_HOST, ttl=CATALOG_TTL, timeout=CATALOG_TIMEOUT):
+        self.host = normalize_host(host)
+        self.ttl = ttl
+        self.timeout = timeout
+        self.error = None
+        self._models = None
+        self._fetched = 0.0
+        self._details = {}
+        self._lock = threading.Lock()
+        # Held by the first, synchronous fetch, so concurrent sessions wait for it instead of repeating it
+        self._first_fetch = threading.Lock()
+        self._refreshing = False
+
+    def _show(self, name):
+        response = get_http_client().post(f"{self.host}/api/show", json={"model": name}, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def refresh(self):
+        """Fetch the model list (and metadata of new models) from the server."""
+        try:
+            response = get_http_client().get(f"{self.host}/api/tags", timeout=self.timeout)
+            response.raise_for_status()
+            payload = response.json()
+            if not isinstance(payload, dict):
+                raise ValueError(f"unexpected reply {payload!r:.100}")
+            models = []
+            for entry in payload.get("models") or []:
+                name = entry.get("name") or entry.get("model")
+                details = entry.get("details") or {}
+                digest = entry.get("digest")
+                if digest not in self._details:
+                    try:
+                        show = self._show(name)
+                        self._details[digest] = {"vision": is_vision_model(show), "chat": is_chat_model(name, show)}
+                    except (httpx.HTTPError, ValueError, AttributeError) as e:
+                        logger.warning(f"Could not fetch metadata for {name}: {e}")
+                        self._details[digest] = {"vision": bool(set(details.get("families") or []) & VISION_FAMILIES),
+                                                 "chat": is_chat_model(name, {"details": details})}
+                models.append({
+                    "name": name,
+                    "size": entry.get("size"),
+                    "family": details.get("family"),
+                    "parameter_size": details.get("parameter_size"),
+                    "quantization": details.get("quantization_level"),
+                    **self._details[digest],
+                })
+            with self._lock:
+                self._models = models
+                self._fetched = time.monotonic()
+                self.error = None
+        except (httpx.HTTPError, ValueError, AttributeError) as e:
+            # ValueError covers a reply that is not JSON, AttributeError one of the wrong shape
+            logger.warning(f"Could not fetch models from {self.host}: {e}")
+            with self._lock:
+                self.error = e
+                # Keep serving the last known list, and retry after another TTL
+                if self._models is None:
+                    self._models = []
+                self._fetched = time.monotonic()
+        finally:
+            self._refreshing = False
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self.refresh, name="ollama-catalog", daemon=True).start()
+
+    def models(self):
+        """Return the cached model metadata, refreshing it when it is missing or stale."""
+        if self._models is None:
+            with self._first_fetch:
+                if self._models is None:
+                    self.refresh()
+        elif time.monotonic() - self._fetched > self.ttl:
+            self._refresh_in_background()
+        return list(self._models)
+
+    def names(self, vision_only=False, chat_only=False):
+        return [model["name"] for model in self.models()
+                if (model["vision"] or not vision_only) and (model["chat"] or not chat_only)]
+
+    def get(self, name):
+        return next((model for model in self.models() if model["name"] == name), None)
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(host=None):
+    """Process-wide catalog for an Ollama host."""
+    host = normalize_host(host)
+    with _catalogs_lock:
+        if host not in _catalogs:
+            _catalogs[host] = ModelCatalog(host)
+        return _catalogs[host]
@@ -0,0 +1,85 @@
+import re
+from nodes.writing_node import summarize_paragraph
+from scheduler import scheduler
+
+# Upper bound for the running summary of finished chapters
+BOOK_SUMMARY_WORDS = 400
+# The finished book is on disk (see output_writer); the state only keeps its opening
+BOOK_PREVIEW_CHARS = 2000
+
+
+def chapter_title(chapter):
+    """Pull the title out of a 'Chapter N - Title: ... - Summary: ...' plan line."""
+    match = re.search(r"Title:\s*(.*?)\s*(?:-\s*Summary:|$)", chapter)
+    return match.group(1) if match and match.group(1) else chapter.strip()
+
+
+def expand_chapter_node(state, section_chain):
+    """
+    expand the current chapter into its own paragraph plan
+
+    Runs once per chapter, just before the chapter is drafted, so only the
+    current chapter's sections are ever held in the state.
+    """
+    chapters = state.get('chapters') or []
+    idx = state.get('chapter_idx') or 0
+    if idx >= len(chapters):
+        raise ValueError(f"No chapter {idx + 1} in an outline of {len(chapters)} chapters")
+    print(f"---PLANNING CHAPTER {idx + 1} OF {len(chapters)}: {chapter_title(chapters[idx])}---")
+    num_steps = int(state['num_steps'])
+    num_steps += 1
+
+    plan = scheduler.call(state.get('llm_name'), state.get('model_name'), section_chain.invoke, {
+        "instructions": state['initial_prompt'],
+        "chapters": '\n'.join(chapters),
+        "summary": state.get('book_summary') or "(none yet)",
+        "chapter": chapters[idx]
+    })
+
+    return {"plan": plan, "num_steps": num_steps, "write_steps": [], "section_deps": [], "context_state": {},
+            "final_doc": None, "word_count": 0}
+
+
+def finish_chapter_node(state, summary_chain):
+    """
+    move the finished chapter out of the state
+
+    Its sections already went to the run's document file as they were written.
+    The chapter is folded into the running book summary that later chapters are
+    planned and written against, and only the opening of the book is kept, as a
+    preview of the finished document.
+    """
+    chapters = state['chapters']
+    idx = state.get('chapter_idx') or 0
+    written = state.get('write_steps') or []
+    num_steps = int(state['num_steps'])
+    num_steps += 1
+
+    preview = state.get('book_preview') or ""
+    if len(preview) < BOOK_PREVIEW_CHARS:
+        preview = f"{preview}# {chapter_title(chapters[idx])}\n\n{state['final_doc']}\n\n"[:BOOK_PREVIEW_CHARS]
+
+    book_word_count = (state.get('book_word_count') or 0) + (state.get('word_count') or 0)
+    print(f"---FINISHED CHAPTER {idx + 1} OF {len(chapters)} ({book_word_count} words so far)---")
+    update = {"num_steps": num_steps, "chapter_idx": idx + 1, "book_preview": preview,
+              "book_word_count": book_word_count, "section_offset": (state.get('section_offset') or 0) + len(written),
+              "write_steps": [], "section_deps": []}
+
+    if idx + 1 == len(chapters):
+        print(f"Total word count: {book_word_count}")
+        final_doc = preview.rstrip() + (" …" if len(preview) == BOOK_PREVIEW_CHARS else "")
+        update.update({"final_doc": final_doc, "word_count": book_word_count})
+    else:
+        update["book_summary"] = summarize_paragraph((state.get('llm_name'), state.get('model_name')), summary_chain,
+                                                     state.get('book_summary'), state['final_doc'],
+                                                     BOOK_SUMMARY_WORDS)
+        update["final_doc"] = None
+
+    return update
+
+
+def next_chapter(state):
+    """Expand the next chapter, or save once the last one is finished."""
+    if state.get('chapter_idx', 0) >= len(state.get('chapters') or []):
+        return "saving_node"
+    return "expand_chapter_node"
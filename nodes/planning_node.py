@@ -1,15 +1,47 @@
 from langchain.schema import Document
-from chains.pplan_chain import plan_chain
+from scheduler import scheduler
+from nodes.writing_node import draft_while_planning
 
 
-def planning_node(state):
+def planning_node(state, plan_chain, chapter_chain, write_chain=None, summary_chain=None):
     """take the initial prompt and write a plan to make a long doc"""
     print("---PLANNING THE WRITING---")
     initial_prompt = state['initial_prompt']
     num_steps = int(state['num_steps'])
     num_steps += 1
 
-    plan = plan_chain.invoke({"intructions": initial_prompt})
+    if state.get('planning_mode') == "hierarchical":
+        # Only the chapters are planned up front; their sections are planned when drafting reaches them
+        plan = scheduler.call(state.get('llm_name'), state.get('model_name'),
+                              chapter_chain.invoke, {"instructions": initial_prompt})
+        chapters = [line for line in plan.strip().split('\n') if line.strip()]
+        print(f"---PLANNED {len(chapters)} CHAPTERS---")
+        update = {"plan": plan, "num_steps": num_steps, "chapters": chapters, "chapter_idx": 0,
+                  "section_offset": 0, "book_summary": "", "book_preview": "", "book_word_count": 0}
+        if not chapters:
+            # Nothing to expand: save the empty document instead of drafting chapter 1
+            update.update({"final_doc": "", "word_count": 0})
+        return update
+
+    if state.get('planning_mode') == "pipelined":
+        # The plan is streamed and each step is drafted as soon as its line is complete
+        plan_tokens = scheduler.stream(state.get('llm_name'), state.get('model_name'),
+                                       plan_chain.stream, {"instructions": initial_prompt})
+        update = draft_while_planning(state, plan_tokens, write_chain, summary_chain)
+        update["num_steps"] = num_steps
+        return update
+
+    plan = scheduler.call(state.get('llm_name'), state.get('model_name'),
+                          plan_chain.invoke, {"instructions": initial_prompt})
     # print(plan)
 
     return {"plan": plan, "num_steps":num_steps}
+
+
+def route_plan(state):
+    """Start drafting, expand the first chapter in hierarchical mode, or save a document finished while planning."""
+    if state.get('final_doc') is not None:
+        return "saving_node"
+    if state.get('planning_mode') == "hierarchical":
+        return "expand_chapter_node"
+    return "writing_node"
@@ -2,24 +2,20 @@ import os
 from typing import Any, Dict
 
 from langchain.schema import Document
-from tools import write_markdown_file
 
 
 def saving_node(state):
-    """take the finished long doc and save it to local disk as a .md file   """
+    """finish the long doc
+
+    The document itself is written to disk section by section by the caller's
+    output writer (see output_writer.DocumentWriter), under a file name that is
+    unique per run, so concurrent runs never overwrite each other's files.
+    """
     print("---SAVING THE DOC---")
-    initial_prompt = state['initial_prompt']
-    plan = state['plan']
-    final_doc = state['final_doc']
     word_count = state['word_count']
-    llm_name = state['llm_name']
     num_steps = int(state['num_steps'])
     num_steps += 1
 
-    final_doc = final_doc + f"\n\nTotal word count: {word_count}"
-
-    # save to local disk
-    write_markdown_file(final_doc, f"final_doc_{llm_name}")
-    write_markdown_file(plan, f"plan_{llm_name}")
+    print(f"Total word count: {word_count}")
 
-    return { "num_steps":num_steps}
\ No newline at end of file
+    return { "num_steps":num_steps}
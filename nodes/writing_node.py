@@ -1,58 +1,403 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
 from langchain.schema import Document
-from chains.wwrite_chain import write_chain
-
-def count_words(text):
-        """
-        Count the number of words in the given text.
-        
-        Args:
-            text (str): The input text to count words from.
-        
-        Returns:
-            int: The number of words in the text.
-        """
-        # Split the text into words and count them
-        words = text.split()
-        return len(words)
-
-def writing_node(state):
-    """take the initial prompt and write a plan to make a long doc"""
+from graph import CONTEXT_POLICIES, MAX_PLAN_STEPS
+from context_manager import RollingContext
+from scheduler import scheduler
+from llm_cache import bypass
+from stream_accumulator import count_words
+
+def neighbour_context(planning_steps, idx, span=1):
+    """
+    Build a bounded context for one plan step out of its neighbouring steps.
+
+    Args:
+        planning_steps (list): All plan steps in order.
+        idx (int): Index of the step being drafted.
+        span (int): How many steps on each side to include.
+
+    Returns:
+        str: The neighbouring step summaries, one per line.
+    """
+    lines = []
+    for i in range(max(0, idx - span), idx):
+        lines.append(f"(Previous step, already written) {planning_steps[i]}")
+    for i in range(idx + 1, min(len(planning_steps), idx + span + 1)):
+        lines.append(f"(Next step, written separately) {planning_steps[i]}")
+    return '\n'.join(lines)
+
+def section_dependencies(context_policy, idx, window=0):
+    """Indices of the earlier sections whose text goes into the prompt of step idx."""
+    if context_policy == "neighbours":
+        return []
+    if context_policy == "rolling":
+        # Only the verbatim window; the running summary is not tracked per section
+        return list(range(max(0, idx - window), idx))
+    return list(range(idx))
+
+def context_settings(state):
+    """The rolling context's (keep_last, token_budget); defaults apply only when unset, as 0 paragraphs is valid."""
+    keep_last = state.get('context_keep_last')
+    token_budget = state.get('context_token_budget')
+    return (2 if keep_last is None else keep_last), (2000 if token_budget is None else token_budget)
+
+def split_plan(plan):
+    """Normalise the plan text and split it into one step per line."""
+    plan = plan.strip().replace('\n\n', '\n')
+    return plan, plan.split('\n')
+
+def draft_step(lane, write_chain, initial_instruction, plan, step, idx, text):
+    """Draft a single plan step with the given context text."""
+    # Invoke the write_chain through the scheduler, tagged with its step so streamed
+    # tokens can be routed back to it
+    return scheduler.call(*lane, write_chain.invoke, {
+        "instructions": initial_instruction,
+        "plan": plan,
+        "text": text,
+        "STEP": step
+    }, config={"metadata": {"write_step": idx}})
+
+def summarize_paragraph(lane, summary_chain, summary, paragraph, max_words):
+    """Fold one paragraph into the running summary with the summary chain."""
+    # Tagged so its streamed tokens are not shown as part of the plan or a section
+    return scheduler.call(*lane, summary_chain.invoke, {
+        "summary": summary or "(empty)",
+        "paragraph": paragraph,
+        "max_words": max_words
+    }, config={"metadata": {"context_summary": True}})
+
+def with_book_summary(state, text):
+    """Prefix the context with the summary of the finished chapters, in hierarchical mode."""
+    if not state.get('book_summary'):
+        return text
+    return f"(Summary of the previous chapters) {state['book_summary']}\n\n{text}"
+
+def draft_parallel(lane, write_chain, initial_instruction, plan, planning_steps, indices, max_workers,
+                   offset=0, prefix=""):
+    """Draft independent steps concurrently; results come back in plan order."""
+    calls = [
+        (write_chain.invoke, ({
+            "instructions": initial_instruction,
+            "plan": plan,
+            "text": prefix + neighbour_context(planning_steps, idx),
+            "STEP": planning_steps[idx]
+        },), {"config": {"metadata": {"write_step": offset + idx}}})
+        # Tag every call with its step so streamed tokens can be routed back to it
+        for idx in indices
+    ]
+    # The scheduler runs at most max_workers of them at once, within the provider limits
+    return scheduler.call_all(*lane, calls, max_concurrency=max_workers)
+
+def writing_node(state, write_chain, summary_chain):
+    """
+    draft the next plan step(s) of the long doc
+
+    Each call writes one step (or one batch of independent steps in the
+    'neighbours' policy) and returns, so the workflow checkpoints every
+    completed section and an interrupted run can resume where it stopped.
+    """
     print("---WRITING THE DOC---")
     initial_instruction = state['initial_prompt']
-    plan = state['plan']
     num_steps = int(state['num_steps'])
     num_steps += 1
+    context_policy = state.get('context_policy') or "full"
+    max_workers = max(1, int(state.get('max_workers') or 1))
 
-    plan = plan.strip().replace('\n\n', '\n')
-    planning_steps = plan.split('\n')
-    text = ""
-    responses = []
-    if len(planning_steps) > 50:
-        print("plan is too long")
+    if context_policy not in CONTEXT_POLICIES:
+        raise ValueError(f"Unknown context policy: {context_policy}")
+
+    plan, planning_steps = split_plan(state['plan'])
+    max_plan_steps = state.get('max_plan_steps') or MAX_PLAN_STEPS
+    if len(planning_steps) > max_plan_steps:
+        # Book-length documents should use the hierarchical planning mode instead
+        print(f"plan is too long ({len(planning_steps)} steps, at most {max_plan_steps})")
         # print(plan)
-        return
-    for idx,step in enumerate(planning_steps):
-        # Invoke the write_chain
-        result = write_chain.invoke({
-            "intructions": initial_instruction,
-            "plan": plan,
-            "text": text,
-            "STEP": step
-        })
-        # result = step
-        # print(f"----------------------------{idx}----------------------------")
-        # print(step)
-        # print("----------------------------\n\n")
-        responses.append(result)
-        text += result + '\n\n'
-
-    final_doc = '\n\n'.join(responses)
+        return {"final_doc": "", "word_count": 0, "num_steps": num_steps}
+
+    lane = (state.get('llm_name'), state.get('model_name'))
+    written = list(state.get('write_steps') or [])
+    idx = len(written)
+    # Sections are numbered across the whole book, so streamed tokens of later chapters
+    # do not land on earlier ones
+    offset = state.get('section_offset') or 0
+    update = {"num_steps": num_steps}
+    deps = list(state.get('section_deps') or [])[:idx]
+    keep_last, token_budget = context_settings(state)
+    deps += [section_dependencies(context_policy, i, keep_last) for i in range(len(deps), idx)]
+
+    if idx >= len(planning_steps):
+        # Re-entered (e.g. on resume) after every step was written: only the document is left to finish
+        print(f"---ALL {len(planning_steps)} STEPS ALREADY WRITTEN---")
+        finish_document(written, update)
+        return update
+
+    if context_policy == "neighbours":
+        indices = list(range(idx, min(idx + max_workers, len(planning_steps))))
+        print(f"---DRAFTING STEPS {idx + 1}-{indices[-1] + 1} WITH {max_workers} WORKERS---")
+        written += draft_parallel(lane, write_chain, initial_instruction, plan, planning_steps, indices, max_workers,
+                                  offset, with_book_summary(state, ""))
+        deps += [[] for _ in indices]
+    elif context_policy == "rolling":
+        context = RollingContext.from_dict(partial(summarize_paragraph, lane, summary_chain),
+                                           state.get('context_state') or {},
+                                           keep_last=keep_last, token_budget=token_budget)
+        deps.append(section_dependencies(context_policy, idx, len(context.recent)))
+        result = draft_step(lane, write_chain, initial_instruction, plan, planning_steps[idx], offset + idx,
+                            with_book_summary(state, context.render()))
+        context.add(result)
+        written.append(result)
+        update["context_state"] = context.to_dict()
+        update["context_stats"] = context.report()
+    else:
+        text = ''.join(section + '\n\n' for section in written)
+        deps.append(section_dependencies(context_policy, idx))
+        written.append(draft_step(lane, write_chain, initial_instruction, plan, planning_steps[idx], offset + idx,
+                                  with_book_summary(state, text)))
+
+    print(f"---WROTE STEP {len(written)} OF {len(planning_steps)}---")
+    update["write_steps"] = written
+    update["section_deps"] = deps
+
+    if len(written) == len(planning_steps):
+        finish_document(written, update)
+
+    return update
+
+def finish_document(written, update):
+    """Join the written sections into the final document once every plan step is done."""
+    final_doc = '\n\n'.join(written)
 
     # Count words in the final document
     word_count = count_words(final_doc)
     print(f"Total word count: {word_count}")
+    update.update({"final_doc": final_doc, "word_count": word_count})
+
+    stats = update.get("context_stats")
+    if stats:
+        print(f"Rolling context saved {stats['tokens_saved']} prompt tokens "
+              f"({stats['context_tokens']} sent, {stats['full_text_tokens']} in full-text mode)")
+
+def plan_lines(tokens):
+    """Yield each plan step from a stream of plan tokens as soon as its line is complete."""
+    buffer = ""
+    for token in tokens:
+        buffer += token
+        *lines, buffer = buffer.split('\n')
+        for line in lines:
+            if line.strip():
+                yield line.strip()
+    if buffer.strip():
+        yield buffer.strip()
+
+def draft_while_planning(state, plan_tokens, write_chain, summary_chain):
+    """
+    Draft plan steps while the plan is still streaming, for the 'pipelined' planning mode.
+
+    Each step is handed to the writer as soon as its line of the plan is complete
+    (and, in the 'neighbours' policy, the next line too), and drafted against the
+    plan so far. Once the plan is finished, the steps already in flight are
+    completed and the rest is left to writing_node, so those are checkpointed
+    one by one as usual.
+
+    Returns:
+        dict: plan, write_steps and, if every step got drafted, final_doc.
+    """
+    initial_instruction = state['initial_prompt']
+    context_policy = state.get('context_policy') or "full"
+    max_workers = max(1, int(state.get('max_workers') or 1)) if context_policy == "neighbours" else 1
+    max_plan_steps = state.get('max_plan_steps') or MAX_PLAN_STEPS
+    lane = (state.get('llm_name'), state.get('model_name'))
+    if context_policy not in CONTEXT_POLICIES:
+        raise ValueError(f"Unknown context policy: {context_policy}")
+
+    steps = []
+    plan_done = False
+    cond = threading.Condition()
+    # Neighbours drafts each step with the step after it, so it waits for one more line
+    lookahead = 1 if context_policy == "neighbours" else 0
+    context = None
+    if context_policy == "rolling":
+        keep_last, token_budget = context_settings(state)
+        context = RollingContext(partial(summarize_paragraph, lane, summary_chain),
+                                 keep_last=keep_last, token_budget=token_budget)
+    results = {}
+    deps = {}
+
+    def draft(idx, plan, planning_steps):
+        if context_policy == "neighbours":
+            text = neighbour_context(planning_steps, idx)
+            deps[idx] = []
+        elif context_policy == "rolling":
+            deps[idx] = section_dependencies(context_policy, idx, len(context.recent))
+            text = context.render()
+        else:
+            text = ''.join(results[i] + '\n\n' for i in range(idx))
+            deps[idx] = section_dependencies(context_policy, idx)
+        result = draft_step(lane, write_chain, initial_instruction, plan, planning_steps[idx], idx, text)
+        if context is not None:
+            context.add(result)
+        print(f"---WROTE STEP {idx + 1} WHILE PLANNING---")
+        return result
+
+    def drafter():
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {}
+            idx = 0
+            while idx < max_plan_steps:
+                with cond:
+                    while not plan_done and len(steps) <= idx + lookahead:
+                        cond.wait()
+                    if plan_done:
+                        break
+                    planning_steps = list(steps)
+                # Sequential policies draft one step at a time; neighbours keeps max_workers in flight
+                if len(futures) >= max_workers:
+                    done = min(futures)
+                    results[done] = futures.pop(done).result()
+                futures[idx] = pool.submit(contextvars.copy_context().run, draft, idx,
+                                           '\n'.join(planning_steps), planning_steps)
+                if max_workers == 1:
+                    results[idx] = futures.pop(idx).result()
+                idx += 1
+            for idx, future in sorted(futures.items()):
+                results[idx] = future.result()
+
+    errors = []
+
+    def run_drafter():
+        try:
+            drafter()
+        except Exception as e:
+            errors.append(e)
+
+    # The drafter runs in the node's context, so its tokens are streamed as this node's output
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(run_drafter,), name="plan-drafter")
+    thread.start()
+    try:
+        for line in plan_lines(plan_tokens):
+            with cond:
+                steps.append(line)
+                cond.notify_all()
+    finally:
+        with cond:
+            plan_done = True
+            cond.notify_all()
+        thread.join()
+    if errors:
+        raise errors[0]
+
+    written = [results[i] for i in range(len(results))]
+    print(f"---PLANNED {len(steps)} STEPS, WROTE {len(written)} WHILE PLANNING---")
+    update = {"plan": '\n'.join(steps), "write_steps": written,
+              "section_deps": [deps[i] for i in range(len(written))]}
+    if context is not None:
+        update["context_state"] = context.to_dict()
+        update["context_stats"] = context.report()
+    if steps and len(written) == len(steps) and len(steps) <= max_plan_steps:
+        finish_document(written, update)
+    return update
+
+def affected_sections(section_deps, sections):
+    """The given sections plus every later section drafted with the text of one of them."""
+    redo = set(sections)
+    # Dependencies only point backwards, so one pass in document order finds them all
+    for idx, deps in enumerate(section_deps):
+        if redo.intersection(deps):
+            redo.add(idx)
+    return sorted(redo)
+
+def redraft_step(lane, write_chain, initial_instruction, plan, step, idx, text, on_token=None):
+    """Draft a single plan step again, passing its tokens to on_token(node, step, token)."""
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    streamed = []
+
+    class TokenHandler(BaseCallbackHandler):
+        def on_llm_new_token(self, token, **kwargs):
+            streamed.append(token)
+            if on_token:
+                on_token("writing_node", idx, token)
+
+    # invoke rather than stream, so the response cache is consulted like for the first draft
+    result = scheduler.call(*lane, write_chain.invoke, {
+        "instructions": initial_instruction,
+        "plan": plan,
+        "text": text,
+        "STEP": step
+    }, config={"callbacks": [TokenHandler()]})
+    if on_token and not streamed:
+        # Cache hits and models that do not stream on invoke come back whole
+        on_token("writing_node", idx, result)
+    return result
+
+def redraft_sections(state, write_chain, sections, cascade=True, feedback=None, on_token=None):
+    """
+    Redraft chosen sections of a finished document and reuse all the others.
+
+    With cascade, the sections drafted with the text of a redrafted section are
+    redrafted too, in document order, so they follow the new text; those whose
+    sections came out unchanged are kept as they are. Each section is drafted with
+    the context policy of the original run, from the current text of the sections
+    it depends on; for the 'rolling' policy only the verbatim window is rebuilt,
+    not the running summary. The chosen sections skip the response cache and get
+    `feedback`, if any, as a revision note; their dependents are looked up in it.
+
+    Returns:
+        dict: write_steps, section_deps, final_doc, word_count and regenerated
+        (the redrafted section indices).
+    """
+    if state.get('planning_mode') == "hierarchical" or state.get('chapters'):
+        raise ValueError("Sections of hierarchical documents cannot be regenerated")
+    written = list(state.get('write_steps') or [])
+    if state.get('final_doc') is None or not written:
+        raise ValueError("Only finished documents can be regenerated")
+    invalid = [idx for idx in sections if not 0 <= idx < len(written)]
+    if invalid:
+        raise ValueError(f"No such sections: {', '.join(str(idx + 1) for idx in invalid)}")
 
-    return {"final_doc": final_doc, "word_count": word_count, "num_steps":num_steps}
+    context_policy = state.get('context_policy') or "full"
+    plan, planning_steps = split_plan(state['plan'])
+    lane = (state.get('llm_name'), state.get('model_name'))
+    # Runs from before dependencies were recorded get the policy's defaults
+    deps = list(state.get('section_deps') or [])
+    keep_last, _ = context_settings(state)
+    deps += [section_dependencies(context_policy, idx, keep_last) for idx in range(len(deps), len(written))]
 
+    redo = affected_sections(deps, sections) if cascade else sorted(set(sections))
+    changed = set()
+    regenerated = []
+    for idx in redo:
+        if idx not in sections and not changed.intersection(deps[idx]):
+            # The sections it was drafted from came out the same, so its prompt would too
+            print(f"---KEEPING STEP {idx + 1} OF {len(written)}, ITS CONTEXT IS UNCHANGED---")
+            continue
+        print(f"---REWRITING STEP {idx + 1} OF {len(written)}---")
+        if context_policy == "neighbours":
+            text = neighbour_context(planning_steps, idx)
+        else:
+            text = ''.join(written[i] + '\n\n' for i in deps[idx])
+        step = planning_steps[idx]
+        if feedback and idx in sections:
+            step = f"{step}\n(Revision note: {feedback})"
+        # The chosen sections must reach the model; their dependents may come from the cache
+        with bypass() if idx in sections else nullcontext():
+            result = redraft_step(lane, write_chain, state['initial_prompt'], plan, step, idx, text, on_token)
+        if result != written[idx]:
+            changed.add(idx)
+        written[idx] = result
+        regenerated.append(idx)
 
+    update = {"write_steps": written, "section_deps": deps, "regenerated": regenerated}
+    finish_document(written, update)
+    return update
 
+def should_continue(state):
+    """Loop on writing_node until every plan step is written, then save (or close the chapter)."""
+    if state.get('final_doc') is None:
+        return "writing_node"
+    if state.get('planning_mode') == "hierarchical" and state.get('chapters'):
+        return "finish_chapter_node"
+    return "saving_node"
@@ -0,0 +1,172 @@
+import json
+import logging
+import os
+import re
+import time
+
+from stream_accumulator import StreamAccumulator
+from tools import atomic_write_text
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_DIR = os.getenv("AGENTWRITE_OUTPUT_DIR", ".")
+# Seconds between fsyncs of the document being written; 0 syncs after every section
+FSYNC_INTERVAL = float(os.getenv("AGENTWRITE_FSYNC_INTERVAL", 5.0))
+
+SECTION_SEPARATOR = "\n\n"
+
+
+def output_name(name, run_id):
+    """File name stem that is unique per run."""
+    stem = re.sub(r"[^A-Za-z0-9._-]+", "-", name).strip("-.") or "document"
+    return f"{stem[:80]}-{run_id[:8]}"
+
+
+class DocumentWriter:
+    """
+    Write a document to disk section by section while it is generated.
+
+    Sections are appended to `<name>.md.part` as they are produced and fsynced at
+    most every `fsync_interval` seconds. `commit` renames the file to `<name>.md`
+    atomically and writes a `<name>.json` sidecar with the plan, timings and word
+    counts. Only the section being streamed is held in memory.
+
+    Progress is kept in `<name>.md.part.json`, so a writer re-opened for the same
+    run (e.g. a resumed generation) continues where the last one stopped and
+    skips sections it has already written. It is only updated right after an
+    fsync, so it never records more than reached the disk; sections written since
+    are simply written again on resume.
+
+    Args:
+        name (str): Human readable part of the file name, e.g. model and title.
+        run_id (str): The run's thread_id; makes the file name unique per run.
+        out_dir (str): Directory for the document and its sidecar.
+        fsync_interval (float): Seconds between fsyncs.
+        metadata (dict): Extra fields recorded in the sidecar.
+    """
+
+    def __init__(self, name, run_id, out_dir=None, fsync_interval=FSYNC_INTERVAL, metadata=None):
+        self.out_dir = out_dir or OUTPUT_DIR
+        os.makedirs(self.out_dir, exist_ok=True)
+        stem = output_name(name, run_id)
+        self.path = os.path.join(self.out_dir, f"{stem}.md")
+        self.sidecar_path = os.path.join(self.out_dir, f"{stem}.json")
+        self.part_path = f"{self.path}.part"
+        self.progress_path = f"{self.part_path}.json"
+        self.fsync_interval = fsync_interval
+        self.metadata = {"run_id": run_id, **(metadata or {})}
+        self.sections = []
+        self.started = time.time()
+        self._current = None
+        self._section_started = time.monotonic()
+        self._last_sync = time.monotonic()
+
+        size = 0
+        if os.path.exists(self.progress_path) and os.path.exists(self.part_path):
+            with open(self.progress_path, "r", encoding="utf-8") as file:
+                progress = json.load(file)
+            if os.path.getsize(self.part_path) >= progress["size"]:
+                self.sections = progress["sections"]
+                self.started = progress.get("started", self.started)
+                size = progress["size"]
+                logger.info(f"Resuming {self.part_path} after {len(self.sections)} sections")
+            else:
+                # Progress from before this change could get ahead of the data on a crash
+                logger.warning(f"{self.part_path} is shorter than its recorded progress, starting it over")
+        self._file = open(self.part_path, "ab")
+        # Drop anything written after the last recorded section
+        self._file.truncate(size)
+
+    @property
+    def word_count(self):
+        return sum(section["words"] for section in self.sections)
+
+    def _start_section(self):
+        if self._current is None:
+            if self.sections:
+                self._file.write(SECTION_SEPARATOR.encode("utf-8"))
+            self._current = StreamAccumulator()
+
+    def append(self, chunk):
+        """Append a streamed chunk to the current section."""
+        if not chunk:
+            return
+        self._start_section()
+        self._current.add(chunk)
+        self._file.write(chunk.encode("utf-8"))
+
+    def end_section(self):
+        """Close the current section and record it."""
+        if self._current is None:
+            return
+        now = time.monotonic()
+        self.sections.append({
+            "index": len(self.sections),
+            "words": self._current.words,
+            "chars": self._current.chars,
+            "seconds": round(now - self._section_started, 3),
+        })
+        self._current = None
+        self._section_started = now
+        self._save_progress()
+
+    def write_section(self, index, text, heading=None):
+        """
+        Write a complete section; sections already on disk are skipped.
+
+        A heading (e.g. the chapter the section opens) is written above the
+        section as `# heading` but not counted in its words.
+        """
+        if index < len(self.sections):
+            return
+        if heading:
+            self._start_section()
+            self._file.write(f"# {heading}{SECTION_SEPARATOR}".encode("utf-8"))
+        self.append(text)
+        self.end_section()
+
+    def _save_progress(self, force=False):
+        self._file.flush()
+        if not force and time.monotonic() - self._last_sync < self.fsync_interval:
+            return
+        # The data must be on disk before the progress that points past it
+        os.fsync(self._file.fileno())
+        self._last_sync = time.monotonic()
+        atomic_write_text(self.progress_path, json.dumps({
+            "sections": self.sections, "size": self._file.tell(), "started": self.started
+        }))
+
+    def commit(self, footer=None, plan=None, **metadata):
+        """Finish the document: fsync it, rename it into place and write the sidecar."""
+        self.end_section()
+        if footer:
+            self._file.write(f"{SECTION_SEPARATOR}{footer}".encode("utf-8"))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.part_path, self.path)
+
+        finished = time.time()
+        atomic_write_text(self.sidecar_path, json.dumps({
+            **self.metadata,
+            **metadata,
+            "path": self.path,
+            "plan": plan,
+            "started": self.started,
+            "finished": finished,
+            "duration": round(finished - self.started, 3),
+            "word_count": self.word_count,
+            "sections": self.sections,
+        }, indent=2, ensure_ascii=False))
+        if os.path.exists(self.progress_path):
+            os.remove(self.progress_path)
+        logger.info(f"Output written to {self.path}")
+        return self.path
+
+    def close(self):
+        """Stop writing without committing; the partial file is kept for a resume."""
+        if not self._file.closed:
+            if self._current is None:
+                self._save_progress(force=True)
+            self._file.flush()
+            self._file.close()
@@ -1,62 +1,43 @@
 import streamlit as st
 import time
-import base64
 import logging
+from logging_setup import setup_logging
 import os
 from PIL import Image
 from io import BytesIO
 from dotenv import load_dotenv
-from langchain.prompts import PromptTemplate
 from tools import write_markdown_file
-from openai import OpenAI
-from langchain_community.llms import Ollama
-from langchain_core.runnables import RunnableLambda
-from operator import itemgetter
-from ollama import Client
-import sys
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log'),
-        logging.StreamHandler()
-    ]
-)
+from stream_accumulator import count_words
+from model_catalog import get_catalog
+from image_preprocessing import image_cache, native_max_side
+from image_batch import MAX_IN_FLIGHT, batch_stories, images_per_minute, folder_images, story_for_image
+from chains.prompt_registry import prompt_registry
+
+# Configure logging: JSON lines to the rotating app.log, written on a background thread
+setup_logging()
 
 logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI client
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-ollama_client = Client(host="http://localhost:11434")
+# Provider clients are shared process-wide by the clients registry
 
 # Define available LLM options
 llm_options = ["Ollama"]
 
 # Function to fetch models from Ollama
 def get_available_models():
-    """Fetch and return a list of available models from Ollama."""
-    try:
-        client = Client(host="http://localhost:11434/")
-        models = client.list()
-        return [model['name'] for model in models['models']]
-    except Exception as e:
-        st.error(f"Error fetching models: {str(e)}")
+    """Return the vision-capable Ollama models from the TTL-cached model catalog."""
+    catalog = get_catalog()
+    models = catalog.names(vision_only=True)
+    if catalog.error is not None and not models:
+        st.error(f"Error fetching models: {str(catalog.error)}")
         return ["Ollama server not available"]
-
-# Function to fetch the list of models
-def fetch_models():
-    host_url = sys.argv[1] if len(sys.argv) > 1 else "http://localhost:11434/"
-    fetchmodelclient = Client(host=host_url)
-    model_list = fetchmodelclient.list()
-    return [model['model'] for model in model_list['models']]
-
-# Fetch models initially
-model_names = fetch_models()
+    if not models:
+        st.warning("No vision-capable Ollama models found. Try `ollama pull llava`.")
+        return ["No vision models available"]
+    return models
 
 def main():
 
@@ -74,9 +55,7 @@ def main():
         models = get_available_models()
         llm_model = st.sidebar.selectbox("Select LLM Model", models)
     if llm_provider == "Ollama":
-        if isinstance(llm_model, str):
-            llm = Ollama(model=llm_model)
-        else:
+        if not isinstance(llm_model, str):
             st.error("Invalid model selection for Ollama.")
             return
     else:
@@ -89,63 +68,45 @@ def main():
     with st.sidebar.expander("Advanced Options"):
         num_steps = st.sidebar.slider("Number of Steps", min_value=0, max_value=4, value=0, step=1)
 
+    mode = st.radio("Mode", ["Single image", "Batch"], horizontal=True)
+    if mode == "Batch":
+        run_batch(llm_provider, llm_model, num_words)
+        return
+
     # Image upload
     uploaded_image = st.file_uploader("Upload an image", type=["jpg", "jpeg", "png"])
 
-    # Initialize the selected LLM model
-    llm = Ollama(model=llm_model)
-    
-    # Function to bind and run LLM with an image and prompt
-    def bind_and_run_llm(image_base64, prompt_text):
-        """Bind and run the LLM with the given image and prompt text."""
-        bound = llm.bind(images=[image_base64])
-        return bound.invoke(prompt_text)
-
-    # Define the prompt template
-    prompt_template = f"""
-    You are the world's best fictional-genre book writer and storyteller;
-    You have multiple book awards;
-    You can generate a short story based on a simple narrative;
-    The story must not be longer than {num_words} words;
-    """
-
-    # Create the prompt
-    prompt = PromptTemplate.from_template(prompt_template)
-    
     # Initialize response variable
     response = ""
 
     if uploaded_image is not None:
-            # Convert the uploaded image to base64
-            image = uploaded_image.getvalue()
-            b64 = base64.b64encode(image).decode()
-            
-            st.image(image, caption="Uploaded Image", use_column_width=True)
+            # Only displayed here; the image is prepared for the model when Generate is pressed
+            st.image(uploaded_image.getvalue(), caption="Uploaded Image", use_column_width=True)
 
     # Add a "Generate" button
     if st.button("Generate Story"):
         start_time = time.time()
         if uploaded_image is not None:
 
-            # Generate the prompt text
-            prompt_text = prompt.format(num_words=num_words)
+            # Generate the prompt text from the precompiled template
+            prompt_text = prompt_registry.format("image_story", num_words=num_words)
 
             # Initialize progress bar
-            progress_text = "Writing story from image..."
-            progress_bar = st.progress(0, text=progress_text)
+            progress_bar = st.progress(0, text="Preparing image...")
 
             try:
-                # Simulate progress for demo purposes
-                for percent_complete in range(100):
-                    time.sleep(0.01)  # Simulate time-consuming task
-                    progress_bar.progress(percent_complete + 1, text=progress_text)
+                # Downscale to the model's native resolution, strip EXIF and recompress;
+                # cached by content hash, so the same upload is only processed once
+                image = image_cache.prepare(uploaded_image.getvalue(), native_max_side(get_catalog().get(llm_model) or llm_model))
+                st.caption(f"Sending a {image.width}x{image.height} image of {image.bytes / 1024:.0f} KB "
+                           f"(uploaded {image.original_bytes / 1024:.0f} KB)")
+                progress_bar.progress(20, text="Writing story from image...")
 
-                # Invoke the LLM with the selected model and inputs
-                response = bind_and_run_llm(b64, prompt_text)
+                # Invoke the LLM with the selected model and inputs, once per Generate
+                response = story_for_image(llm_provider, llm_model, image, prompt_text)
 
                 # Finalize progress
                 progress_bar.progress(100, text="Story generation complete!")
-                time.sleep(1)  # Allow the final progress update to be visible
                 progress_bar.empty()
 
                 # Calculate duration and word count after receiving response
@@ -153,7 +114,7 @@ def main():
                 duration = end_time - start_time
                 
                 # Count the number of words in the response
-                word_count = len(response.split())
+                word_count = count_words(response)
 
                 logger.info("Story generation completed successfully")
                 logger.debug(f"LLM Model: {llm_model}, Time taken: {duration:.2f} seconds, Word count: {word_count}")
@@ -167,9 +128,6 @@ def main():
                 duration = end_time - start_time
                 logger.error(f"Error during workflow execution: {e}")
                 st.error(f"Error during workflow execution: {e}")
-
-            # Invoke the LLM with the selected model and inputs
-            response = bind_and_run_llm(b64, prompt_text)
         else:
             st.warning("Please upload an image first")
 
@@ -180,6 +138,49 @@ def main():
         st.write(f"Time taken: {duration:.2f} seconds")
         st.write(f"Word count: {word_count}")
 
+def run_batch(llm_provider, llm_model, num_words):
+    """Batch mode: one story per image, from a multi-file upload or a local folder."""
+    source = st.radio("Images from", ["Upload", "Local folder"], horizontal=True)
+    if source == "Upload":
+        uploaded_images = st.file_uploader("Upload images", type=["jpg", "jpeg", "png"], accept_multiple_files=True)
+        images = [(file.name, file.getvalue) for file in uploaded_images or []]
+    else:
+        folder = st.text_input("Image folder")
+        images = []
+        if folder:
+            if os.path.isdir(folder):
+                images = folder_images(folder)
+            else:
+                st.error(f"Not a folder: {folder}")
+    out_dir = st.text_input("Output folder", value="generated_image_stories")
+    max_in_flight = st.sidebar.number_input("Concurrent Ollama requests", min_value=1, max_value=16,
+                                            value=MAX_IN_FLIGHT)
+
+    if not st.button(f"Generate {len(images)} Stories", disabled=not images):
+        return
+
+    start_time = time.time()
+    progress_bar = st.progress(0, text=f"Writing stories for {len(images)} images...")
+    status = st.empty()
+    records = []
+    for record in batch_stories(images, llm_provider, llm_model, num_words, out_dir, max_in_flight=max_in_flight):
+        records.append(record)
+        elapsed = time.time() - start_time
+        done = sum(r["status"] == "ok" for r in records)
+        progress_bar.progress(len(records) / len(images), text=f"{len(records)} of {len(images)} images")
+        status.write(f"{images_per_minute(done, elapsed):.1f} images per minute")
+
+    duration = time.time() - start_time
+    failures = [r for r in records if r["status"] != "ok"]
+    logger.info(f"Batch of {len(images)} images finished in {duration:.2f}s, {len(failures)} failed")
+    progress_bar.empty()
+    status.write(f"{len(records) - len(failures)} stories written to `{out_dir}` in {duration:.2f} seconds "
+                 f"({images_per_minute(len(records) - len(failures), duration):.1f} images per minute)")
+    if failures:
+        st.error(f"{len(failures)} images failed")
+    st.dataframe([{key: r.get(key) for key in ("image", "status", "word_count", "seconds", "path", "error")}
+                  for r in records])
+
 if __name__ == "__main__":
     main()
 
@@ -1,62 +1,38 @@
-import base64
-from io import BytesIO
-from IPython.display import HTML, display
-from PIL import Image
+import asyncio
 import streamlit as st
 import time
 import os
-import requests
-import numpy as np
 from dotenv import load_dotenv
-from ollama import Client
+from model_catalog import get_catalog
 import sys
 from LLMs.llm import get_models
-import openai
-import os
-import json
-from base64 import b64decode
-from openai import OpenAI
+from image_generation import generate_images
 import logging
-import httpx
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log'),
-        logging.StreamHandler()
-    ]
-)
+from logging_setup import setup_logging
 
-logger = logging.getLogger(__name__)
+# Configure logging: JSON lines to the rotating app.log, written on a background thread
+setup_logging()
 
-klient = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
 def get_available_models():
-    """Fetch and return a list of available models from Ollama."""
-    try:
-        host_url = "http://localhost:11434/"
-        client = Client(host=host_url)
-        models = client.list()
-        return [model['name'] for model in models['models']]
-    except httpx.ConnectTimeout:
+    """Return the available Ollama models from the TTL-cached model catalog."""
+    catalog = get_catalog()
+    models = catalog.names()
+    if catalog.error is not None and not models:
         st.warning("Unable to connect to Ollama server. Please ensure it's running.")
-        return "Ollama server not available"
-    except Exception as e:
-        st.error(f"An error occurred while fetching models: {str(e)}")
-        return "Error fetching models"
-
-available_models = get_available_models()
+        return ["Ollama server not available"]
+    return models
 
 # Define available LLM options
 llm_options = ["GROQ", "OpenAI", "Ollama"]
 
 
-def generate_image(prompt, llm_name, model_name, imagefilename):
+def generate_image(prompts, llm_name, model_name, imagefilename, n=1, response_format="b64_json"):
+    """Generate `n` images per prompt concurrently; returns (images, message)."""
     start_time = time.time()  # Start timing here
 
     try:
@@ -67,44 +43,27 @@ def generate_image(prompt, llm_name, model_name, imagefilename):
             if not api_key:
                 logger.error("OPENAI_API_KEY environment variable not set")
                 raise RuntimeError("OPENAI_API_KEY environment variable not set")
-            logger.info(f"Using OpenAI model {model_name}")
-            
-            # OpenAI API call
-            response = klient.images.generate(
-                model=model_name,
-                prompt=prompt,
-                size="1024x1024",
-                n=1,
-                response_format="url",
-            )
-
-            # print response
-            print(response)
-            # save the image
-            image_dir = "./generatedimages/"
-            generated_image_name = f"{imagefilename}.png"  # any name you like; the filetype should be .png
-            generated_image_filepath = os.path.join(image_dir, generated_image_name)
-            generated_image_url = response.data[0].url  # extract image URL from response
-            generated_image = requests.get(generated_image_url).content  # download the image
-
-            with open(generated_image_filepath, "wb") as image_file:
-                image_file.write(generated_image)  # write the image to the file
+            logger.info(f"Using OpenAI model {model_name} for {len(prompts)} prompts, {n} images each")
+
+            # All requests and downloads run concurrently, rate limited and retried by the scheduler
+            images = asyncio.run(generate_images(prompts, llm_name, model_name, imagefilename, n=n,
+                                                 response_format=response_format))
 
         elif llm_name == "Ollama":
             logger.error(f"Unsupported LLM: {llm_name}")
-            return None, "You can only use OpenAI for Story-To-Image Generation!"
+            return [], "You can only use OpenAI for Story-To-Image Generation!"
 
         else:
             logger.error(f"Unknown LLM selected: {llm_name}")
-            return None, "Unknown LLM selected"
+            return [], "Unknown LLM selected"
 
         duration = time.time() - start_time
-        return generated_image, f"Time taken: {duration:.2f} seconds"
+        return images, f"Time taken: {duration:.2f} seconds for {len(images)} images"
 
     except Exception as e:
         duration = time.time() - start_time
-        logger.error(f"Error during image generation: {e}")
-        return None, f"Image generation failed."
+        logger.exception(f"Error during image generation: {e}")
+        return [], f"Image generation failed: {e}"
 
     
 def main():
@@ -122,6 +81,11 @@ def main():
         else:
             st.warning("You can only use OpenAI for Story-To-Image Generation!")
 
+        num_images = st.number_input("Images per prompt", min_value=1, max_value=4, value=1)
+        split_prompts = st.checkbox("One image prompt per line of the story")
+        response_format = st.selectbox("Response format", ["b64_json", "url"],
+                                       help="b64_json returns the image in the response; url downloads it afterwards")
+
         model = llm_model
         #num_ctx = st.number_input("Enter the context size (num_ctx):", min_value=1024, max_value=8192, value=4096)
     
@@ -131,11 +95,18 @@ def main():
     # If the form is submitted, generate the image
     if submit_button:
         logger.info(f"Generate button pressed with provider: {llm_provider} and model: {llm_model}")
-        generated_image, duration = generate_image(prompt, llm_provider, llm_model, imagefilename)
-
-        st.subheader("Generated Image")
-        if generated_image:
-            st.image(generated_image, caption="Generated Image", use_column_width=True)
+        prompts = [line.strip() for line in prompt.splitlines() if line.strip()] if split_prompts else [prompt]
+        generated_images, duration = generate_image(prompts, llm_provider, llm_model, imagefilename,
+                                                    n=num_images, response_format=response_format)
+
+        st.subheader("Generated Images" if len(generated_images) > 1 else "Generated Image")
+        columns = st.columns(min(4, len(generated_images)) or 1)
+        for i, image in enumerate(generated_images):
+            with columns[i % len(columns)]:
+                st.image(image.thumbnail, caption=os.path.basename(image.path))
+                with open(image.path, "rb") as file:
+                    st.download_button("Download", file.read(), file_name=os.path.basename(image.path),
+                                       mime="image/png", key=image.path)
         st.write(duration)
 
         st.session_state.last_inputs = {
@@ -0,0 +1,254 @@
+import contextvars
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Until a model has enough first-token samples, a hedge is sent after this many seconds
+HEDGE_DELAY = float(os.getenv("AGENTWRITE_HEDGE_DELAY", 8.0))
+# Hedges are never sent sooner than this, however fast the model usually is
+MIN_HEDGE_DELAY = float(os.getenv("AGENTWRITE_MIN_HEDGE_DELAY", 0.5))
+HEDGE_PERCENTILE = float(os.getenv("AGENTWRITE_HEDGE_PERCENTILE", 0.95))
+# Primary plus this many fallbacks are tried per request
+MAX_FALLBACKS = int(os.getenv("AGENTWRITE_MAX_FALLBACKS", 2))
+# Explicit fallback order as "Provider:model,Provider:model"; empty means every available model
+FALLBACKS = os.getenv("AGENTWRITE_FALLBACKS", "")
+ROUTER_ENABLED = os.getenv("AGENTWRITE_ROUTER", "1") not in ("0", "false", "no")
+
+WINDOW = 100
+MIN_SAMPLES = 5
+
+
+class LaneStats:
+    """Rolling time-to-first-token and error rate of one (provider, model)."""
+
+    def __init__(self, window=WINDOW):
+        self.ttfts = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+
+    def percentile(self, q):
+        if len(self.ttfts) < MIN_SAMPLES:
+            return None
+        ordered = sorted(self.ttfts)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def error_rate(self):
+        return sum(1 for ok in self.outcomes if not ok) / len(self.outcomes) if self.outcomes else 0.0
+
+    def snapshot(self):
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {"requests": len(self.outcomes), "error_rate": round(self.error_rate(), 3),
+                "ttft_p50": round(p50, 3) if p50 is not None else None,
+                "ttft_p95": round(p95, 3) if p95 is not None else None}
+
+
+def available_models():
+    """(provider, model) pairs that can serve text: the configured API models plus the local Ollama chat models."""
+    from LLMs.llm import get_models
+    from model_catalog import get_catalog
+
+    models = []
+    for provider, key in (("GROQ", "GROQ_API_KEY"), ("OpenAI", "OPENAI_API_KEY")):
+        if os.getenv(key):
+            models += [(provider, name) for name in get_models(provider) if not name.startswith("dall-e")]
+    models += [("Ollama", name) for name in get_catalog().names(chat_only=True)]
+    return models
+
+
+def parse_fallbacks(text):
+    return [tuple(item.strip().split(":", 1)) for item in text.split(",") if ":" in item]
+
+
+class _Attempt:
+    def __init__(self, provider, model, hedge=False):
+        self.provider = provider
+        self.model = model
+        self.hedge = hedge
+        self.started = time.monotonic()
+        self.cancelled = threading.Event()
+
+
+class ModelRouter:
+    """
+    Latency-aware routing of streamed LLM requests across providers.
+
+    Each request starts on the requested (provider, model). If no first token has
+    arrived after that model's rolling p95 time-to-first-token, a hedged duplicate
+    is sent to the healthiest fallback; whichever streams first wins and the other
+    is cancelled. A request that fails before its first token fails over to the
+    next fallback. Fallbacks come from AGENTWRITE_FALLBACKS, or every available
+    model, ordered by error rate and p95 time-to-first-token, other providers first.
+    """
+
+    def __init__(self, hedge_delay=HEDGE_DELAY, min_hedge_delay=MIN_HEDGE_DELAY, percentile=HEDGE_PERCENTILE,
+                 max_fallbacks=MAX_FALLBACKS, fallbacks=None, window=WINDOW):
+        self.hedge_delay_default = hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.percentile = percentile
+        self.max_fallbacks = max_fallbacks
+        self.fallbacks = fallbacks if fallbacks is not None else parse_fallbacks(FALLBACKS)
+        self.window = window
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _lane(self, provider, model):
+        key = (provider, model)
+        if key not in self._stats:
+            self._stats[key] = LaneStats(self.window)
+        return self._stats[key]
+
+    def record(self, provider, model, ttft=None, error=None):
+        """Record a time-to-first-token sample and/or the outcome of a request."""
+        with self._lock:
+            lane = self._lane(provider, model)
+            if ttft is not None:
+                lane.ttfts.append(ttft)
+            if error is not None:
+                lane.outcomes.append(not error)
+
+    def hedge_delay(self, provider, model):
+        """Seconds to wait for a first token before sending a hedge."""
+        with self._lock:
+            p95 = self._lane(provider, model).percentile(self.percentile)
+        return self.hedge_delay_default if p95 is None else max(self.min_hedge_delay, p95)
+
+    def candidates(self, provider, model):
+        """The requested model followed by the fallbacks to try, best first."""
+        try:
+            pool = self.fallbacks or available_models()
+        except Exception as e:
+            logger.warning(f"Could not list fallback models: {e}")
+            pool = []
+        with self._lock:
+            def rank(item):
+                index, (p, m) = item
+                lane = self._lane(p, m)
+                p95 = lane.percentile(self.percentile)
+                return (lane.error_rate(), p == provider, self.hedge_delay_default if p95 is None else p95, index)
+
+            others = [(i, pair) for i, pair in enumerate(dict.fromkeys(pool)) if pair != (provider, model)]
+            ranked = [pair for _, pair in sorted(others, key=rank)]
+        return [(provider, model)] + ranked[:self.max_fallbacks]
+
+    def stats(self):
+        """Rolling stats per (provider, model), for the UI."""
+        with self._lock:
+            return {f"{provider}/{model}": lane.snapshot() for (provider, model), lane in self._stats.items()}
+
+    def stream(self, provider, model, open_stream, hedge=True, on_winner=None):
+        """
+        Yield the chunks of the first candidate to start streaming.
+
+        Args:
+            open_stream (callable): open_stream(provider, model) -> iterator of chunks.
+            hedge (bool): Send a hedged duplicate when the first token is late;
+                otherwise only fail over on errors.
+            on_winner (callable): Called as on_winner(provider, model) with the
+                candidate whose chunks are yielded, before the first of them.
+        """
+        candidates = self.candidates(provider, model)
+        events = queue.Queue()
+        attempts = []
+
+        def run(attempt):
+            iterator = None
+            try:
+                iterator = iter(open_stream(attempt.provider, attempt.model))
+                for chunk in iterator:
+                    if attempt.cancelled.is_set():
+                        break
+                    events.put((attempt, "chunk", chunk))
+                events.put((attempt, "end", None))
+            except Exception as e:
+                events.put((attempt, "error", e))
+            finally:
+                # Closing the stream drops the loser's connection
+                close = getattr(iterator, "close", None)
+                if close:
+                    close()
+
+        def start(hedge=False):
+            p, m = candidates[len(attempts)]
+            attempt = _Attempt(p, m, hedge)
+            attempts.append(attempt)
+            threading.Thread(target=contextvars.copy_context().run, args=(run, attempt),
+                             name=f"route-{p}-{m}", daemon=True).start()
+            return attempt
+
+        start()
+        deadline = time.monotonic() + self.hedge_delay(provider, model) if hedge else None
+        running = set(attempts)
+        winner = None
+        try:
+            while winner is None:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    attempt, kind, payload = events.get(timeout=timeout)
+                except queue.Empty:
+                    deadline = None
+                    if len(attempts) < len(candidates):
+                        hedged = start(hedge=True)
+                        running.add(hedged)
+                        logger.info(f"No first token from {provider}/{model} yet, hedging with "
+                                    f"{hedged.provider}/{hedged.model}")
+                        metrics.inc("agentwrite_router_hedges_total", help_text="Hedged requests sent",
+                                    provider=provider, model=model)
+                    continue
+                if kind == "error":
+                    running.discard(attempt)
+                    self.record(attempt.provider, attempt.model, error=True)
+                    logger.warning(f"{attempt.provider}/{attempt.model} failed: {payload}")
+                    if running:
+                        continue
+                    if len(attempts) == len(candidates):
+                        raise payload
+                    fallback = start()
+                    running.add(fallback)
+                    logger.info(f"Failing over to {fallback.provider}/{fallback.model}")
+                    metrics.inc("agentwrite_router_failovers_total", help_text="Requests failed over",
+                                provider=attempt.provider, model=attempt.model)
+                    continue
+                winner = attempt
+                self.record(winner.provider, winner.model, ttft=time.monotonic() - winner.started)
+                for other in running - {winner}:
+                    other.cancelled.set()
+                    # A cancelled request was at least this slow, which keeps its p95 honest
+                    self.record(other.provider, other.model, ttft=time.monotonic() - other.started)
+                if winner.hedge:
+                    metrics.inc("agentwrite_router_hedge_wins_total", help_text="Hedged requests that won",
+                                provider=winner.provider, model=winner.model)
+                if on_winner:
+                    on_winner(winner.provider, winner.model)
+                if kind == "end":
+                    self.record(winner.provider, winner.model, error=False)
+                    return
+                yield payload
+
+            while True:
+                attempt, kind, payload = events.get()
+                if attempt is not winner:
+                    continue
+                if kind == "end":
+                    self.record(winner.provider, winner.model, error=False)
+                    return
+                if kind == "error":
+                    # Tokens were already passed on, so a failure mid-stream cannot fail over
+                    self.record(winner.provider, winner.model, error=True)
+                    raise payload
+                yield payload
+        finally:
+            for attempt in attempts:
+                attempt.cancelled.set()
+
+
+@lru_cache(maxsize=None)
+def get_router():
+    """Process-wide router, shared so every run learns from the others' latencies."""
+    return ModelRouter()
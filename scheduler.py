@@ -0,0 +1,345 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import logging
+import queue
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from metrics import metrics, queued_call
+
+logger = logging.getLogger(__name__)
+
+# Requests per second, burst size and concurrent requests allowed per (provider, model)
+DEFAULT_LIMITS = {
+    "GROQ": {"rate": 0.5, "burst": 5, "concurrency": 4},
+    "OpenAI": {"rate": 5.0, "burst": 10, "concurrency": 8},
+    "Ollama": {"rate": 100.0, "burst": 100, "concurrency": 2},
+}
+FALLBACK_LIMITS = {"rate": 1.0, "burst": 5, "concurrency": 4}
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def status_code(exc):
+    """Return the HTTP status carried by a provider SDK exception, if any."""
+    for obj in (exc, getattr(exc, "response", None)):
+        code = getattr(obj, "status_code", None)
+        if isinstance(code, int):
+            return code
+    return None
+
+
+def retry_after(exc):
+    """Return the server's Retry-After delay in seconds, if it sent one."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(exc):
+    code = status_code(exc)
+    if code is not None:
+        return code in RETRYABLE_STATUS
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    # httpx, openai and groq connection errors share these names
+    return any(name in type(exc).__name__ for name in ("ConnectError", "ConnectionError", "Timeout"))
+
+
+class TokenBucket:
+    """Token-bucket rate limiter: `rate` requests per second with bursts of up to `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class _Lane:
+    """Limiter, concurrency cap and counters for one (provider, model)."""
+
+    def __init__(self, limits):
+        self.bucket = TokenBucket(limits["rate"], limits["burst"])
+        self.slots = asyncio.Semaphore(limits["concurrency"])
+        self.stats = {
+            "queued": 0,
+            "max_queued": 0,
+            "in_flight": 0,
+            "requests": 0,
+            "retries": 0,
+            "throttled": 0,
+            "errors": 0,
+            "limiter_wait": 0.0,
+            "backoff_wait": 0.0,
+        }
+
+
+class _CallerThread(concurrent.futures.Executor):
+    """
+    Executor that runs its work on the thread blocked in `run_until`.
+
+    Synchronous callers wait for the scheduler anyway, so their calls run on
+    their own thread instead of the event loop's default executor. A call made
+    from inside another scheduled call (e.g. a fallback stream opened while a
+    write chain runs) then never waits for a pool thread its caller is holding.
+    """
+
+    def __init__(self):
+        self._work = queue.SimpleQueue()
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = concurrent.futures.Future()
+        self._work.put((future, fn, args, kwargs))
+        return future
+
+    def run_until(self, done):
+        """Run submitted work until the `done` future completes, and return its result."""
+        done.add_done_callback(lambda _: self._work.put(None))
+        while True:
+            item = self._work.get()
+            if item is None:
+                return done.result()
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as exc:
+                future.set_exception(exc)
+
+
+class RequestScheduler:
+    """
+    Shared scheduler every LLM call goes through.
+
+    Calls are rate limited per (provider, model) with a token bucket, capped in
+    concurrency, and retried with jittered exponential backoff on 429/5xx and
+    connection errors, honouring Retry-After. The scheduler runs its own event loop
+    on a background thread, so synchronous code (graph nodes, Streamlit) can use
+    `call`, `call_all` and `stream`, while coroutines on any event loop await `acall`.
+
+    Metrics separate time spent waiting on our own limits (`limiter_wait`) from
+    time spent backing off after the provider pushed back (`backoff_wait`).
+    """
+
+    def __init__(self, limits=None, max_retries=5, base_delay=1.0, max_delay=60.0):
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lanes = {}
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def _lane(self, provider, model):
+        key = (provider, model)
+        if key not in self._lanes:
+            self._lanes[key] = _Lane(self.limits.get(provider, FALLBACK_LIMITS))
+        return self._lanes[key]
+
+    def _backoff(self, attempt, exc):
+        delay = retry_after(exc)
+        if delay is None:
+            # Full jitter keeps concurrent retries from hitting the provider in lockstep
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return min(delay, self.max_delay)
+
+    async def submit(self, provider, model, fn, args=(), kwargs=None, context=None, keep_slot=False,
+                     executor=None):
+        """
+        Run fn(*args, **kwargs) in a worker thread once the (provider, model) limits allow.
+
+        Runs on the scheduler's own loop; use `acall` from other event loops.
+
+        Args:
+            context (contextvars.Context): Context to run fn in; defaults to the caller's.
+            keep_slot (bool): On success, keep the lane's concurrency slot (and the call
+                counted in flight) until `_release` is called, e.g. for a stream.
+            executor (concurrent.futures.Executor): Where fn runs; defaults to the
+                loop's default executor.
+        """
+        loop = asyncio.get_running_loop()
+        context = context or contextvars.copy_context()
+        lane = self._lane(provider, model)
+        stats = lane.stats
+        stats["queued"] += 1
+        stats["max_queued"] = max(stats["max_queued"], stats["queued"])
+        enqueued = time.monotonic()
+        queued = True
+        kept = False
+        try:
+            await lane.slots.acquire()
+            try:
+                attempt = 0
+                while True:
+                    started = time.monotonic()
+                    await lane.bucket.acquire()
+                    stats["limiter_wait"] += time.monotonic() - (enqueued if queued else started)
+                    if queued:
+                        stats["queued"] -= 1
+                        queued = False
+                        queue_wait = time.monotonic() - enqueued
+                        context.run(metrics.span, "queue", getattr(fn, "__qualname__", "call"),
+                                    provider=provider, model=model, latency=queue_wait)
+                    stats["in_flight"] += 1
+                    stats["requests"] += 1
+                    try:
+                        result = await loop.run_in_executor(executor, lambda: context.copy().run(
+                            queued_call, queue_wait, fn, *args, **(kwargs or {})))
+                        kept = keep_slot
+                        return result
+                    except Exception as exc:
+                        if attempt >= self.max_retries or not is_retryable(exc):
+                            stats["errors"] += 1
+                            raise
+                        if status_code(exc) == 429:
+                            stats["throttled"] += 1
+                        delay = self._backoff(attempt, exc)
+                        logger.warning(f"{provider}/{model} call failed ({exc}), retry {attempt + 1} in {delay:.1f}s",
+                                       extra={"provider": provider, "model": model})
+                        stats["retries"] += 1
+                        stats["backoff_wait"] += delay
+                        attempt += 1
+                    finally:
+                        if not kept:
+                            stats["in_flight"] -= 1
+                    await asyncio.sleep(delay)
+            finally:
+                if not kept:
+                    lane.slots.release()
+        finally:
+            if queued:
+                stats["queued"] -= 1
+
+    def _release(self, provider, model):
+        """Give back a slot kept by `submit(keep_slot=True)`; safe to call from any thread."""
+        lane = self._lane(provider, model)
+
+        def release():
+            lane.stats["in_flight"] -= 1
+            lane.slots.release()
+
+        self._ensure_loop().call_soon_threadsafe(release)
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self._loop.run_forever, name="llm-scheduler", daemon=True)
+                thread.start()
+            return self._loop
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result()
+
+    def _run_here(self, provider, model, fn, args=(), kwargs=None, keep_slot=False):
+        """Submit fn and block until it is done, running it on this thread when the limits allow."""
+        executor = _CallerThread()
+        future = asyncio.run_coroutine_threadsafe(
+            self.submit(provider, model, fn, args, kwargs, context=contextvars.copy_context(),
+                        keep_slot=keep_slot, executor=executor),
+            self._ensure_loop()
+        )
+        return executor.run_until(future)
+
+    def call(self, provider, model, fn, /, *args, **kwargs):
+        """
+        Blocking variant of `submit` for synchronous callers; fn runs on the calling thread.
+
+        provider, model and fn are positional-only, so `model=` and the other
+        keyword arguments of the SDK call are passed through to fn.
+        """
+        return self._run_here(provider, model, fn, args, kwargs)
+
+    async def acall(self, provider, model, fn, /, *args, **kwargs):
+        """Awaitable variant of `call` for coroutines running on any event loop."""
+        context = contextvars.copy_context()
+        future = asyncio.run_coroutine_threadsafe(
+            self.submit(provider, model, fn, args, kwargs, context=context), self._ensure_loop()
+        )
+        return await asyncio.wrap_future(future)
+
+    def call_all(self, provider, model, calls, max_concurrency=None):
+        """
+        Run several (fn, args, kwargs) calls concurrently and return results in order.
+
+        `max_concurrency` caps this batch on top of the provider's own limit.
+        """
+        context = contextvars.copy_context()
+
+        async def run_all():
+            limit = asyncio.Semaphore(max_concurrency or max(1, len(calls)))
+
+            async def run_one(fn, args, kwargs):
+                async with limit:
+                    return await self.submit(provider, model, fn, args, kwargs, context=context)
+
+            return await asyncio.gather(*(run_one(*call) for call in calls))
+
+        return self._run(run_all())
+
+    def stream(self, provider, model, fn, /, *args, **kwargs):
+        """
+        Open a streaming response through the scheduler and yield its chunks.
+
+        The request and its first chunk are fetched on the calling thread under the
+        rate limit and retry policy, since that is where streaming APIs report 429s
+        and connection errors. The lane's concurrency slot is held until the stream
+        is exhausted or closed.
+        """
+        def open_stream():
+            iterator = iter(fn(*args, **kwargs))
+            for first in iterator:
+                return [first], iterator
+            return [], iterator
+
+        head, iterator = self._run_here(provider, model, open_stream, keep_slot=True)
+        try:
+            yield from head
+            yield from iterator
+        finally:
+            close = getattr(iterator, "close", None)
+            if close:
+                close()
+            self._release(provider, model)
+
+    def metrics(self):
+        """Snapshot of queue depth, waits and retries per (provider, model)."""
+        snapshot = {}
+        for (provider, model), lane in list(self._lanes.items()):
+            stats = dict(lane.stats)
+            requests = max(1, stats["requests"])
+            stats["avg_limiter_wait"] = stats["limiter_wait"] / requests
+            stats["avg_backoff_wait"] = stats["backoff_wait"] / requests
+            snapshot[f"{provider}/{model}"] = stats
+        return snapshot
+
+
+scheduler = RequestScheduler()
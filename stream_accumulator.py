@@ -0,0 +1,89 @@
+import io
+import time
+
+
+class StreamAccumulator:
+    """
+    Assemble a streamed response and keep live statistics about it.
+
+    Chunks are collected in a list (or an io.StringIO buffer) and joined once, so
+    assembling a response is O(n) instead of re-allocating the string per chunk.
+    Words are counted incrementally: a word split across two chunks is counted once.
+
+    Args:
+        use_buffer (bool): Collect chunks in an io.StringIO instead of a list.
+    """
+
+    def __init__(self, use_buffer=False):
+        self._buffer = io.StringIO() if use_buffer else None
+        self._parts = []
+        self._text = None
+        self._in_word = False
+        self.chunks = 0
+        self.words = 0
+        self.chars = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+        self.first_chunk_at = None
+        self.last_chunk_at = None
+
+    @classmethod
+    def from_text(cls, text):
+        """Accumulator holding a complete text, e.g. to count its words."""
+        accumulator = cls()
+        accumulator.add(text)
+        return accumulator
+
+    def add(self, chunk):
+        """Append one chunk and update the statistics."""
+        if not chunk:
+            return
+        now = time.monotonic()
+        if self.first_chunk_at is None:
+            self.first_chunk_at = now
+        self.last_chunk_at = now
+
+        words = len(chunk.split())
+        # The first word of this chunk continues the last word of the previous one
+        if words and self._in_word and not chunk[0].isspace():
+            words -= 1
+        self.words += words
+        self._in_word = not chunk[-1].isspace()
+
+        self.chunks += 1
+        self.chars += len(chunk)
+        self.bytes += len(chunk.encode('utf-8'))
+        if self._buffer is not None:
+            self._buffer.write(chunk)
+        else:
+            self._parts.append(chunk)
+        self._text = None
+
+    @property
+    def text(self):
+        """The assembled text so far."""
+        if self._buffer is not None:
+            return self._buffer.getvalue()
+        if self._text is None:
+            self._text = ''.join(self._parts)
+            self._parts = [self._text] if self._text else []
+        return self._text
+
+    def stats(self):
+        """Live statistics; each streamed chunk is counted as roughly one token."""
+        elapsed = (self.last_chunk_at or time.monotonic()) - self.started
+        streaming = (self.last_chunk_at - self.first_chunk_at) if self.first_chunk_at is not None else 0.0
+        return {
+            "chunks": self.chunks,
+            "words": self.words,
+            "chars": self.chars,
+            "bytes": self.bytes,
+            "elapsed": elapsed,
+            "time_to_first_token": (self.first_chunk_at - self.started) if self.first_chunk_at is not None else None,
+            "tokens_per_second": self.chunks / streaming if streaming > 0 else 0.0,
+        }
+
+
+def count_words(text):
+    """Count the words in a complete text."""
+    return StreamAccumulator.from_text(text).words
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# The app's modules live at the repository root, next to this folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def response_cache(tmp_path, monkeypatch):
+    """An empty response cache in tmp_path in place of the app's own."""
+    import llm_cache
+
+    cache = llm_cache.ResponseCache(path=str(tmp_path / "llm_cache.sqlite"))
+    monkeypatch.setattr(llm_cache, "response_cache", cache)
+    return cache
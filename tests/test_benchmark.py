@@ -0,0 +1,30 @@
+import json
+
+import pytest
+
+pytest.importorskip("langgraph")
+
+import benchmark
+
+SMALL = ["--steps", "3", "--concurrency", "1", "2", "--repeat", "1", "--no-memory", "--checkpointer", "memory"]
+
+
+@pytest.mark.parametrize("extra", [
+    [],
+    ["--planning-mode", "pipelined"],
+    ["--planning-mode", "hierarchical"],
+    ["--policy", "neighbours", "--workers", "2"],
+    ["--policy", "rolling"],
+])
+def test_every_scenario_finishes(tmp_path, extra):
+    output = tmp_path / "results.json"
+    assert benchmark.main(SMALL + extra + ["--output", str(output)]) == 0
+    results = json.loads(output.read_text())["results"]
+    assert results
+    assert all(result["runs"] and result["sections_per_second"] > 0 for result in results)
+
+
+def test_compare_against_own_baseline(tmp_path):
+    baseline = tmp_path / "baseline.json"
+    assert benchmark.main(SMALL + ["--output", str(baseline)]) == 0
+    assert benchmark.main(SMALL + ["--compare", str(baseline), "--tolerance", "100"]) == 0
@@ -0,0 +1,51 @@
+import uuid
+
+import pytest
+
+pytest.importorskip("langgraph")
+
+from fake_llm import FakeChatModel
+from generation import stream_workflow
+from graph import create_workflow
+from nodes.chapter_node import BOOK_PREVIEW_CHARS
+from output_writer import DocumentWriter
+from scheduler import scheduler
+
+PROVIDER = "Fake"
+MODEL = "fake-model"
+
+
+def write_book(tmp_path, monkeypatch, chapters, output_tokens=20):
+    monkeypatch.setitem(scheduler.limits, PROVIDER, {"rate": 1e6, "burst": 1e6, "concurrency": 64})
+    llm = FakeChatModel(model_name=MODEL, plan_steps=chapters, output_tokens=output_tokens)
+    inputs = {"initial_prompt": "Write a book.", "num_steps": 0, "llm_name": PROVIDER, "model_name": MODEL,
+              "planning_mode": "hierarchical"}
+    run_id = uuid.uuid4().hex
+    writer = DocumentWriter("book", run_id, out_dir=str(tmp_path))
+    state = stream_workflow(create_workflow(llm), inputs, config={"configurable": {"thread_id": run_id}, "recursion_limit": 100},
+                            on_section=writer.write_section)
+    path = writer.commit()
+    with open(path, encoding="utf-8") as file:
+        return state, file.read()
+
+
+def test_chapter_headings_are_in_the_document_file(tmp_path, monkeypatch):
+    state, book = write_book(tmp_path, monkeypatch, chapters=3)
+    headings = [line for line in book.split("\n") if line.startswith("# ")]
+    assert len(headings) == 3
+    # The preview shows the opening of the same document that is on disk
+    assert book.startswith(state["final_doc"])
+    assert state["word_count"] == 3 * 3 * 20
+
+
+def test_the_state_keeps_only_a_preview_of_a_long_book(tmp_path, monkeypatch):
+    state, book = write_book(tmp_path, monkeypatch, chapters=3, output_tokens=200)
+    assert len(book) > BOOK_PREVIEW_CHARS
+    assert len(state["final_doc"]) <= BOOK_PREVIEW_CHARS + 2
+    assert book.startswith(state["final_doc"].rstrip(" …"))
+
+
+def test_an_empty_outline_saves_an_empty_document(tmp_path, monkeypatch):
+    state, book = write_book(tmp_path, monkeypatch, chapters=0)
+    assert state["chapters"] == []
+    assert (state["final_doc"], state["word_count"]) == ("", 0)
@@ -0,0 +1,31 @@
+import json
+
+import pytest
+
+pytest.importorskip("langgraph")
+
+import cli
+import generation
+
+
+def fake_generate_document(instruction, num_steps, llm_name, model_name, storytitle, **kwargs):
+    # The graph nodes print banners like these while a document is generated
+    print("---PLANNING THE WRITING---")
+    print("Total word count: 2")
+    return {"final_doc": f"Two words about {storytitle}", "word_count": 2, "path": None}
+
+
+def test_results_on_stdout_are_pure_jsonl(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(cli, "setup_logging", lambda *args, **kwargs: None)
+    monkeypatch.setattr(generation, "generate_document", fake_generate_document)
+    jobs = tmp_path / "jobs.jsonl"
+    jobs.write_text("\n".join(json.dumps({"id": str(i), "instruction": "Write.", "provider": "GROQ",
+                                          "model": "m", "title": f"t{i}"}) for i in range(3)))
+
+    assert cli.main([str(jobs), "--workers", "3"]) == 0
+
+    captured = capsys.readouterr()
+    records = [json.loads(line) for line in captured.out.splitlines()]
+    assert sorted(record["id"] for record in records) == ["0", "1", "2"]
+    assert all(record["status"] == "ok" for record in records)
+    assert "---PLANNING THE WRITING---" in captured.err
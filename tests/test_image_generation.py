@@ -0,0 +1,69 @@
+import asyncio
+import base64
+import io
+from types import SimpleNamespace
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+Image = pytest.importorskip("PIL.Image")
+
+import image_generation
+
+
+def png_bytes(color="red"):
+    buffer = io.BytesIO()
+    Image.new("RGB", (512, 512), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class StubImages:
+    """Stands in for client.images of the OpenAI SDK."""
+
+    def __init__(self):
+        self.calls = []
+
+    def generate(self, model, prompt, size, n, response_format):
+        self.calls.append({"model": model, "prompt": prompt, "n": n, "response_format": response_format})
+        if response_format == "b64_json":
+            data = [SimpleNamespace(b64_json=base64.b64encode(png_bytes()).decode(), url=None,
+                                    revised_prompt=f"revised {prompt}") for _ in range(n)]
+        else:
+            data = [SimpleNamespace(b64_json=None, url=f"https://images.test/{prompt}/{i}.png",
+                                    revised_prompt=None) for i in range(n)]
+        return SimpleNamespace(data=data)
+
+
+@pytest.fixture
+def stub_client(monkeypatch):
+    client = SimpleNamespace(images=StubImages())
+    monkeypatch.setattr(image_generation, "get_openai_client", lambda: client)
+    return client
+
+
+def test_b64_images_are_saved_with_thumbnails(tmp_path, stub_client):
+    images = asyncio.run(image_generation.generate_images(["a castle", "a dragon"], "OpenAI", "dall-e-3", "story",
+                                                          n=2, image_dir=str(tmp_path)))
+
+    assert [image.prompt for image in images] == ["a castle", "a castle", "a dragon", "a dragon"]
+    assert sorted(path.name for path in tmp_path.iterdir()) == [f"story-{i}.png" for i in range(1, 5)]
+    # dall-e-3 only returns one image per request, so n=2 becomes two requests per prompt
+    assert len(stub_client.images.calls) == 4
+    assert all(call["model"] == "dall-e-3" and call["n"] == 1 for call in stub_client.images.calls)
+    assert images[0].revised_prompt == "revised a castle"
+    with Image.open(io.BytesIO(images[0].thumbnail)) as thumbnail:
+        assert max(thumbnail.size) <= image_generation.THUMBNAIL_SIZE
+
+
+def test_url_images_are_downloaded(tmp_path, stub_client, monkeypatch):
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, content=png_bytes("blue")))
+    monkeypatch.setattr(image_generation, "new_async_http_client", lambda: httpx.AsyncClient(transport=transport))
+
+    images = asyncio.run(image_generation.generate_images(["a castle"], "OpenAI", "dall-e-2", "story", n=2,
+                                                          response_format="url", image_dir=str(tmp_path)))
+
+    assert len(stub_client.images.calls) == 1
+    assert [image.path for image in images] == [str(tmp_path / "story-1.png"), str(tmp_path / "story-2.png")]
+    assert not list(tmp_path.glob("*.part"))
+    with Image.open(images[0].path) as image:
+        assert image.getpixel((0, 0)) == (0, 0, 255)
@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+
+from job_queue import JobQueue, QueueFullError
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+class BlockingRunner:
+    """Job runner that holds each job until it is released, streaming tokens meanwhile."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = []
+
+    def __call__(self, params, progress):
+        self.started.append(params["n"])
+        while not self.release.wait(0.01):
+            progress.on_token("writing_node", 0, "word ")
+        return {"n": params["n"]}
+
+
+@pytest.fixture
+def runner():
+    runner = BlockingRunner()
+    yield runner
+    runner.release.set()
+
+
+def status(queue, job_id):
+    return queue.get(job_id)["status"]
+
+
+def test_one_running_job_per_user(tmp_path, runner):
+    queue = JobQueue(runner, path=str(tmp_path / "jobs.sqlite"), workers=2, per_user_limit=1)
+    first = queue.submit("alice", {"n": 1})
+    second = queue.submit("alice", {"n": 2})
+    third = queue.submit("bob", {"n": 3})
+    wait_for(lambda: sorted(runner.started) == [1, 3])
+
+    time.sleep(0.1)
+    assert status(queue, second) == "queued"
+    assert queue.stats()["running_per_user"] == {"alice": 1, "bob": 1}
+
+    runner.release.set()
+    wait_for(lambda: all(status(queue, job) == "done" for job in (first, second, third)))
+    assert queue.get(second)["result"] == {"n": 2}
+
+
+def test_queue_full(tmp_path, runner):
+    queue = JobQueue(runner, path=str(tmp_path / "jobs.sqlite"), workers=1, max_queued_per_user=1)
+    queue.submit("alice", {"n": 1})
+    wait_for(lambda: runner.started == [1])
+    waiting = queue.submit("alice", {"n": 2})
+    assert queue.get(waiting)["position"] == 1
+
+    with pytest.raises(QueueFullError):
+        queue.submit("alice", {"n": 3})
+    # The limit is per user
+    queue.submit("bob", {"n": 4})
+
+
+def test_cancel_queued_and_running_jobs(tmp_path, runner):
+    queue = JobQueue(runner, path=str(tmp_path / "jobs.sqlite"), workers=1)
+    running = queue.submit("alice", {"n": 1})
+    waiting = queue.submit("bob", {"n": 2})
+    wait_for(lambda: runner.started == [1])
+
+    assert queue.cancel(waiting)
+    assert status(queue, waiting) == "cancelled"
+    assert queue.cancel(running)
+    wait_for(lambda: status(queue, running) == "cancelled")
+    assert queue.progress(running) is None
+
+    # Neither job runs again, and finished jobs cannot be cancelled
+    time.sleep(0.1)
+    assert runner.started == [1]
+    assert not queue.cancel(running)
+
+
+def test_running_jobs_are_requeued_on_restart(tmp_path, runner):
+    path = str(tmp_path / "jobs.sqlite")
+    stopped = JobQueue(runner, path=path, workers=1)
+    job_id = stopped.submit("alice", {"n": 1})
+    wait_for(lambda: runner.started == [1])
+
+    # A new process finds the job still marked running and picks it up again
+    restarted = JobQueue(lambda params, progress: {"resumed": params["n"]}, path=path, workers=1)
+    wait_for(lambda: status(restarted, job_id) == "done")
+    assert restarted.get(job_id)["result"] == {"resumed": 1}
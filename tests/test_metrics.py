@@ -0,0 +1,44 @@
+import uuid
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from chains import factory
+from fake_llm import FakeChatModel
+from metrics import get_callback_handler, metrics, run_context
+from router import ModelRouter
+from scheduler import scheduler
+
+PROVIDER = "Fake"
+MODEL = "fake-model"
+
+
+@pytest.fixture
+def routed_llm(monkeypatch):
+    backend = FakeChatModel(model_name=MODEL, output_tokens=20)
+    monkeypatch.setattr(factory, "get_llm", lambda provider, model_name: backend)
+    monkeypatch.setattr(factory, "get_router", lambda: ModelRouter(fallbacks=[(PROVIDER, MODEL)]))
+    monkeypatch.setitem(scheduler.limits, PROVIDER, {"rate": 1e6, "burst": 1e6, "concurrency": 64})
+    factory.get_routed_llm.cache_clear()
+    yield factory.get_routed_llm(PROVIDER, MODEL)
+    factory.get_routed_llm.cache_clear()
+
+
+@pytest.mark.parametrize("method", ["invoke", "stream"])
+def test_llm_span_carries_queue_wait_and_usage(routed_llm, method):
+    from llm_cache import bypass
+
+    run_id = uuid.uuid4().hex
+    def call(*args, **kwargs):
+        if method == "stream":
+            return list(routed_llm.stream(*args, **kwargs))
+        return routed_llm.invoke(*args, **kwargs)
+
+    with run_context(run_id), bypass():
+        scheduler.call(PROVIDER, MODEL, call, "Write about rivers.", config={"callbacks": [get_callback_handler()]})
+
+    [span] = [span for span in metrics.run_spans(run_id) if span["kind"] == "llm"]
+    [queued] = [span for span in metrics.run_spans(run_id) if span["kind"] == "queue"]
+    assert span["queue_wait"] == queued["latency"]
+    assert (span["prompt_tokens"], span["completion_tokens"]) == (3, 20)
@@ -0,0 +1,68 @@
+import json
+import threading
+import time
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+import model_catalog
+from model_catalog import ModelCatalog, is_chat_model
+
+TAGS = {"models": [{"name": "llava:7b", "digest": "a", "details": {"family": "llama", "families": ["llama", "clip"]}},
+                   {"name": "llama3.1", "digest": "b", "details": {"family": "llama"}},
+                   {"name": "nomic-embed-text", "digest": "c", "details": {"family": "nomic-bert"}}]}
+SHOW = {"llava:7b": {"capabilities": ["completion", "vision"]}, "llama3.1": {"capabilities": ["completion"]},
+        "nomic-embed-text": {"capabilities": ["embedding"]}}
+NAMES = ["llava:7b", "llama3.1", "nomic-embed-text"]
+
+
+def serve(monkeypatch, tags, delay=0.0):
+    """Point the catalog's HTTP client at a fake Ollama server; returns the list of requested paths."""
+    requests = []
+
+    def handler(request):
+        requests.append(request.url.path)
+        time.sleep(delay)
+        if request.url.path == "/api/tags":
+            return httpx.Response(200, content=tags if isinstance(tags, bytes) else json.dumps(tags).encode())
+        return httpx.Response(200, json=SHOW[json.loads(request.content)["model"]])
+
+    client = httpx.Client(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(model_catalog, "get_http_client", lambda: client)
+    return requests
+
+
+def test_models_and_capabilities(monkeypatch):
+    serve(monkeypatch, TAGS)
+    catalog = ModelCatalog("http://ollama.test")
+    assert catalog.names() == NAMES
+    assert catalog.names(vision_only=True) == ["llava:7b"]
+    assert catalog.names(chat_only=True) == ["llava:7b", "llama3.1"]
+
+
+def test_embedding_models_are_recognised_without_capabilities():
+    assert not is_chat_model("nomic-embed-text", {"details": {"family": "nomic-bert"}})
+    assert not is_chat_model("mxbai-embed-large", {"details": {"family": "bert"}})
+    assert is_chat_model("llama3.1", {"details": {"family": "llama"}})
+
+
+@pytest.mark.parametrize("reply", [b"<html>Bad gateway</html>", b"[1, 2]", b'{"models": [42]}'])
+def test_malformed_reply_is_an_empty_catalog(monkeypatch, reply):
+    serve(monkeypatch, reply)
+    catalog = ModelCatalog("http://ollama.test")
+    assert catalog.models() == []
+    assert catalog.error is not None
+
+
+def test_first_fetch_happens_once(monkeypatch):
+    requests = serve(monkeypatch, TAGS, delay=0.05)
+    catalog = ModelCatalog("http://ollama.test")
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(catalog.names())) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [NAMES] * 4
+    assert requests.count("/api/tags") == 1
@@ -0,0 +1,33 @@
+import json
+
+from output_writer import DocumentWriter
+
+
+def test_progress_waits_for_fsync(tmp_path):
+    writer = DocumentWriter("doc", "run-1", out_dir=str(tmp_path), fsync_interval=3600)
+    writer.write_section(0, "First section.")
+    # Not synced yet, so nothing may claim the section is on disk
+    assert not (tmp_path / "doc-run-1.md.part.json").exists()
+    writer.close()
+
+    progress = json.loads((tmp_path / "doc-run-1.md.part.json").read_text())
+    assert progress["size"] == len("First section.")
+
+
+def test_resume_never_pads_with_nul_bytes(tmp_path):
+    writer = DocumentWriter("doc", "run-1", out_dir=str(tmp_path), fsync_interval=0)
+    writer.write_section(0, "First section.")
+    writer.write_section(1, "Second section.")
+    writer.close()
+    # As after an OS crash that lost the tail of the data but not the progress file
+    part = tmp_path / "doc-run-1.md.part"
+    part.write_bytes(part.read_bytes()[:5])
+
+    writer = DocumentWriter("doc", "run-1", out_dir=str(tmp_path), fsync_interval=0)
+    for index, text in enumerate(["First section.", "Second section."]):
+        writer.write_section(index, text)
+    path = writer.commit()
+
+    text = open(path, encoding="utf-8").read()
+    assert "\0" not in text
+    assert text == "First section.\n\nSecond section."
@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from chains.prompt_registry import PromptRegistry, PromptValidationError, template_variables
+
+VARIABLES = {"greet": {"person", "place"}}
+
+
+def write_prompt(directory, text, mtime_ns):
+    path = directory / "greet.txt"
+    path.write_text(text, encoding="utf-8")
+    # Set the mtime explicitly, since a rewrite within the same clock tick keeps it
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_template_variables_skip_escaped_braces():
+    assert template_variables("Hi {person}, {{not_a_variable}} in {place.city}") == {"person", "place"}
+
+
+def test_reloads_when_the_file_changes(tmp_path):
+    write_prompt(tmp_path, "Hello {person} from {place}.", 1_000_000_000)
+    registry = PromptRegistry(str(tmp_path), VARIABLES, check_interval=0)
+    version = registry.version("greet")
+    assert registry.format("greet", person="Ada", place="London") == "Hello Ada from London."
+
+    write_prompt(tmp_path, "Good morning {person} from {place}.", 2_000_000_000)
+    assert registry.format("greet", person="Ada", place="London") == "Good morning Ada from London."
+    assert registry.version("greet") != version
+    messages = registry.runnable("greet").invoke({"person": "Ada", "place": "London"}).to_messages()
+    assert messages[0].content == "Good morning Ada from London."
+
+
+def test_unchanged_mtime_is_not_reloaded(tmp_path):
+    write_prompt(tmp_path, "Hello {person} from {place}.", 1_000_000_000)
+    registry = PromptRegistry(str(tmp_path), VARIABLES, check_interval=0)
+    write_prompt(tmp_path, "Bye {person} from {place}.", 1_000_000_000)
+    assert registry.text("greet") == "Hello {person} from {place}."
+
+
+def test_a_template_with_missing_variables_is_rejected(tmp_path):
+    write_prompt(tmp_path, "Hello {person}.", 1_000_000_000)
+    with pytest.raises(PromptValidationError, match="missing variables: place"):
+        PromptRegistry(str(tmp_path), VARIABLES, check_interval=0)
+
+
+def test_an_invalid_reload_keeps_the_previous_version(tmp_path):
+    write_prompt(tmp_path, "Hello {person} from {place}.", 1_000_000_000)
+    registry = PromptRegistry(str(tmp_path), VARIABLES, check_interval=0)
+    version = registry.version("greet")
+
+    write_prompt(tmp_path, "Hello {person} from {planet}.", 2_000_000_000)
+    assert registry.version("greet") == version
+    assert registry.text("greet") == "Hello {person} from {place}."
+
+    # Once the file is fixed, the next check picks it up
+    write_prompt(tmp_path, "Hi {person} from {place}.", 3_000_000_000)
+    assert registry.text("greet") == "Hi {person} from {place}."
@@ -0,0 +1,100 @@
+import uuid
+
+import pytest
+
+pytest.importorskip("langgraph")
+
+from chains.wwrite_chain import build_write_chain
+from fake_llm import FakeChatModel
+from generation import stream_workflow
+from graph import create_workflow
+from llm_cache import get_langchain_cache
+from nodes.writing_node import redraft_sections
+from scheduler import scheduler
+
+PROVIDER = "Fake"
+MODEL = "fake-model"
+CALLS = []
+
+
+class CountingChatModel(FakeChatModel):
+    """Fake backend that counts the requests it has to answer."""
+
+    def _tokens(self, messages):
+        CALLS.append(messages)
+        return super()._tokens(messages)
+
+
+@pytest.fixture
+def finished_run(monkeypatch, response_cache):
+    """A three-section document drafted with the 'full' policy, so every section depends on the earlier ones."""
+    CALLS.clear()
+    monkeypatch.setitem(scheduler.limits, PROVIDER, {"rate": 1e6, "burst": 1e6, "concurrency": 64})
+    llm = CountingChatModel(model_name=MODEL, plan_steps=3, output_tokens=20, cache=get_langchain_cache())
+    inputs = {"initial_prompt": "Write a short report.", "num_steps": 0, "llm_name": PROVIDER, "model_name": MODEL,
+              "context_policy": "full"}
+    state = stream_workflow(create_workflow(llm), inputs, config={"configurable": {"thread_id": uuid.uuid4().hex}})
+    CALLS.clear()
+    return llm, state
+
+
+def test_dependents_of_an_unchanged_section_are_skipped(finished_run):
+    llm, state = finished_run
+    update = redraft_sections(state, build_write_chain(llm), [0], cascade=True)
+
+    # The fake model redrafts section 1 word for word, so sections 2 and 3 keep their context
+    assert len(CALLS) == 1
+    assert update["regenerated"] == [0]
+    assert update["write_steps"] == state["write_steps"]
+
+
+def test_redrafted_dependents_are_served_from_cache(finished_run, response_cache):
+    llm, state = finished_run
+    revised = {**state, **redraft_sections(state, build_write_chain(llm), [0], feedback="Shorter, please.")}
+    assert revised["regenerated"] == [0, 1, 2]
+    assert len(CALLS) == 3
+
+    # Without the note section 1 is back to its first draft, so its dependents' prompts are too
+    CALLS.clear()
+    hits = response_cache.stats()["hits"]
+    tokens = []
+    update = redraft_sections(revised, build_write_chain(llm), [0],
+                              on_token=lambda node, step, token: tokens.append(step))
+    assert update["regenerated"] == [0, 1, 2]
+    assert update["write_steps"] == state["write_steps"]
+    assert len(CALLS) == 1
+    assert response_cache.stats()["hits"] == hits + 2
+    assert set(tokens) == {0, 1, 2}
+
+
+def test_document_writer_is_closed_when_writing_fails(monkeypatch, response_cache, tmp_path):
+    from langgraph.checkpoint.memory import MemorySaver
+
+    import generation
+    import output_writer
+
+    monkeypatch.setitem(scheduler.limits, PROVIDER, {"rate": 1e6, "burst": 1e6, "concurrency": 64})
+    llm = CountingChatModel(model_name=MODEL, plan_steps=3, output_tokens=20, cache=get_langchain_cache())
+    checkpointer = MemorySaver()
+    app = create_workflow(llm, checkpointer=checkpointer)
+    thread_id = uuid.uuid4().hex
+    inputs = {"initial_prompt": "Write a short report.", "num_steps": 0, "llm_name": PROVIDER, "model_name": MODEL}
+    stream_workflow(app, inputs, config={"configurable": {"thread_id": thread_id}})
+
+    monkeypatch.setattr(generation, "get_checkpointer", lambda: checkpointer)
+    monkeypatch.setattr(generation, "get_workflow", lambda provider, model_name: app)
+    monkeypatch.setattr("chains.factory.get_chat_model", lambda provider, model_name: llm)
+    writers = []
+
+    class FailingWriter(output_writer.DocumentWriter):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, out_dir=str(tmp_path), **kwargs)
+            writers.append(self)
+
+        def commit(self, *args, **kwargs):
+            raise OSError("disk full")
+
+    monkeypatch.setattr(generation, "DocumentWriter", FailingWriter)
+    with pytest.raises(OSError, match="disk full"):
+        generation.regenerate_sections(thread_id, [0], "Report")
+    assert writers and writers[0]._file.closed
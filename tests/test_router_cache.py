@@ -0,0 +1,104 @@
+import uuid
+
+import pytest
+
+pytest.importorskip("langgraph")
+
+from chains import factory
+from fake_llm import FakeChatModel
+from generation import stream_workflow
+from graph import create_workflow
+from router import ModelRouter
+from scheduler import scheduler
+
+PROVIDER = "Fake"
+MODEL = "fake-model"
+CALLS = []
+
+
+class CountingChatModel(FakeChatModel):
+    """Fake backend that counts the requests it has to answer."""
+
+    def _tokens(self, messages):
+        CALLS.append(messages)
+        return super()._tokens(messages)
+
+
+@pytest.fixture
+def routed_llm(monkeypatch, response_cache):
+    CALLS.clear()
+    backend = CountingChatModel(model_name=MODEL, plan_steps=3, output_tokens=20)
+    monkeypatch.setattr(factory, "get_llm", lambda provider, model_name: backend)
+    # Only the requested model, so nothing goes looking for real fallbacks
+    monkeypatch.setattr(factory, "get_router", lambda: ModelRouter(fallbacks=[(PROVIDER, MODEL)]))
+    monkeypatch.setitem(scheduler.limits, PROVIDER, {"rate": 1e6, "burst": 1e6, "concurrency": 64})
+    factory.get_routed_llm.cache_clear()
+    yield factory.get_routed_llm(PROVIDER, MODEL)
+    factory.get_routed_llm.cache_clear()
+
+
+def run(llm):
+    inputs = {"initial_prompt": "Write a short report.", "num_steps": 0, "llm_name": PROVIDER, "model_name": MODEL}
+    return stream_workflow(create_workflow(llm), inputs, config={"configurable": {"thread_id": uuid.uuid4().hex}})
+
+
+def test_repeat_run_is_served_from_cache(routed_llm, response_cache):
+    first = run(routed_llm)
+    calls = len(CALLS)
+    assert calls == 4  # the plan and three sections
+
+    second = run(routed_llm)
+    assert len(CALLS) == calls
+    assert second["final_doc"] == first["final_doc"]
+    assert response_cache.stats()["hits"] == calls
+
+
+def test_routed_and_direct_calls_share_entries(routed_llm, response_cache):
+    run(routed_llm)
+    direct = CountingChatModel(model_name=MODEL, plan_steps=3, output_tokens=20,
+                               cache=routed_llm.answer_cache)
+    calls = len(CALLS)
+    run(direct)
+    assert len(CALLS) == calls
+
+
+def test_bypass_skips_the_cache(routed_llm):
+    from llm_cache import bypass
+
+    run(routed_llm)
+    calls = len(CALLS)
+    with bypass():
+        run(routed_llm)
+    assert len(CALLS) == 2 * calls
+
+
+class FailingChatModel(CountingChatModel):
+    """Backend that is down."""
+
+    def _tokens(self, messages):
+        raise ValueError("model unavailable")
+
+
+def test_failover_answer_is_cached_under_the_model_that_gave_it(monkeypatch, response_cache):
+    from langchain_core.messages import HumanMessage
+    from llm_cache import get_langchain_cache
+
+    CALLS.clear()
+    fallback = CountingChatModel(model_name="fallback-model", output_tokens=20, cache=get_langchain_cache())
+    backends = {MODEL: FailingChatModel(model_name=MODEL), "fallback-model": fallback}
+    monkeypatch.setattr(factory, "get_llm", lambda provider, model_name: backends[model_name])
+    monkeypatch.setattr(factory, "get_router", lambda: ModelRouter(fallbacks=[(PROVIDER, "fallback-model")]))
+    monkeypatch.setitem(scheduler.limits, PROVIDER, {"rate": 1e6, "burst": 1e6, "concurrency": 64})
+    factory.get_routed_llm.cache_clear()
+    routed = factory.get_routed_llm(PROVIDER, MODEL)
+    messages = [HumanMessage(content="Write about rivers.")]
+
+    answer = routed.invoke(messages).content
+    assert len(CALLS) == 1
+    # Asking the requested model again is not answered with the fallback's text from the cache
+    assert routed.invoke(messages).content == answer
+    assert len(CALLS) == 2
+    # Asking the fallback itself is
+    assert fallback.invoke(messages).content == answer
+    assert len(CALLS) == 2
+    factory.get_routed_llm.cache_clear()
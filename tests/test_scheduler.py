@@ -0,0 +1,84 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+from scheduler import RequestScheduler
+
+
+def chat(model, messages, stream=False):
+    """Stands in for an SDK call, which takes the model as a keyword argument."""
+    reply = f"{model}: {messages[-1]['content']}"
+    return iter(reply.split()) if stream else reply
+
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def test_call_forwards_model_kwarg():
+    scheduler = RequestScheduler()
+    assert scheduler.call("OpenAI", "lane-model", chat, model="sdk-model", messages=MESSAGES) == "sdk-model: hello"
+
+
+def test_acall_forwards_model_kwarg():
+    scheduler = RequestScheduler()
+    result = asyncio.run(scheduler.acall("OpenAI", "lane-model", chat, model="sdk-model", messages=MESSAGES))
+    assert result == "sdk-model: hello"
+
+
+def test_stream_forwards_model_kwarg():
+    scheduler = RequestScheduler()
+    chunks = list(scheduler.stream("Ollama", "lane-model", chat, model="sdk-model", messages=MESSAGES, stream=True))
+    assert chunks == ["sdk-model:", "hello"]
+
+
+def test_calls_are_counted_on_the_lane_not_the_kwarg():
+    scheduler = RequestScheduler()
+    scheduler.call("OpenAI", "lane-model", chat, model="sdk-model", messages=MESSAGES)
+    assert scheduler.metrics()["OpenAI/lane-model"]["requests"] == 1
+
+
+def test_stream_holds_its_slot_until_closed():
+    scheduler = RequestScheduler(limits={"Ollama": {"rate": 1e6, "burst": 1e6, "concurrency": 1}})
+    first = scheduler.stream("Ollama", "lane-model", chat, model="a", messages=MESSAGES, stream=True)
+    assert next(first) == "a:"
+    time.sleep(0.05)
+    assert scheduler.metrics()["Ollama/lane-model"]["in_flight"] == 1
+
+    second_started = threading.Event()
+
+    def run_second():
+        list(scheduler.stream("Ollama", "lane-model", chat, model="b", messages=MESSAGES, stream=True))
+        second_started.set()
+
+    threading.Thread(target=run_second, daemon=True).start()
+    # The lane allows one request at a time, and the first stream is still open
+    assert not second_started.wait(0.2)
+    first.close()
+    assert second_started.wait(2)
+    time.sleep(0.05)
+    assert scheduler.metrics()["Ollama/lane-model"]["in_flight"] == 0
+
+
+def test_nested_calls_do_not_wait_for_the_callers_pool():
+    # Like a fallback stream opened while a write chain runs: every outer call holds a
+    # thread of the loop's small default executor while it waits for an inner call
+    scheduler = RequestScheduler(limits={"Ollama": {"rate": 1e6, "burst": 1e6, "concurrency": 8}})
+    scheduler._ensure_loop().set_default_executor(concurrent.futures.ThreadPoolExecutor(max_workers=2))
+
+    def outer(n):
+        words = list(scheduler.stream("Ollama", "fallback", chat, model=f"s{n}", messages=MESSAGES, stream=True))
+        return words + [scheduler.call("Ollama", "other", chat, model=f"c{n}", messages=MESSAGES)]
+
+    results = []
+    worker = threading.Thread(target=lambda: results.append(scheduler.call_all(
+        "Ollama", "primary", [(outer, (n,), {}) for n in range(4)])), daemon=True)
+    worker.start()
+    worker.join(5)
+    deadlocked = worker.is_alive()
+    if deadlocked:
+        # Cancel the stuck calls, so the executor's threads can exit with the test run
+        loop = scheduler._ensure_loop()
+        loop.call_soon_threadsafe(lambda: [task.cancel() for task in asyncio.all_tasks(loop)])
+    assert not deadlocked, "nested scheduler calls deadlocked"
+    assert results[0][3] == ["s3:", "hello", "c3: hello"]
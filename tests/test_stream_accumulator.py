@@ -0,0 +1,29 @@
+import pytest
+
+from stream_accumulator import StreamAccumulator, count_words
+
+
+@pytest.mark.parametrize("chunks, words", [
+    (["Hel", "lo wor", "ld"], 2),
+    (["Hello ", "world"], 2),
+    (["Hello", " world"], 2),
+    (["Hello", " ", "world", "\n"], 2),
+    (["  ", "one", "", " two three", "  four"], 4),
+])
+def test_a_word_split_across_chunks_is_counted_once(chunks, words):
+    accumulator = StreamAccumulator()
+    for chunk in chunks:
+        accumulator.add(chunk)
+    assert accumulator.words == words
+    assert accumulator.words == count_words(accumulator.text)
+
+
+@pytest.mark.parametrize("use_buffer", [False, True])
+def test_text_and_stats(use_buffer):
+    accumulator = StreamAccumulator(use_buffer=use_buffer)
+    for chunk in ["Über", "grö", "ße ", "text"]:
+        accumulator.add(chunk)
+    assert accumulator.text == "Übergröße text"
+    stats = accumulator.stats()
+    assert (stats["chunks"], stats["words"], stats["chars"]) == (4, 2, 14)
+    assert stats["bytes"] == len("Übergröße text".encode("utf-8"))
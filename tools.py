@@ -1,3 +1,28 @@
+import os
+import tempfile
+
+
+def atomic_write_text(path, content):
+  """Writes text to path through a temporary file, so readers never see a partial file.
+
+  Args:
+    path: The destination path.
+    content: The string content to write.
+  """
+  directory = os.path.dirname(os.path.abspath(path))
+  fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+  try:
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+      f.write(content)
+      f.flush()
+      os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+  except BaseException:
+    if os.path.exists(tmp_path):
+      os.remove(tmp_path)
+    raise
+
+
 def write_markdown_file(content, filename):
   """Writes the given content as a markdown file to the local directory.
 
@@ -5,5 +30,4 @@ def write_markdown_file(content, filename):
     content: The string content to write to the file.
     filename: The filename to save the file as.
   """
-  with open(f"{filename}.md", "w") as f:
-    f.write(content)
\ No newline at end of file
+  atomic_write_text(f"{filename}.md", content)